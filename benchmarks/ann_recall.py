@@ -0,0 +1,169 @@
+"""
+Recall@k vs latency of the FAISS index backends against the flat (exact) baseline.
+
+    python -m benchmarks.ann_recall --n 100000 --specs flat,hnsw,ivf_flat,ivf_pq
+    python -m benchmarks.ann_recall --index document_ai/faiss/document_embeddings.index
+    python -m benchmarks.ann_recall --specs flat,sq_fp16,pq,ivf_pq --rerank-factor 0,4,10
+
+Vectors come from an existing flat index (--index) or are synthetic, clustered and
+unit-normalized like sentence embeddings. Compressed specs are also run with exact
+re-ranking of k * factor candidates from the full-precision vectors (kept in a temporary
+file, as in production) for each --rerank-factor > 0. bytes_per_vector is the index size;
+re-ranking adds 4 * dim bytes per vector on disk (rerank_disk_bytes_per_vector). Results
+are printed as a table and written as JSON with --out.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from document_ai.faiss_encode.index_factory import (
+    create_index,
+    apply_search_params,
+    resolve_index_spec,
+    reconstruct_all,
+    is_compressed,
+)
+from document_ai.faiss_encode.rerank import MappedVectors, RerankedIndex, write_vector_file
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def time_single_queries(index: faiss.Index, queries: np.ndarray, k: int):
+    """Search one query at a time, as the API does. Returns (ids, per-query latencies in ms)."""
+    ids, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, found = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(found[0])
+    return np.array(ids), np.array(latencies)
+
+
+def benchmark(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    specs: List[str],
+    k: int,
+    nprobes: List[int],
+    ef_searches: List[int],
+    rerank_factors: List[int] = (0,),
+) -> List[Dict]:
+    dim = vectors.shape[1]
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+
+    tmp_dir = tempfile.mkdtemp()
+    vectors_file = os.path.join(tmp_dir, "vectors.f32")
+    write_vector_file(vectors_file, vectors)
+    full_vectors = MappedVectors(vectors_file, dim)
+
+    results = []
+    for spec in specs:
+        factory = resolve_index_spec(spec, len(vectors), dim)
+        start = time.perf_counter()
+        index = create_index(vectors, dim, spec)
+        index.add(vectors)
+        build_s = time.perf_counter() - start
+        size_bytes = len(faiss.serialize_index(index))
+
+        if factory.startswith("IVF"):
+            settings = [{"nprobe": p} for p in nprobes]
+        elif factory.startswith("HNSW"):
+            settings = [{"efSearch": e} for e in ef_searches]
+        else:
+            settings = [{}]
+
+        factors = sorted(set(rerank_factors) | {0}) if is_compressed(index) else [0]
+        for params in settings:
+            apply_search_params(index, params.get("nprobe"), params.get("efSearch"))
+            for factor in factors:
+                searcher = RerankedIndex(index, full_vectors, factor) if factor else index
+                found, latencies = time_single_queries(searcher, queries, k)
+                results.append({
+                    "spec": spec,
+                    "factory": factory,
+                    "params": params,
+                    "rerank_factor": factor,
+                    "recall_at_k": round(recall_at_k(found, truth), 4),
+                    "k": k,
+                    "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+                    "latency_ms_p99": round(float(np.percentile(latencies, 99)), 4),
+                    "build_s": round(build_s, 3),
+                    "bytes_per_vector": round(size_bytes / len(vectors), 1),
+                    "rerank_disk_bytes_per_vector": 4 * dim if factor else 0,
+                })
+
+    os.remove(vectors_file)
+    os.rmdir(tmp_dir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="existing flat index to take vectors from")
+    parser.add_argument("--n", type=int, default=100_000, help="synthetic vectors (ignored with --index)")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--specs", default="flat,hnsw,ivf_flat,ivf_pq")
+    parser.add_argument("--nprobe", default="1,4,16,64")
+    parser.add_argument("--ef-search", default="16,64,256")
+    parser.add_argument("--rerank-factor", default="0,4", help="re-rank shortlist sizes (x k) for compressed specs")
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args()
+
+    if args.index:
+        vectors = reconstruct_all(faiss.read_index(args.index))
+    else:
+        vectors = synthetic_vectors(args.n, args.dim)
+
+    # Queries are perturbed corpus vectors, so every query has true neighbours
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)].copy()
+    queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    results = benchmark(
+        vectors,
+        queries,
+        specs=[s.strip() for s in args.specs.split(",") if s.strip()],
+        k=args.k,
+        nprobes=[int(p) for p in args.nprobe.split(",")],
+        ef_searches=[int(e) for e in args.ef_search.split(",")],
+        rerank_factors=[int(f) for f in args.rerank_factor.split(",")],
+    )
+
+    print(f"\n{len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+    print(f"{'factory':<22} {'params':<18} {'rerank':>6} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'B/vec':>8}")
+    for r in results:
+        params = ",".join(f"{k}={v}" for k, v in r["params"].items())
+        rerank = f"x{r['rerank_factor']}" if r["rerank_factor"] else "-"
+        print(f"{r['factory']:<22} {params:<18} {rerank:>6} {r['recall_at_k']:>7.3f} "
+              f"{r['latency_ms_p50']:>8.3f} {r['latency_ms_p99']:>8.3f} {r['bytes_per_vector']:>8.1f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump({"n_vectors": len(vectors), "results": results}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Throughput and cosine drift of the embedding backends against the PyTorch reference.
+
+    python -m benchmarks.embedding_backends
+    python -m benchmarks.embedding_backends --threads 1,2,4 --n 2000 --out embed.json
+
+Compares SentenceTransformer (reference) with the ONNX model and its int8 copy from
+--model-dir (see document_ai/faiss_encode/onnx_export.py). Texts are the stored
+document texts when there are enough of them, else synthetic clinical sentences.
+Drift is 1 - cosine(backend vector, reference vector); neighbour overlap is the share
+of each text's top-10 neighbours (within the sample) that the reference also returns.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from config.settings import EMBED_ONNX_MODEL_DIR
+from document_ai.faiss_encode.embedding import (
+    OnnxEmbedder,
+    ONNX_MODEL_FILE,
+    ONNX_INT8_MODEL_FILE,
+    load_embed_model,
+)
+
+SYMPTOMS = ["fever", "persistent cough", "chest pain", "headache", "shortness of breath", "abdominal pain"]
+TREATMENTS = ["paracetamol 500 mg", "amoxicillin", "rest and fluids", "nebulization", "IV antibiotics"]
+
+
+def synthetic_texts(n: int, seed: int = 0) -> List[str]:
+    rng = np.random.default_rng(seed)
+    texts = []
+    for i in range(n):
+        words = int(rng.integers(8, 120))
+        body = " ".join(rng.choice(SYMPTOMS + TREATMENTS, size=words // 3))
+        texts.append(
+            f"Patient {i}, age {int(rng.integers(1, 90))}, presented with {rng.choice(SYMPTOMS)}. "
+            f"Treated with {rng.choice(TREATMENTS)}. Notes: {body}."
+        )
+    return texts
+
+
+def sample_texts(n: int) -> List[str]:
+    from document_ai.faiss_encode.faiss_utils import text_store
+    if len(text_store) >= n:
+        return [text_store.get(i)[:2000] for i in range(n)]
+    return synthetic_texts(n)
+
+
+def throughput(model, texts: List[str], batch_size: int):
+    model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+    start = time.perf_counter()
+    vectors = np.asarray(model.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+    return vectors, len(texts) / (time.perf_counter() - start)
+
+
+def neighbour_overlap(vectors: np.ndarray, reference: np.ndarray, k: int = 10) -> float:
+    def top_k(v):
+        sims = v @ v.T
+        np.fill_diagonal(sims, -np.inf)
+        return np.argsort(-sims, axis=1)[:, :k]
+    found, truth = top_k(vectors), top_k(reference)
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def drift(vectors: np.ndarray, reference: np.ndarray) -> Dict[str, float]:
+    a = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    b = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    d = 1.0 - np.sum(a * b, axis=1)
+    return {"cosine_drift_mean": round(float(d.mean()), 6), "cosine_drift_max": round(float(d.max()), 6)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default=EMBED_ONNX_MODEL_DIR)
+    parser.add_argument("--n", type=int, default=1000, help="texts to embed")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", default="0", help="onnxruntime thread counts to try (0 = default)")
+    parser.add_argument("--no-reference", action="store_true", help="skip the PyTorch backend (no drift numbers)")
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args()
+
+    texts = sample_texts(args.n)
+    results = []
+    reference = None
+
+    if not args.no_reference:
+        vectors, rate = throughput(load_embed_model("sentence-transformers"), texts, args.batch_size)
+        reference = vectors
+        results.append({"backend": "sentence-transformers", "threads": None, "texts_per_sec": round(rate, 1)})
+
+    for quantized, filename in ((False, ONNX_MODEL_FILE), (True, ONNX_INT8_MODEL_FILE)):
+        if not os.path.exists(os.path.join(args.model_dir, filename)):
+            print(f"Skipping {filename}: not found in {args.model_dir}")
+            continue
+        for threads in [int(t) for t in args.threads.split(",")]:
+            model = OnnxEmbedder(args.model_dir, quantized=quantized, threads=threads)
+            vectors, rate = throughput(model, texts, args.batch_size)
+            row = {"backend": "onnx-int8" if quantized else "onnx", "threads": threads, "texts_per_sec": round(rate, 1)}
+            if reference is not None:
+                row.update(drift(vectors, reference))
+                row["top10_overlap"] = round(neighbour_overlap(vectors, reference), 4)
+            results.append(row)
+
+    print(f"\n{len(texts)} texts, batch size {args.batch_size}")
+    print(f"{'backend':<22} {'threads':>7} {'texts/s':>9} {'drift mean':>11} {'drift max':>10} {'top10':>6}")
+    for r in results:
+        print(f"{r['backend']:<22} {str(r['threads'] if r['threads'] is not None else '-'):>7} "
+              f"{r['texts_per_sec']:>9.1f} {r.get('cosine_drift_mean', '-'):>11} "
+              f"{r.get('cosine_drift_max', '-'):>10} {r.get('top10_overlap', '-'):>6}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump({"n_texts": len(texts), "batch_size": args.batch_size, "results": results}, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+Deterministic local stand-ins for the external services, so the hot paths can be timed
+offline: the embedding model, Gemini (google.generativeai), Cloud Storage and Document AI.
+Each fake sleeps a configurable latency per call to model the network / model time, and
+returns the same output for the same input on every run.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from google.cloud import documentai
+
+from benchmarks.synthetic import DIAGNOSES, FOLLOW_UPS, TREATMENTS
+
+EMBED_DIM = 384
+# Rows of the hashed word-vector table; texts sharing words get similar vectors
+WORD_BUCKETS = 8192
+WORD_RE = re.compile(r"\w+")
+
+
+def _sleep(seconds: float):
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+# ----------------- Embeddings -----------------
+class FakeEmbedder:
+    """
+    Bag-of-hashed-words embedding with the SentenceTransformer.encode() interface: each
+    word maps to a fixed random vector and a text is the normalized sum of its words'.
+    `latency` is slept per text encoded (batched calls pay for every text in the batch).
+    """
+
+    def __init__(self, dim: int = EMBED_DIM, latency: float = 0.0, seed: int = 0):
+        self.dim = dim
+        self.latency = latency
+        rng = np.random.default_rng(seed)
+        self._table = rng.standard_normal((WORD_BUCKETS, dim)).astype(np.float32)
+        self.calls = 0
+        self.texts = 0
+
+    def _embed(self, text: str) -> np.ndarray:
+        rows = [zlib.crc32(w.encode()) % WORD_BUCKETS for w in WORD_RE.findall(text.lower())]
+        if not rows:
+            rows = [0]
+        vector = self._table[rows].sum(axis=0)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        **kwargs,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        self.calls += 1
+        self.texts += len(texts)
+        _sleep(self.latency * len(texts))
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            vectors[i] = self._embed(text)
+        return vectors[0] if single else vectors
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+
+# ----------------- Gemini -----------------
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeStream:
+    """Async iterator over response chunks, as generate_content_async(stream=True) returns."""
+
+    def __init__(self, text: str, chunk_chars: int = 40):
+        self._chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for chunk in self._chunks:
+            yield FakeResponse(chunk)
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def fake_model_reply(prompt: str) -> str:
+    """
+    Deterministic reply to a prompt: a ```json summary for the summarization prompt (Patient
+    taken from the note when it names one) and a short plain-text answer otherwise.
+    """
+    h = _digest(prompt)
+    if "Clinical Text:" in prompt:
+        match = re.search(r"Patient:\s*([^\n]+?)\s{2,}Passport/ID:\s*(\S+)", prompt)
+        patient = f"{match.group(1)} (Passport/ID: {match.group(2)})" if match else "Not specified"
+        summary = {
+            "Patient": patient,
+            "Diagnosis": DIAGNOSES[h % len(DIAGNOSES)],
+            "Treatment": TREATMENTS[(h >> 8) % len(TREATMENTS)],
+            "Follow-up": FOLLOW_UPS[(h >> 16) % len(FOLLOW_UPS)],
+        }
+        return f"```json\n{json.dumps(summary, indent=2)}\n```"
+    return f"Based on the records provided, the most likely answer is case {h % 1000} (synthetic answer)."
+
+
+class FakeGenerativeModel:
+    """genai.GenerativeModel stand-in: generate_content / generate_content_async after `latency` seconds."""
+
+    def __init__(self, model_name: str = "fake", latency: float = 0.0):
+        self.model_name = model_name
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str, **kwargs) -> FakeResponse:
+        with self._lock:
+            self.calls += 1
+        _sleep(self.latency)
+        return FakeResponse(fake_model_reply(prompt))
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        import asyncio
+        with self._lock:
+            self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        text = fake_model_reply(prompt)
+        return FakeStream(text) if stream else FakeResponse(text)
+
+
+class FakeGenai:
+    """The parts of the google.generativeai module our code uses (configure, GenerativeModel)."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.models: List[FakeGenerativeModel] = []
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, model_name: str = "fake") -> FakeGenerativeModel:
+        model = FakeGenerativeModel(model_name, self.latency)
+        self.models.append(model)
+        return model
+
+    @property
+    def calls(self) -> int:
+        return sum(m.calls for m in self.models)
+
+
+# ----------------- Cloud Storage -----------------
+class FakeBlob:
+    def __init__(self, bucket: "FakeStorageClient", name: str, data: bytes, content_type: str):
+        self._client = bucket
+        self.name = name
+        self.content_type = content_type
+        self._data = data
+        self.size = len(data)
+
+    def download_as_bytes(self) -> bytes:
+        _sleep(self._client.latency)
+        with self._client._lock:
+            self._client.downloads += 1
+        return self._data
+
+
+class FakeStorageClient:
+    """
+    In-memory storage.Client: buckets of blobs kept sorted by name so list_blobs(prefix)
+    is a range scan. `latency` is slept per list call and per download.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._buckets: Dict[str, Dict[str, FakeBlob]] = {}
+        self._names: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self.downloads = 0
+
+    def upload(self, bucket: str, name: str, data: bytes, content_type: str = "application/octet-stream"):
+        with self._lock:
+            blobs = self._buckets.setdefault(bucket, {})
+            names = self._names.setdefault(bucket, [])
+            if name not in blobs:
+                names.insert(bisect_left(names, name), name)
+            blobs[name] = FakeBlob(self, name, data, content_type)
+
+    def list_blobs(self, bucket: str, prefix: str = "", start_offset: str = ""):
+        _sleep(self.latency)
+        with self._lock:
+            names = self._names.get(bucket, [])
+            start = bisect_left(names, max(prefix, start_offset))
+            matched = []
+            for i in range(start, len(names)):
+                if not names[i].startswith(prefix):
+                    break
+                matched.append(self._buckets[bucket][names[i]])
+        return iter(matched)
+
+    def blob_bytes(self, bucket: str, name: str) -> Optional[bytes]:
+        """Contents of a blob without the download latency (the fake OCR reads its input this way)."""
+        blob = self._buckets.get(bucket, {}).get(name)
+        return None if blob is None else blob._data
+
+
+def split_gcs_uri(uri: str):
+    match = re.match(r"gs://(.*?)/(.*)", uri)
+    if not match:
+        raise ValueError(f"Invalid GCS URI: {uri}")
+    return match.groups()
+
+
+# ----------------- Document AI -----------------
+# Characters per page of the fake OCR output
+PAGE_CHARS = 1500
+
+
+def document_json(text: str) -> bytes:
+    """A Document AI output shard for `text` with the fields our field mask keeps (text, pages + anchors)."""
+    pages, start, number = [], 0, 1
+    while start < len(text) or not pages:
+        end = min(len(text), start + PAGE_CHARS)
+        if end < len(text):
+            cut = text.rfind("\n", start, end)
+            end = cut + 1 if cut > start else end
+        pages.append({
+            "pageNumber": number,
+            "layout": {"textAnchor": {"textSegments": [{"startIndex": str(start), "endIndex": str(end)}]}},
+        })
+        start, number = end, number + 1
+        if start >= len(text):
+            break
+    return json.dumps({"text": text, "pages": pages}).encode("utf-8")
+
+
+class FakeOperation:
+    """Long-running operation of a batch request; result() waits out the configured latency."""
+
+    def __init__(self, name: str, metadata: documentai.BatchProcessMetadata, latency: float):
+        self.operation = SimpleNamespace(name=name)
+        self.metadata = metadata
+        self._latency = latency
+
+    def result(self, timeout: Optional[float] = None):
+        _sleep(self._latency)
+        return None
+
+
+class FakeDocumentAIClient:
+    """
+    DocumentProcessorServiceClient stand-in. batch_process_documents() "OCRs" each input
+    blob (whose bytes are the note text, see upload_notes) into a JSON output shard under
+    the request's output URI and returns an operation that completes after `latency` seconds.
+    """
+
+    def __init__(self, storage_client: FakeStorageClient, latency: float = 0.0):
+        self.storage = storage_client
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._operations = 0
+
+    @staticmethod
+    def processor_path(project: str, location: str, processor: str) -> str:
+        return f"projects/{project}/locations/{location}/processors/{processor}"
+
+    @staticmethod
+    def processor_version_path(project: str, location: str, processor: str, version: str) -> str:
+        return f"projects/{project}/locations/{location}/processors/{processor}/processorVersions/{version}"
+
+    def batch_process_documents(self, request: documentai.BatchProcessRequest) -> FakeOperation:
+        with self._lock:
+            self._operations += 1
+            op_id = self._operations
+        out_bucket, out_prefix = split_gcs_uri(request.document_output_config.gcs_output_config.gcs_uri)
+        out_prefix = out_prefix.rstrip("/")
+
+        statuses = []
+        for i, doc in enumerate(request.input_documents.gcs_documents.documents):
+            bucket, name = split_gcs_uri(doc.gcs_uri)
+            data = self.storage.blob_bytes(bucket, name)
+            text = data.decode("utf-8") if data is not None else ""
+            destination = f"{out_prefix}/{op_id}/{i}"
+            self.storage.upload(out_bucket, f"{destination}/doc-0.json", document_json(text), "application/json")
+            statuses.append(documentai.BatchProcessMetadata.IndividualProcessStatus(
+                input_gcs_source=doc.gcs_uri,
+                output_gcs_destination=f"gs://{out_bucket}/{destination}/",
+            ))
+        metadata = documentai.BatchProcessMetadata(individual_process_statuses=statuses)
+        return FakeOperation(f"operations/fake-{op_id}", metadata, self.latency)
+
+
+def upload_notes(storage_client: FakeStorageClient, bucket: str, prefix: str, notes) -> int:
+    """Store notes as input "scans" (the fake OCR reads the text back from the bytes)."""
+    count = 0
+    for i, note in enumerate(notes):
+        storage_client.upload(bucket, f"{prefix}/scan_{i:07d}.jpg", note.encode("utf-8"), "image/jpeg")
+        count += 1
+    return count
@@ -0,0 +1,478 @@
+"""
+Offline timings of the ingestion, summarization and retrieval hot paths on synthetic data.
+
+    python -m benchmarks.hot_paths --scales 1k,100k --out results.json
+    python -m benchmarks.hot_paths --scales 1k --out new.json --compare results.json
+    python -m benchmarks.hot_paths --scales 1M --pipeline-docs 2000 --genai-latency 0.8
+
+Each scale runs in a fresh working directory with N synthetic clinical notes and N summary
+files. Document AI, Cloud Storage, Gemini and (unless --real-embeddings) the embedding
+model are replaced by the deterministic fakes in benchmarks/fakes.py, each sleeping its
+--*-latency per call, so results depend only on our code and the latencies chosen.
+The module-level stores (FAISS index, text store, summary vectorstore, caches) are
+pointed at the working directory for the run, and FAISS_DIR at an empty directory before
+the services are first imported, so the repo's own data is never opened or written.
+
+Timed: add_texts_to_faiss (bulk ingest of all N notes), add_text_to_faiss (single notes),
+save_faiss_index, build_summary_index (full, 1% changed, unchanged), load_summary_index,
+search_summary_index (with and without a metadata filter), answer_query (with and without
+Gemini), batch_summarize_and_save and batch_process_documents. The two pipeline stages run
+on the first --pipeline-docs notes, since they are bound by the fake service latencies.
+
+Results are written as JSON (with the commit they were measured on) and --compare prints
+the change of every metric against an earlier results file; --fail-on-regression exits
+with status 1 when a metric got worse by more than --threshold percent.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager, redirect_stdout
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+from unittest import mock
+
+import faiss
+import numpy as np
+
+from config.resources import resources
+from benchmarks import synthetic
+from benchmarks.fakes import (
+    FakeDocumentAIClient,
+    FakeEmbedder,
+    FakeGenai,
+    FakeGenerativeModel,
+    FakeStorageClient,
+    upload_notes,
+)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Notes per add_texts_to_faiss call during bulk ingest (as IngestBuffer flushes)
+INGEST_CHUNK = 256
+# Share of summary files rewritten before the incremental build
+INCREMENTAL_FRACTION = 0.01
+
+# Metrics where a larger value is better; for every other numeric field smaller is better
+HIGHER_IS_BETTER = ("per_sec",)
+COMPARED_FIELDS = ("seconds", "p50_ms", "p99_ms", "mean_ms", "docs_per_sec", "notes_per_sec")
+
+
+def parse_scale(text: str) -> int:
+    text = text.strip().lower()
+    for suffix, factor in (("k", 1_000), ("m", 1_000_000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+
+def latency_stats(seconds: List[float]) -> Dict[str, float]:
+    ms = np.asarray(seconds) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+@contextmanager
+def quiet(enabled: bool = True):
+    """Swallow the progress prints of the code under test (they still run, so their cost counts)."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        yield
+
+
+def timed(fn: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def time_calls(fn: Callable, inputs: List[Any]) -> Dict[str, float]:
+    latencies = []
+    for item in inputs:
+        _, seconds = timed(fn, item)
+        latencies.append(seconds)
+    return latency_stats(latencies)
+
+
+# ----------------- Isolation -----------------
+@contextmanager
+def isolated_environment(workdir: str, args: argparse.Namespace):
+    """
+    Point every module-level store at `workdir` and serve the fakes through the resource
+    registry. Yields the paths and fakes the run uses; everything is restored on exit.
+    """
+    from document_ai.faiss_encode import faiss_utils
+    from document_ai.faiss_encode.embedding import EMBED_DIM
+    from document_ai.faiss_encode.passage_map import PassageMap
+    from document_ai.faiss_encode.query_cache import QueryEmbeddingCache
+    from document_ai.faiss_encode.rerank import VectorFile
+    from document_ai.faiss_encode.text_store import TextStore
+    from rag_agent.services import llm_agent, rag_utils
+    from rag_agent.services.answer_cache import AnswerCache
+    from rag_agent.services.index_store import SummaryIndexStore
+    from summarize.services import llm_process
+
+    faiss_dir = os.path.join(workdir, "faiss")
+    vstore_dir = os.path.join(workdir, "vectorstore")
+    env = SimpleNamespace(
+        faiss_dir=faiss_dir,
+        summaries_dir=os.path.join(workdir, "summaries"),
+        pipeline_dir=os.path.join(workdir, "pipeline_summaries"),
+        vstore=dict(
+            index_file=os.path.join(vstore_dir, "summary_index.index"),
+            texts_file=os.path.join(vstore_dir, "summary_texts.col"),
+            metadata_file=os.path.join(vstore_dir, "summary_metadata.col"),
+            version_file=os.path.join(vstore_dir, "summary_version.txt"),
+            lexical_file=os.path.join(vstore_dir, "summary_lexical.json"),
+        ),
+        build_files=dict(
+            manifest_file=os.path.join(vstore_dir, "summary_manifest.json"),
+            vectors_file=os.path.join(vstore_dir, "summary_vectors.f32"),
+        ),
+        embedder=None if args.real_embeddings else FakeEmbedder(latency=args.embed_latency),
+        genai=FakeGenai(latency=args.genai_latency),
+    )
+    for path in (faiss_dir, vstore_dir, env.summaries_dir, env.pipeline_dir):
+        os.makedirs(path, exist_ok=True)
+
+    text_store = TextStore(os.path.join(faiss_dir, "texts.dat"), os.path.join(faiss_dir, "texts.idx"), legacy_file=None)
+    passage_map = PassageMap(os.path.join(faiss_dir, "passages.idx"))
+    document_vectors = VectorFile(os.path.join(faiss_dir, "document_vectors.f32"), EMBED_DIM)
+    query_cache = QueryEmbeddingCache()  # memory only
+    summary_store = SummaryIndexStore(**env.vstore, check_interval=0.0)
+
+    with ExitStack() as stack:
+        def patch(obj, name, value):
+            stack.enter_context(mock.patch.object(obj, name, value))
+
+        # Document search (Task 1)
+        patch(faiss_utils, "FAISS_INDEX_FILE", os.path.join(faiss_dir, "document_embeddings.index"))
+        patch(faiss_utils, "TEXTS_FILE", os.path.join(faiss_dir, "texts.dat"))
+        patch(faiss_utils, "text_store", text_store)
+        patch(faiss_utils, "passage_map", passage_map)
+        patch(faiss_utils, "document_vectors", document_vectors)
+        # Summarization (Task 2) reads the same notes
+        patch(llm_process, "stored_texts", text_store)
+        patch(llm_process, "SUMMARIES_DIR", env.pipeline_dir)
+        # RAG (Task 3): private query / answer caches, so nothing is shared with other runs or the disk cache
+        patch(rag_utils, "query_embedding_cache", query_cache)
+        patch(llm_agent, "query_embedding_cache", query_cache)
+        patch(llm_agent, "answer_cache", AnswerCache())
+        patch(llm_agent, "summary_store", summary_store)
+
+        names = ["gemini", "document_index"] + ([] if args.real_embeddings else ["embed_model"])
+        if env.embedder is not None:
+            resources.provide("embed_model", env.embedder)
+        resources.provide("gemini", env.genai)
+        try:
+            yield env
+        finally:
+            for name in names:
+                resources.register(name, lambda: None).reset()
+            text_store.close()
+            passage_map.close()
+            document_vectors.close()
+
+
+# ----------------- Stages -----------------
+def bench_document_ingest(n: int, args, env) -> Dict[str, Any]:
+    from document_ai.faiss_encode import faiss_utils
+
+    results = {}
+    with quiet(not args.verbose):
+        index = faiss_utils.create_or_load_faiss_index()
+        start = time.perf_counter()
+        notes = synthetic.clinical_notes(n, args.seed)
+        while True:
+            chunk = [note for _, note in zip(range(INGEST_CHUNK), notes)]
+            if not chunk:
+                break
+            index = faiss_utils.add_texts_to_faiss(chunk, index=index)
+        seconds = time.perf_counter() - start
+        results["add_texts_to_faiss"] = {
+            "documents": n,
+            "vectors": int(index.ntotal),
+            "seconds": round(seconds, 3),
+            "docs_per_sec": round(n / seconds, 1),
+        }
+
+        index, seconds = timed(faiss_utils.save_faiss_index, index)
+        results["save_faiss_index"] = {"seconds": round(seconds, 3), "vectors": int(index.ntotal)}
+
+        singles = list(synthetic.clinical_notes(args.samples, args.seed, start=n))
+        holder = {"index": index}
+
+        def add_one(note):
+            holder["index"] = faiss_utils.add_text_to_faiss(note, index=holder["index"])
+
+        results["add_text_to_faiss"] = time_calls(add_one, singles)
+        faiss_utils.save_faiss_index(holder["index"])
+    return results
+
+
+def touch_summaries(summaries_dir: str, files: List[str], fraction: float) -> int:
+    """Rewrite every 1/fraction-th summary file with a changed Follow-up; returns how many changed."""
+    step = max(1, int(round(1 / fraction)))
+    changed = 0
+    for name in files[::step]:
+        path = os.path.join(summaries_dir, name)
+        with open(path, "r", encoding="utf-8") as fh:
+            record = json.load(fh)
+        record["summary"]["Follow-up"] = "Review in 3 days"
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(record, fh)
+        changed += 1
+    return changed
+
+
+def bench_summary_index(n: int, args, env) -> Dict[str, Any]:
+    from rag_agent.services.rag_utils import build_summary_index, load_summary_index
+
+    results = {}
+    files, seconds = timed(synthetic.write_summary_files, env.summaries_dir, n, args.seed)
+    results["write_summary_files"] = {"files": n, "setup_seconds": round(seconds, 3)}  # setup, not compared
+
+    build = dict(summaries_dir=env.summaries_dir, **env.vstore, **env.build_files)
+    if args.index_spec:
+        build["index_spec"] = args.index_spec
+    with quiet(not args.verbose):
+        (index, _, _), seconds = timed(build_summary_index, incremental=False, **build)
+        results["build_summary_index"] = {
+            "summaries": n,
+            "seconds": round(seconds, 3),
+            "docs_per_sec": round(n / seconds, 1),
+            "index": type(faiss.downcast_index(getattr(index, "index", index))).__name__,
+        }
+
+        changed = touch_summaries(env.summaries_dir, files, INCREMENTAL_FRACTION)
+        _, seconds = timed(build_summary_index, incremental=True, **build)
+        results["build_summary_index_incremental"] = {"changed": changed, "seconds": round(seconds, 3)}
+
+        _, seconds = timed(build_summary_index, incremental=True, **build)
+        results["build_summary_index_unchanged"] = {"seconds": round(seconds, 3)}
+
+        load_files = {k: env.vstore[k] for k in ("index_file", "texts_file", "metadata_file")}
+        loads = [timed(load_summary_index, **load_files, vectors_file=env.build_files["vectors_file"])[1]
+                 for _ in range(args.load_repeats)]
+        results["load_summary_index"] = {**latency_stats(loads), "seconds": round(float(np.median(loads)), 4)}
+    return results
+
+
+def bench_retrieval(n: int, args, env) -> Dict[str, Any]:
+    from rag_agent.services import llm_agent
+    from rag_agent.services.metadata_filter import SummaryFilter
+    from rag_agent.services.rag_utils import search_summary_index
+
+    results = {}
+    with quiet(not args.verbose):
+        _, seconds = timed(llm_agent.summary_store.get)  # snapshot: index, columns, lexical + filter index
+        results["summary_snapshot_load"] = {"seconds": round(seconds, 3)}
+        snapshot = llm_agent.summary_store.get()
+
+        # Distinct questions per stage so query embeddings are never served from the cache
+        questions = synthetic.questions(args.samples * 4, args.seed)
+        search_qs, filtered_qs, plain_qs, gemini_qs = (questions[i::4] for i in range(4))
+
+        def search(q):
+            search_summary_index(q, top_k=args.top_k, index=snapshot.index, metadata_list=snapshot.metadata_list)
+
+        where = SummaryFilter(processed_from="2025-03-01", processed_before="2025-06-01", has_diagnosis=True)
+
+        def search_filtered(q):
+            search_summary_index(
+                q, top_k=args.top_k, index=snapshot.index, metadata_list=snapshot.metadata_list,
+                where=where, filter_index=snapshot.filters,
+            )
+
+        results["search_summary_index"] = time_calls(search, search_qs)
+        results["search_summary_index_filtered"] = time_calls(search_filtered, filtered_qs)
+        results["answer_query"] = time_calls(lambda q: llm_agent.answer_query(q, use_gemini=False), plain_qs)
+        calls_before = env.genai.calls
+        results["answer_query_gemini"] = time_calls(lambda q: llm_agent.answer_query(q, use_gemini=True), gemini_qs)
+        results["answer_query_gemini"]["gemini_calls"] = env.genai.calls - calls_before
+    return results
+
+
+def bench_pipelines(n: int, args, env) -> Dict[str, Any]:
+    from document_ai.services.batch_process import batch_process_documents
+    from summarize.services.llm_process import batch_summarize_and_save
+
+    docs = min(n, args.pipeline_docs)
+    results = {}
+    with quiet(not args.verbose):
+        model = FakeGenerativeModel(latency=args.genai_latency)
+        _, seconds = timed(
+            batch_summarize_and_save,
+            top_k=docs,
+            requests_per_second=0,  # the fake has no quota; measure the pipeline itself
+            max_retries=0,
+            model=model,
+            use_cache=False,
+        )
+        results["batch_summarize_and_save"] = {
+            "notes": docs,
+            "seconds": round(seconds, 3),
+            "notes_per_sec": round(docs / seconds, 1),
+            "gemini_calls": model.calls,
+        }
+
+        storage_client = FakeStorageClient(latency=args.storage_latency)
+        upload_notes(storage_client, "bench-input", "scans", synthetic.clinical_notes(docs, args.seed + 1))
+        client = FakeDocumentAIClient(storage_client, latency=args.docai_latency)
+        stats, seconds = timed(
+            batch_process_documents,
+            project_id="bench",
+            location="us",
+            processor_id="fake",
+            gcs_input_uri="gs://bench-input/scans/",
+            gcs_output_uri="gs://bench-output/ocr/",
+            flush_max_seconds=1.0,
+            client=client,
+            storage_client=storage_client,
+        )
+        results["batch_process_documents"] = {
+            "documents": stats["documents"],
+            "seconds": round(seconds, 3),
+            "docs_per_sec": round(stats["documents"] / seconds, 1),
+        }
+    return results
+
+
+def run_scale(n: int, args) -> Dict[str, Any]:
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix=f"hot_paths_{n}_", dir=args.workdir)
+    results: Dict[str, Any] = {}
+    try:
+        with isolated_environment(workdir, args) as env:
+            for stage in (bench_document_ingest, bench_summary_index, bench_retrieval, bench_pipelines):
+                print(f"  {stage.__name__[6:]}...")
+                results.update(stage(n, args, env))
+            if env.embedder is not None:
+                results["fake_embedder"] = {"calls": env.embedder.calls, "texts": env.embedder.texts}
+    finally:
+        if args.keep:
+            print(f"  kept working directory {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+# ----------------- Reporting -----------------
+def git_commit() -> Dict[str, Any]:
+    def git(*cmd):
+        return subprocess.run(["git", *cmd], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+def print_results(results: Dict[str, Dict[str, Any]]):
+    for scale, metrics in results.items():
+        print(f"\n== {scale} ==")
+        for name, values in metrics.items():
+            shown = ", ".join(f"{k}={v}" for k, v in values.items())
+            print(f"{name:<34} {shown}")
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print the change of every shared metric; returns the regressions beyond `threshold` percent."""
+    regressions = []
+    base_commit = (baseline.get("commit") or "unknown")[:10]
+    print(f"\nChange vs {base_commit} (negative = faster / better):")
+    for scale, metrics in current["scales"].items():
+        base_metrics = baseline.get("scales", {}).get(scale)
+        if not base_metrics:
+            continue
+        for name, values in metrics.items():
+            for field in COMPARED_FIELDS:
+                new, old = values.get(field), (base_metrics.get(name) or {}).get(field)
+                if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+                    continue
+                change = (new - old) / old * 100
+                worse = -change if field.endswith(HIGHER_IS_BETTER) else change
+                flag = "  REGRESSION" if worse > threshold else ""
+                print(f"{scale:>6} {name + '.' + field:<50} {old:>12} -> {new:<12} {worse:+7.1f}%{flag}")
+                if flag:
+                    regressions.append(f"{scale} {name}.{field}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1k", help="comma-separated corpus sizes, e.g. 1k,100k,1M")
+    parser.add_argument("--samples", type=int, default=200, help="calls per latency measurement")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--load-repeats", type=int, default=5)
+    parser.add_argument("--pipeline-docs", type=int, default=1000,
+                        help="notes run through batch_summarize_and_save / batch_process_documents")
+    parser.add_argument("--index-spec", help="summary index backend (default: FAISS_INDEX_SPEC)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per text embedded by the fake model")
+    parser.add_argument("--genai-latency", type=float, default=0.0, help="seconds per Gemini call")
+    parser.add_argument("--storage-latency", type=float, default=0.0, help="seconds per list / download call")
+    parser.add_argument("--docai-latency", type=float, default=0.0, help="seconds per Document AI batch operation")
+    parser.add_argument("--real-embeddings", action="store_true", help="use the configured embedding model")
+    parser.add_argument("--workdir", help="parent of the per-scale working directories (default: system temp)")
+    parser.add_argument("--keep", action="store_true", help="keep the working directories")
+    parser.add_argument("--verbose", action="store_true", help="show the progress output of the code under test")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    report = {
+        **git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "faiss": faiss.__version__,
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "workdir", "keep", "verbose")},
+        "scales": {},
+    }
+    # The services open the document store when first imported (migrating a legacy
+    # texts.npy); give them an empty one so the repo's faiss/ folder is left alone
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    import_dir = tempfile.mkdtemp(prefix="hot_paths_import_", dir=args.workdir)
+    os.environ["FAISS_DIR"] = os.path.join(import_dir, "faiss")
+    try:
+        for label in args.scales.split(","):
+            n = parse_scale(label)
+            print(f"Scale {label} ({n} notes / summaries)")
+            report["scales"][label.strip()] = run_scale(n, args)
+    finally:
+        shutil.rmtree(import_dir, ignore_errors=True)
+
+    print_results(report["scales"])
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nWrote {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            regressions = compare(report, json.load(fh), args.threshold)
+        if regressions and args.fail_on_regression:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
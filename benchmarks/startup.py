@@ -0,0 +1,133 @@
+"""
+Import time of the service modules and cold-start time of the two APIs.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 5 --out startup.json
+
+Every measurement runs in a fresh interpreter so nothing is cached in-process.
+For each app, "bind" is the time from launching uvicorn until its port accepts
+connections and "ready" is the time until /health reports the warm-up finished.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+MODULES = [
+    "config.settings",
+    "document_ai.faiss_encode.faiss_utils",
+    "main",
+    "rag_agent.api.fastapi_app",
+]
+
+APPS = {
+    "search_api": "main:app",
+    "rag_api": "rag_agent.api.fastapi_app:app",
+}
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_seconds(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def port_open(port: int) -> bool:
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+            return True
+    except OSError:
+        return False
+
+
+def health_ready(port: int) -> bool:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+            return bool(json.load(resp).get("ready"))
+    except Exception:
+        return False
+
+
+def start_app(target: str, timeout: float) -> Dict[str, Optional[float]]:
+    """Launch uvicorn for `target`; returns seconds until the port is bound and until /health is ready."""
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    bind = ready = None
+    try:
+        while time.perf_counter() - start < timeout and proc.poll() is None:
+            if bind is None and port_open(port):
+                bind = time.perf_counter() - start
+            if bind is not None and health_ready(port):
+                ready = time.perf_counter() - start
+                break
+            time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return {"bind_s": bind, "ready_s": ready}
+
+
+def median(values: List[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for an app to become ready")
+    parser.add_argument("--skip-apps", action="store_true", help="only measure module import times")
+    parser.add_argument("--out", help="write JSON results here")
+    args = parser.parse_args()
+
+    results = {"imports": {}, "apps": {}}
+    for module in MODULES:
+        try:
+            results["imports"][module] = median([import_seconds(module) for _ in range(args.repeat)])
+        except subprocess.CalledProcessError as e:
+            print(f"Import of {module} failed: {e.stderr.strip().splitlines()[-1] if e.stderr else e}")
+            results["imports"][module] = None
+
+    if not args.skip_apps:
+        for name, target in APPS.items():
+            runs = [start_app(target, args.timeout) for _ in range(args.repeat)]
+            results["apps"][name] = {
+                "bind_s": median([r["bind_s"] for r in runs]),
+                "ready_s": median([r["ready_s"] for r in runs]),
+            }
+
+    print(f"\n{'module':<40} {'import s':>9}")
+    for module, seconds in results["imports"].items():
+        print(f"{module:<40} {seconds if seconds is not None else 'failed':>9}")
+    for name, r in results["apps"].items():
+        print(f"{name:<40} bind {r['bind_s']}s, ready {r['ready_s']}s")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Deterministic synthetic clinical notes and patient summaries for the benchmarks.
+
+Record i always produces the same patient, note and summary (for a given seed), so
+runs on different commits see identical data. Notes vary in length from a few lines
+to multi-page letters so passage chunking is exercised.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+FIRST_NAMES = [
+    "Jyoti", "Yaw", "Srinivas", "Amara", "Chen", "Fatima", "Lukas", "Priya", "Mateo", "Aisha",
+    "Kofi", "Elena", "Hiro", "Nadia", "Omar", "Grace", "Ravi", "Sofia", "Tomas", "Zainab",
+]
+LAST_NAMES = [
+    "Shah", "Han", "Rao", "Okafor", "Wei", "Khan", "Muller", "Patel", "Garcia", "Bello",
+    "Mensah", "Petrova", "Sato", "Haddad", "Farouk", "Kim", "Iyer", "Rossi", "Novak", "Diallo",
+]
+SYMPTOMS = [
+    "fever", "persistent cough", "chest pain", "headache", "shortness of breath",
+    "abdominal pain", "joint pain", "fatigue", "dizziness", "sore throat",
+]
+DIAGNOSES = [
+    "Muscular fever", "Viral upper respiratory infection", "Community-acquired pneumonia",
+    "Migraine without aura", "Acute gastritis", "Type 2 diabetes mellitus", "Essential hypertension",
+    "Iron deficiency anaemia", "Urinary tract infection", "Not specified",
+]
+TREATMENTS = [
+    "paracetamol 500 mg three times daily", "amoxicillin 500 mg for 7 days", "rest and oral fluids",
+    "nebulization with salbutamol", "IV antibiotics", "metformin 500 mg twice daily",
+    "amlodipine 5 mg once daily", "oral iron supplements", "1 day of rest",
+]
+FOLLOW_UPS = ["Review in 1 week", "Review in 2 weeks", "Repeat blood tests in 1 month", "Not specified", "As needed"]
+
+BASE_DATE = datetime(2025, 1, 1)
+
+
+def _rng(i: int, seed: int) -> np.random.Generator:
+    return np.random.default_rng([seed, i])
+
+
+def patient(i: int, seed: int = 0) -> Dict[str, str]:
+    """Name and ID of patient i (IDs are unique; names repeat, as in the real archive)."""
+    rng = _rng(i, seed)
+    name = f"{FIRST_NAMES[rng.integers(len(FIRST_NAMES))]} {LAST_NAMES[rng.integers(len(LAST_NAMES))]}"
+    return {"name": name, "id": f"{354 + i // 10_000_000:03d}-{(i // 100_000) % 100:02d}-{i % 100_000:05d}"}
+
+
+def clinical_note(i: int, seed: int = 0) -> str:
+    """OCR-like clinical note for record i (roughly 300 characters to 6 pages)."""
+    rng = _rng(i, seed)
+    p = patient(i, seed)
+    visit = BASE_DATE + timedelta(days=int(rng.integers(0, 365)))
+    lines = [
+        f"Patient: {p['name']}    Passport/ID: {p['id']}",
+        f"Age: {int(rng.integers(1, 90))}    Date: {visit:%d-%m-%Y}",
+        f"Presenting complaint: {', '.join(rng.choice(SYMPTOMS, size=int(rng.integers(1, 4)), replace=False))}.",
+        f"Diagnosis: {DIAGNOSES[rng.integers(len(DIAGNOSES))]}.",
+        f"Treatment: {TREATMENTS[rng.integers(len(TREATMENTS))]}.",
+        f"Follow-up: {FOLLOW_UPS[rng.integers(len(FOLLOW_UPS))]}.",
+    ]
+    # Long tail of history / examination notes: most notes are short, a few run to pages
+    for _ in range(int(rng.pareto(1.5) * 4)):
+        words = rng.choice(SYMPTOMS + TREATMENTS, size=int(rng.integers(6, 30)))
+        lines.append(f"History: {' '.join(words)}.")
+    return "\n".join(lines)
+
+
+def summary_record(i: int, seed: int = 0) -> Dict[str, Any]:
+    """Summary JSON of record i, in the format summarize/ writes."""
+    rng = _rng(i, seed + 1)
+    p = patient(i, seed)
+    patient_field = p["name"] if rng.random() < 0.5 else f"{p['name']} (Passport/ID: {p['id']})"
+    return {
+        "record_id": i + 1,
+        "processed_at": (BASE_DATE + timedelta(seconds=int(rng.integers(0, 365 * 86400)))).isoformat(),
+        "original_text_length": int(rng.integers(200, 6000)),
+        "summary": {
+            "Patient": patient_field,
+            "Diagnosis": DIAGNOSES[rng.integers(len(DIAGNOSES))],
+            "Treatment": TREATMENTS[rng.integers(len(TREATMENTS))],
+            "Follow-up": FOLLOW_UPS[rng.integers(len(FOLLOW_UPS))],
+        },
+    }
+
+
+def clinical_notes(n: int, seed: int = 0, start: int = 0) -> Iterator[str]:
+    for i in range(start, start + n):
+        yield clinical_note(i, seed)
+
+
+def write_summary_files(summaries_dir: str, n: int, seed: int = 0, start: int = 0) -> List[str]:
+    """Write summaries start..start+n-1 as patient_*.json files; returns the file names."""
+    os.makedirs(summaries_dir, exist_ok=True)
+    names = []
+    for i in range(start, start + n):
+        name = f"patient_{i:07d}.json"
+        with open(os.path.join(summaries_dir, name), "w", encoding="utf-8") as fh:
+            json.dump(summary_record(i, seed), fh)
+        names.append(name)
+    return names
+
+
+def questions(n: int, seed: int = 0) -> List[str]:
+    """Mixed question workload: name lookups, ID lookups and free-text clinical questions."""
+    out = []
+    for q in range(n):
+        rng = _rng(q, seed + 2)
+        p = patient(int(rng.integers(0, 1000)), seed)
+        kind = q % 3
+        if kind == 0:
+            out.append(p["name"])
+        elif kind == 1:
+            out.append(f"What was the diagnosis for {p['name']}?")
+        else:
+            out.append(f"Which patients presented with {SYMPTOMS[q % len(SYMPTOMS)]} (case {q})?")
+    return out
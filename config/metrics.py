@@ -0,0 +1,214 @@
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from prometheus_client import Counter, Histogram
+
+from config.profiler import SamplingProfiler
+from config.settings import PROFILER_ENABLED, PROFILER_HEADER, PROFILER_MIN_SECONDS
+
+METRICS_PATH = "/metrics"
+
+# Latency buckets (seconds) from sub-millisecond lookups up to batch jobs
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# ----------------- Prometheus metrics -----------------
+REQUEST_SECONDS = Histogram(
+    "intraintel_request_seconds", "HTTP request latency", ["method", "route"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter("intraintel_requests", "HTTP requests", ["method", "route", "status"])
+OPERATION_SECONDS = Histogram(
+    "intraintel_operation_seconds", "End-to-end time of an operation", ["operation"], buckets=LATENCY_BUCKETS
+)
+OPERATIONS = Counter("intraintel_operations", "Operations finished", ["operation", "status"])
+STAGE_SECONDS = Histogram(
+    "intraintel_stage_seconds", "Time spent in one stage of an operation", ["operation", "stage"], buckets=LATENCY_BUCKETS
+)
+ITEMS = Counter("intraintel_items", "Items processed by an operation", ["operation", "item"])
+
+
+# ----------------- Per-request trace -----------------
+class Trace:
+    """
+    Stage timings of one request or job. Stages that run more than once (or on several
+    threads at the same time) are summed, so stages can add up to more than the total.
+    """
+
+    def __init__(self, profiler: Optional[SamplingProfiler] = None):
+        self.operation: Optional[str] = None
+        self.profiler = profiler
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, item: str, n: int):
+        with self._lock:
+            self.counts[item] = self.counts.get(item, 0) + n
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                "stages_ms": {name: round(s * 1000, 2) for name, s in self.stages.items()},
+                "counts": dict(self.counts),
+            }
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def in_context(fn: Callable) -> Callable:
+    """`fn` bound to a copy of the caller's context (trace included), for running on another thread."""
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+@contextmanager
+def operation(name: str):
+    """
+    Time an operation ("ask", "search", "batch_process") end to end; stages inside it are
+    labelled with its name. Starts a trace when there is none (e.g. outside a request).
+    Also usable as a decorator on plain functions.
+    """
+    trace = _trace.get()
+    token = None
+    if trace is None:
+        trace = Trace()
+        token = _trace.set(trace)
+    previous, trace.operation = trace.operation, name
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield trace
+        status = "ok"
+    finally:
+        OPERATION_SECONDS.labels(name).observe(time.perf_counter() - start)
+        OPERATIONS.labels(name, status).inc()
+        trace.operation = previous
+        if token is not None:
+            _trace.reset(token)
+
+
+def _traces(traces: Optional[Iterable[Optional[Trace]]]):
+    if traces is None:
+        traces = (_trace.get(),)
+    return [t for t in dict.fromkeys(traces) if t is not None]
+
+
+def record(stage_name: str, seconds: float, traces: Optional[Iterable[Optional[Trace]]] = None):
+    """Record a stage duration measured elsewhere (e.g. time a query spent queued)."""
+    traces = _traces(traces)
+    for op in {t.operation for t in traces} or {None}:
+        STAGE_SECONDS.labels(op or "none", stage_name).observe(seconds)
+    for t in traces:
+        t.add(stage_name, seconds)
+
+
+@contextmanager
+def stage(stage_name: str, traces: Optional[Iterable[Optional[Trace]]] = None):
+    """
+    Time a stage of blocking work into the stage histogram and the current trace. `traces`
+    records one shared piece of work (a micro-batch) into each request it served instead.
+    While the stage runs, this thread is sampled by the profilers of those requests; time
+    awaited on the event loop is recorded with record() instead.
+    """
+    traces = _traces(traces)
+    profilers = {t.profiler for t in traces if t.profiler is not None}
+    ident = threading.get_ident()
+    for profiler in profilers:
+        profiler.attach(ident)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        for profiler in profilers:
+            profiler.detach(ident)
+        record(stage_name, seconds, traces)
+
+
+def count(item: str, n: int = 1):
+    """Count items processed by the current operation (documents, passages, Gemini calls, ...)."""
+    trace = _trace.get()
+    ITEMS.labels((trace.operation if trace else None) or "none", item).inc(n)
+    if trace is not None:
+        trace.count(item, n)
+
+
+# ----------------- HTTP -----------------
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware: request latency / status metrics per route, a trace per request (read
+    by endpoints that return a `timings` block), and the sampling profiler for requests that
+    send PROFILER_HEADER when PROFILER_ENABLED is set. Profiles of requests slower than
+    PROFILER_MIN_SECONDS are written to PROFILER_DIR.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.profile_header = PROFILER_HEADER.lower().encode("latin-1")
+
+    def _wants_profile(self, scope) -> bool:
+        if not PROFILER_ENABLED:
+            return False
+        for name, value in scope.get("headers") or ():
+            if name == self.profile_header:
+                return value.strip().lower() not in (b"", b"0", b"false", b"no")
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler() if self._wants_profile(scope) else None
+        token = _trace.set(Trace(profiler))
+        if profiler is not None:
+            profiler.start()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - start
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_SECONDS.labels(scope["method"], route).observe(seconds)
+            REQUESTS.labels(scope["method"], route, str(status)).inc()
+            if profiler is not None:
+                profiler.stop()
+                if seconds >= PROFILER_MIN_SECONDS and profiler.samples:
+                    path = profiler.dump(f"{scope['method']}_{scope['path']}_{seconds * 1000:.0f}ms")
+                    print(f"Profiled {scope['method']} {scope['path']} ({seconds:.2f}s): {path}")
+            _trace.reset(token)
+
+
+def instrument_app(app):
+    """Add the request metrics middleware and a Prometheus /metrics route to a FastAPI app."""
+    from fastapi.responses import Response
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+    app.add_middleware(RequestMetricsMiddleware)
+
+    @app.get(METRICS_PATH, include_in_schema=False)
+    def metrics():
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    return app
@@ -0,0 +1,84 @@
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+from config.settings import PROFILER_DIR, PROFILER_INTERVAL_MS
+
+# Deepest stack kept per sample (deeper frames are cut at the root side)
+MAX_STACK_DEPTH = 128
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for a single request.
+    A background thread looks at the stacks of the attached threads every `interval_ms`
+    (sys._current_frames, no tracing hooks) and counts them in folded form, one
+    "module:function;module:function count" line per distinct stack: the input format of
+    flamegraph.pl and speedscope. Threads are attached only while they work for the
+    request (see config.metrics.stage), so shared worker threads don't leak other work in.
+    """
+
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS):
+        self.interval = max(interval_ms, 0.5) / 1000.0
+        self.samples: Counter = Counter()
+        self._threads: Dict[int, int] = {}  # thread ident -> attach depth
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def attach(self, ident: int):
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+
+    def detach(self, ident: int):
+        with self._lock:
+            depth = self._threads.get(ident, 0) - 1
+            if depth > 0:
+                self._threads[ident] = depth
+            else:
+                self._threads.pop(ident, None)
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                idents = list(self._threads)
+            if not idents:
+                continue
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.samples[self._fold(frame)] += 1
+
+    @staticmethod
+    def _fold(frame) -> str:
+        names = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def dump(self, label: str, directory: str = PROFILER_DIR) -> str:
+        """Write the folded stacks to `directory`; returns the file path."""
+        os.makedirs(directory, exist_ok=True)
+        safe_label = re.sub(r"[^\w.-]+", "_", label).strip("_")[:80]
+        path = os.path.join(directory, f"{datetime.now():%Y%m%d_%H%M%S_%f}_{safe_label}.folded")
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(self.folded())
+        return path
@@ -0,0 +1,126 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class LazyResource:
+    """A heavy object (model, index, cloud client) created on first use and shared afterwards."""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                start = time.perf_counter()
+                try:
+                    self._value = self.factory()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                self.error = None
+                self._loaded = True
+                print(f"Loaded {self.name} in {self.load_seconds:.2f}s")
+        return self._value
+
+    def set(self, value):
+        """Use an already-built object (e.g. a local stand-in in benchmarks) instead of the factory."""
+        with self._lock:
+            self._value = value
+            self._loaded = True
+            self.load_seconds = 0.0
+            self.error = None
+
+    def reset(self):
+        """Forget the loaded object so the next get() creates it again."""
+        with self._lock:
+            self._value = None
+            self._loaded = False
+            self.load_seconds = None
+
+
+class ResourceRegistry:
+    """
+    Named lazy resources shared across the process. Modules register a factory at import
+    (cheap) and call get() where they need the object, so importing a module never loads
+    a model or opens a client. warm_up() loads resources ahead of the first request.
+    """
+
+    def __init__(self):
+        self._resources: Dict[str, LazyResource] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]) -> LazyResource:
+        """Register `factory` under `name`; registering an existing name returns the existing resource."""
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = LazyResource(name, factory)
+            return self._resources[name]
+
+    def provide(self, name: str, value) -> LazyResource:
+        """Serve `value` under `name` from now on, whether or not a factory was registered."""
+        resource = self.register(name, lambda: value)
+        resource.set(value)
+        return resource
+
+    def get(self, name: str):
+        try:
+            resource = self._resources[name]
+        except KeyError:
+            raise KeyError(f"Resource '{name}' is not registered") from None
+        return resource.get()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._resources
+
+    def warm_up(self, names: Optional[Iterable[str]] = None, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Load the named resources (all registered ones by default), in a daemon thread when
+        `background` is set. Failures are reported and left for the first real use to retry.
+        """
+        names = list(names) if names is not None else list(self._resources)
+
+        def run():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Warm-up of {name} failed: {e}")
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="resource-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def ready(self, names: Optional[Iterable[str]] = None) -> bool:
+        names = names if names is not None else self._resources
+        return all(self._resources[n].loaded for n in names)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "loaded": r.loaded,
+                "load_seconds": round(r.load_seconds, 3) if r.load_seconds is not None else None,
+                "error": r.error,
+            }
+            for name, r in self._resources.items()
+        }
+
+
+# Shared registry
+resources = ResourceRegistry()
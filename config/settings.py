@@ -23,4 +23,65 @@ GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
 # Google API key for embeddings
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
+# Query embedding cache (set the file to keep cached embeddings across restarts)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+QUERY_EMBEDDING_CACHE_FILE = os.getenv("QUERY_EMBEDDING_CACHE_FILE")
+
+# Document index, texts and passage map of Task 1
+FAISS_DIR = os.getenv("FAISS_DIR", os.path.join(MAIN_DIR, "document_ai", "faiss"))
+
+# FAISS index backend: "auto" (picked by corpus size), "flat", "ivf_flat", "ivf_pq", "hnsw",
+# the compressed "sq_fp16", "ivf_sq_fp16", "pq", or any faiss.index_factory string;
+# nprobe / efSearch trade recall for latency
+FAISS_INDEX_SPEC = os.getenv("FAISS_INDEX_SPEC", "auto")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# Compressed indexes: re-rank k * FAISS_RERANK_K_FACTOR candidates by exact distance
+# from the full-precision vectors kept on disk (0 = return the compressed ranking as is)
+FAISS_RERANK_K_FACTOR = int(os.getenv("FAISS_RERANK_K_FACTOR", "4"))
+
+# RAG API request path: threads for embedding/FAISS work and the Gemini per-request timeout
+RAG_CPU_WORKERS = int(os.getenv("RAG_CPU_WORKERS", str(os.cpu_count() or 4)))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))
+
+# Threads running coalesced query batches (document and summary search)
+QUERY_BATCH_WORKERS = int(os.getenv("QUERY_BATCH_WORKERS", str(min(4, max(2, os.cpu_count() or 2)))))
+
+# Context assembly for "all summaries" questions: summaries within CONTEXT_MAX_DISTANCE (squared L2
+# between unit embeddings, 2 - 2*cosine) are packed into at most CONTEXT_TOKEN_BUDGET prompt tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+CONTEXT_MAX_DISTANCE = float(os.getenv("CONTEXT_MAX_DISTANCE", "1.4"))
+CONTEXT_MIN_RECORDS = int(os.getenv("CONTEXT_MIN_RECORDS", "3"))
+
+# Embedding backend: "sentence-transformers" (PyTorch) or "onnx" (onnxruntime on an exported model,
+# see document_ai/faiss_encode/onnx_export.py); EMBED_ONNX_THREADS=0 lets onnxruntime decide
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "sentence-transformers").lower()
+EMBED_ONNX_MODEL_DIR = os.getenv("EMBED_ONNX_MODEL_DIR", os.path.join(MAIN_DIR, "models", "all-MiniLM-L6-v2-onnx"))
+EMBED_ONNX_QUANTIZED = os.getenv("EMBED_ONNX_QUANTIZED", "true").lower() in ("1", "true", "yes")
+EMBED_ONNX_THREADS = int(os.getenv("EMBED_ONNX_THREADS", "0"))
+
+# Load the embedding model and indexes in the background right after the servers start
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# Per-request sampling profiler: with PROFILER_ENABLED, a request sending the PROFILER_HEADER header
+# (e.g. "X-Profile: 1") is sampled every PROFILER_INTERVAL_MS and, if it took PROFILER_MIN_SECONDS
+# or longer, its folded stacks (flame graph input) are written to PROFILER_DIR
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_HEADER = os.getenv("PROFILER_HEADER", "X-Profile")
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_MIN_SECONDS = float(os.getenv("PROFILER_MIN_SECONDS", "1.0"))
+PROFILER_DIR = os.getenv("PROFILER_DIR", os.path.join(MAIN_DIR, "profiles"))
+
+# Processes parsing Document AI output JSON during batch ingestion (0 parses on the download threads)
+DOCAI_PARSE_PROCESSES = int(os.getenv("DOCAI_PARSE_PROCESSES", str(min(4, max(1, (os.cpu_count() or 2) // 2)))))
+
+# Background batch jobs (POST /process/batch): job state files, jobs run at once, how often a
+# running job saves the index and records its progress, and whether unfinished jobs resume at startup
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(MAIN_DIR, "jobs"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_CHECKPOINT_SECONDS = float(os.getenv("JOB_CHECKPOINT_SECONDS", "300"))
+JOBS_RESUME_ON_STARTUP = os.getenv("JOBS_RESUME_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# Only export the credential path when it is set (the client libraries fall back to ADC otherwise)
+if GOOGLE_APPLICATION_CREDENTIALS:
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = GOOGLE_APPLICATION_CREDENTIALS
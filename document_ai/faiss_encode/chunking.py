@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# all-MiniLM-L6-v2 truncates input at 256 word pieces including [CLS] and [SEP], so passages
+# are sized in the model's own tokens and overlap so text near a cut is embedded whole once
+PASSAGE_MAX_TOKENS = 254
+PASSAGE_OVERLAP_TOKENS = 48
+# Without a tokenizer (e.g. test fakes) passages are sized in characters instead;
+# OCR text with names, numbers and codes averages well under 4 characters per token
+PASSAGE_MAX_CHARS = 600
+PASSAGE_OVERLAP_CHARS = 120
+
+# (start, end) character span of every token of a text
+TokenSpans = Callable[[str], List[Tuple[int, int]]]
+
+# A cut is moved back to whitespace if one is this close to the window end
+BREAK_SEARCH_CHARS = 200
+
+
+@dataclass
+class Passage:
+    """A span [start, end) of a document's text, on page `page` (0 when pages are unknown)."""
+    start: int
+    end: int
+    page: int = 0
+
+
+def _split_span(text: str, start: int, end: int, page: int, max_chars: int, overlap: int) -> List[Passage]:
+    passages = []
+    pos = start
+    while pos < end:
+        stop = min(pos + max_chars, end)
+        if stop < end:
+            # Prefer to cut at a line break, then at any whitespace
+            floor = max(stop - BREAK_SEARCH_CHARS, pos + 1)
+            cut = text.rfind("\n", floor, stop)
+            if cut < 0:
+                cut = max(text.rfind(" ", floor, stop), text.rfind("\t", floor, stop))
+            if cut > pos:
+                stop = cut
+        if text[pos:stop].strip():
+            passages.append(Passage(pos, stop, page))
+        if stop >= end:
+            break
+        pos = max(stop - overlap, pos + 1)
+    return passages
+
+
+def _split_span_tokens(
+    text: str, start: int, end: int, page: int, token_spans: TokenSpans, max_tokens: int, overlap: int
+) -> List[Passage]:
+    """Like _split_span, with windows of at most `max_tokens` tokens overlapping by `overlap`."""
+    spans = [(start + a, start + b) for a, b in token_spans(text[start:end])]
+    if len(spans) <= max_tokens:
+        return [Passage(start, end, page)] if text[start:end].strip() else []
+
+    starts = [a for a, _ in spans]
+    passages = []
+    first = 0
+    while first < len(spans):
+        last = min(first + max_tokens, len(spans))  # tokens [first, last)
+        pos = start if first == 0 else spans[first][0]
+        stop = end if last == len(spans) else spans[last - 1][1]
+        if last < len(spans):
+            # Prefer to cut at a line break, then at any whitespace, near the window end
+            floor = max(stop - BREAK_SEARCH_CHARS, pos + 1)
+            cut = text.rfind("\n", floor, stop)
+            if cut < 0:
+                cut = max(text.rfind(" ", floor, stop), text.rfind("\t", floor, stop))
+            if cut > pos:
+                stop = cut
+                last = max(bisect_left(starts, cut), first + 1)
+        if text[pos:stop].strip():
+            passages.append(Passage(pos, stop, page))
+        if last >= len(spans):
+            break
+        first = max(last - overlap, first + 1)
+    return passages
+
+
+def split_passages(
+    text: str,
+    page_spans: Optional[Sequence[Tuple[int, int]]] = None,
+    page_numbers: Optional[Sequence[int]] = None,
+    max_chars: int = PASSAGE_MAX_CHARS,
+    overlap: int = PASSAGE_OVERLAP_CHARS,
+    token_spans: Optional[TokenSpans] = None,
+    max_tokens: int = PASSAGE_MAX_TOKENS,
+    overlap_tokens: int = PASSAGE_OVERLAP_TOKENS,
+) -> List[Passage]:
+    """
+    Split a document into overlapping passages of at most `max_tokens` tokens of the
+    embedding model, as counted by `token_spans` (see embedding.passage_token_spans), so
+    no passage is truncated when embedded. Without `token_spans` passages are at most
+    `max_chars` characters.
+    With `page_spans` (one (start, end) character range per page, in page order) passages
+    never cross a page boundary and carry their page number (from `page_numbers`, else the
+    1-based position of the span). A short document is a single passage, so it costs
+    one embedding as before.
+    """
+    if token_spans is not None:
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+        def split(start: int, end: int, page: int) -> List[Passage]:
+            return _split_span_tokens(text, start, end, page, token_spans, max_tokens, overlap_tokens)
+    else:
+        if overlap >= max_chars:
+            raise ValueError("overlap must be smaller than max_chars")
+
+        def split(start: int, end: int, page: int) -> List[Passage]:
+            return _split_span(text, start, end, page, max_chars, overlap)
+
+    if not page_spans:
+        return split(0, len(text), 0)
+
+    passages = []
+    if not page_numbers or len(page_numbers) != len(page_spans):
+        page_numbers = range(1, len(page_spans) + 1)
+    for page, (start, end) in zip(page_numbers, page_spans):
+        start, end = max(0, start), min(len(text), end)
+        if start < end:
+            passages.extend(split(start, end, page))
+    return passages
@@ -0,0 +1,169 @@
+import os
+import threading
+from typing import Callable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from config.resources import resources
+from config.settings import EMBED_BACKEND, EMBED_ONNX_MODEL_DIR, EMBED_ONNX_QUANTIZED, EMBED_ONNX_THREADS
+
+# Embedding model shared by document search, the summary index and query caching
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_DIM = 384
+EMBED_MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2's max_seq_length
+
+# Files written by onnx_export.py
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+class OnnxEmbedder:
+    """
+    all-MiniLM-L6-v2 on onnxruntime: the exported transformer followed by the same mean
+    pooling and L2 normalization as the SentenceTransformer pipeline, so vectors stay
+    compatible with indexes built by the PyTorch backend. encode() takes the arguments
+    our code passes to SentenceTransformer.encode().
+    """
+
+    def __init__(
+        self,
+        model_dir: str = EMBED_ONNX_MODEL_DIR,
+        quantized: bool = EMBED_ONNX_QUANTIZED,
+        threads: int = EMBED_ONNX_THREADS,
+        max_seq_length: int = EMBED_MAX_SEQ_LENGTH,
+    ):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(
+                "The onnx embedding backend needs onnxruntime and tokenizers: pip install onnxruntime tokenizers"
+            ) from e
+
+        model_file = os.path.join(model_dir, ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(
+                f"{model_file} not found. Export it with: python -m document_ai.faiss_encode.onnx_export --out {model_dir}"
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.model_file = model_file
+
+        self.max_seq_length = max_seq_length
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+        # Check the output width on a probe sentence, not the (symbolic) graph shape
+        dim = self._encode_batch(["dimension probe"]).shape[1]
+        if dim != EMBED_DIM:
+            raise ValueError(f"{model_file} produces {dim}-dimensional vectors; existing indexes use {EMBED_DIM}")
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then L2 normalization
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        **kwargs,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, EMBED_DIM), dtype=np.float32)
+
+        # Longest first so each batch pads to similar lengths (as SentenceTransformer does)
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        vectors = np.zeros((len(texts), EMBED_DIM), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            vectors[rows] = self._encode_batch([texts[i] for i in rows])
+        return vectors[0] if single else vectors
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return EMBED_DIM
+
+
+def load_embed_model(backend: str = EMBED_BACKEND):
+    """Create the embedding model for `backend` ("sentence-transformers" or "onnx")."""
+    if backend == "onnx":
+        return OnnxEmbedder()
+    if backend in ("sentence-transformers", "torch"):
+        # Imported here: sentence_transformers pulls in torch, which takes seconds to import
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(EMBED_MODEL_NAME)
+    raise ValueError(f"Unknown EMBED_BACKEND '{backend}' (use 'sentence-transformers' or 'onnx')")
+
+
+def embed_model_key(backend: str = EMBED_BACKEND) -> str:
+    """Name that cached embeddings are stored under; backends differ slightly, so they don't share entries."""
+    if backend == "onnx":
+        return f"{EMBED_MODEL_NAME}:onnx{'-int8' if EMBED_ONNX_QUANTIZED else ''}"
+    return EMBED_MODEL_NAME
+
+
+resources.register("embed_model", load_embed_model)
+
+# Untruncated tokenizers for passage sizing, per model: id(model) -> (model, token_spans)
+_token_spans: dict = {}
+_token_spans_lock = threading.Lock()
+
+
+def passage_token_spans(model) -> Optional[Callable[[str], List[Tuple[int, int]]]]:
+    """
+    Function giving the (start, end) character span of every word piece `model` reads from
+    a text (no special tokens, nothing truncated), for sizing passages in the model's own
+    tokens. None for models without a fast tokenizer (e.g. test fakes).
+    """
+    tokenizer = getattr(model, "tokenizer", None)
+    tokenizer = getattr(tokenizer, "backend_tokenizer", tokenizer)  # transformers wraps a tokenizers.Tokenizer
+    if tokenizer is None or not hasattr(tokenizer, "to_str"):
+        return None
+    with _token_spans_lock:
+        cached = _token_spans.get(id(model))
+        if cached is None or cached[0] is not model:
+            from tokenizers import Tokenizer
+
+            untruncated = Tokenizer.from_str(tokenizer.to_str())
+            untruncated.no_truncation()
+            untruncated.no_padding()
+
+            def token_spans(text: str) -> List[Tuple[int, int]]:
+                return untruncated.encode(text, add_special_tokens=False).offsets
+
+            cached = _token_spans[id(model)] = (model, token_spans)
+    return cached[1]
+
+
+def passage_max_tokens(model) -> int:
+    """Word pieces a passage may hold so `model` embeds all of it (max_seq_length less [CLS] and [SEP])."""
+    return int(getattr(model, "max_seq_length", None) or EMBED_MAX_SEQ_LENGTH) - 2
+
+
+def get_embed_model():
+    """The shared embedding model, loaded on first use (or by resources.warm_up())."""
+    return resources.get("embed_model")
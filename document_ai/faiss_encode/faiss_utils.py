@@ -1,57 +1,178 @@
 import os
+from typing import List, Optional, Sequence, Tuple
+
 import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from config.resources import resources
+from config.metrics import stage, count
+from config.settings import FAISS_DIR
+from document_ai.faiss_encode.embedding import EMBED_DIM, get_embed_model, passage_token_spans, passage_max_tokens
+from document_ai.faiss_encode.text_store import TextStore
+from document_ai.faiss_encode.passage_map import PassageMap
+from document_ai.faiss_encode.chunking import split_passages
+from document_ai.faiss_encode.index_factory import apply_search_params, maybe_upgrade_index, is_compressed
+from document_ai.faiss_encode.rerank import VectorFile, with_rerank, unwrap
 
 # ----------------- Settings -----------------
-FAISS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "faiss")
+FAISS_FOLDER = FAISS_DIR
 FAISS_INDEX_FILE = os.path.join(FAISS_FOLDER, "document_embeddings.index")
-TEXTS_FILE = os.path.join(FAISS_FOLDER, "texts.npy")
+TEXTS_FILE = os.path.join(FAISS_FOLDER, "texts.dat")
+TEXT_OFFSETS_FILE = os.path.join(FAISS_FOLDER, "texts.idx")
+LEGACY_TEXTS_FILE = os.path.join(FAISS_FOLDER, "texts.npy")
+PASSAGES_FILE = os.path.join(FAISS_FOLDER, "passages.idx")
+VECTORS_FILE = os.path.join(FAISS_FOLDER, "document_vectors.f32")
 os.makedirs(FAISS_FOLDER, exist_ok=True)
 
-# Load embedding model
-embed_model = SentenceTransformer("all-MiniLM-L6-v2")
+# Passages per SentenceTransformer.encode() call during ingestion
+EMBED_BATCH_SIZE = 64
+
+# Read a saved index with its vectors memory-mapped (saves replace the file, never modify it)
+FAISS_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
 
 # ----------------- Load or Initialize -----------------
-# Load FAISS index
-def create_or_load_faiss_index(dim: int = 384):
+# Load FAISS index (a compressed index is wrapped to re-rank from the full-precision vectors)
+def create_or_load_faiss_index(dim: int = EMBED_DIM):
+    _ensure_passage_map()
     if os.path.exists(FAISS_INDEX_FILE):
-        index = faiss.read_index(FAISS_INDEX_FILE)
+        index = apply_search_params(faiss.read_index(FAISS_INDEX_FILE))
         print("Loaded existing FAISS index.")
     else:
         index = faiss.IndexFlatL2(dim)
         print("Created new FAISS index.")
-    return index
+    return with_rerank(index, document_vectors)
 
-# Load stored texts
-if os.path.exists(TEXTS_FILE):
-    stored_texts = list(np.load(TEXTS_FILE, allow_pickle=True))
-else:
-    stored_texts = []
+# Open the text store (texts are read by id, never loaded all at once)
+text_store = TextStore(TEXTS_FILE, TEXT_OFFSETS_FILE, legacy_file=LEGACY_TEXTS_FILE)
 
-# ----------------- Functions -----------------
-def add_text_to_faiss(text: str, index=None):
-    """Add a text to FAISS index and store the text."""
-    global stored_texts
+def _migrated_text_store():
+    text_store.ensure_migrated()
+    return text_store
 
-    if not text.strip():
-        return index
+# Warming this up migrates a legacy texts.npy in the background instead of on the first request
+resources.register("text_store", _migrated_text_store)
+
+# Vectors are passages of the stored texts; this maps each vector id to its text and span
+passage_map = PassageMap(PASSAGES_FILE)
+
+# Full-precision copy of every vector (row = vector id), read only to re-rank compressed indexes
+document_vectors = VectorFile(VECTORS_FILE, EMBED_DIM)
+
+
+def _ensure_passage_map():
+    if len(passage_map) == 0 and len(text_store) > 0:
+        passage_map.migrate_whole_documents(text_store)
+
+
+def _sync_document_vectors(index) -> bool:
+    """
+    Line the full-precision vectors up with the index: drop rows appended after the last
+    save and backfill missing ones from an index that stores exact vectors. Returns False
+    when they can't be completed (a compressed index built before the vectors were kept).
+    """
+    index = unwrap(index)
+    if len(document_vectors) > index.ntotal:
+        document_vectors.truncate(index.ntotal)
+    if len(document_vectors) < index.ntotal:
+        if is_compressed(index):
+            return False
+        start = len(document_vectors)
+        try:
+            document_vectors.append(index.reconstruct_n(start, index.ntotal - start))
+        except RuntimeError:
+            return False  # e.g. an IVF index without a direct map
+    return True
+
+
+# The search API's index, loaded on first use (or by resources.warm_up())
+resources.register("document_index", create_or_load_faiss_index)
+
+# ----------------- Functions -----------------
+def add_texts_to_faiss(
+    texts: List[str],
+    index=None,
+    batch_size: int = EMBED_BATCH_SIZE,
+    page_spans: Optional[List[Sequence[Tuple[int, int]]]] = None,
+    page_numbers: Optional[List[Sequence[int]]] = None,
+):
+    """
+    Add many texts to the FAISS index in one step and store them (made durable by save_faiss_index).
+    Each text is split into overlapping passages (on its page boundaries when `page_spans`
+    gives them) and one vector is added per passage; passages are encoded `batch_size`
+    at a time. Empty texts are skipped.
+    """
+    page_spans = page_spans or [None] * len(texts)
+    page_numbers = page_numbers or [None] * len(texts)
+    docs = [(t, spans, pages) for t, spans, pages in zip(texts, page_spans, page_numbers) if t.strip()]
 
     if index is None:
         index = create_or_load_faiss_index()
+    if not docs:
+        return index
+    if len(passage_map) > index.ntotal:
+        # Passages appended after the last saved index (e.g. a crash before save_faiss_index)
+        passage_map.truncate(index.ntotal)
+    if index.ntotal != len(passage_map):
+        raise RuntimeError(
+            f"FAISS index has {index.ntotal} vectors but the passage map has {len(passage_map)} entries"
+        )
 
-    # Encode text and add to FAISS
-    vector = embed_model.encode([text], convert_to_numpy=True)
-    index.add(vector)
+    # Store texts under document ids, then split them into passages
+    model = get_embed_model()
+    token_spans, max_tokens = passage_token_spans(model), passage_max_tokens(model)
+    with stage("store_texts"):
+        doc_ids = text_store.extend(t for t, _, _ in docs)
+        passages, entries = [], []
+        for doc_id, (text, spans, pages) in zip(doc_ids, docs):
+            for p in split_passages(text, spans, pages, token_spans=token_spans, max_tokens=max_tokens):
+                passages.append(text[p.start:p.end])
+                entries.append((doc_id, p.start, p.end, p.page))
 
-    # Store text for retrieval
-    stored_texts.append(text)
-    np.save(TEXTS_FILE, np.array(stored_texts, dtype=object))
+    # Encode all passages and add to FAISS; vector ids follow passage map order
+    with stage("embed"):
+        vectors = model.encode(passages, batch_size=batch_size, convert_to_numpy=True)
+    with stage("faiss_add"):
+        keep_vectors = _sync_document_vectors(index)
+        index.add(vectors)
+        passage_map.extend(entries)
+        if keep_vectors:
+            document_vectors.append(vectors)
+    count("documents", len(docs))
+    count("passages", len(passages))
 
     return index
 
+def add_text_to_faiss(text: str, index=None):
+    """Add a text to FAISS index and store the text (made durable by save_faiss_index)."""
+    if not text.strip():
+        return index
+    return add_texts_to_faiss([text], index=index)
+
+def open_saved_faiss_index():
+    """
+    The index as last saved, read-only for searching while the writer's copy keeps growing.
+    Its vectors are memory-mapped from the file, so opening it costs little at any size.
+    """
+    index = apply_search_params(faiss.read_index(FAISS_INDEX_FILE, FAISS_MMAP_FLAGS))
+    return with_rerank(index, document_vectors)
+
 def save_faiss_index(index):
-    """Save FAISS index to disk."""
-    faiss.write_index(index, FAISS_INDEX_FILE)
-    np.save(TEXTS_FILE, np.array(stored_texts, dtype=object))
+    """
+    Save FAISS index to disk and fsync the texts, passages and full-precision vectors
+    appended since the last save. A flat index that has outgrown brute-force search is
+    first converted to the backend FAISS_INDEX_SPEC selects; the (possibly new) index is
+    returned, wrapped for re-ranking when it is compressed.
+    """
+    with stage("save_index"):
+        index = unwrap(index)
+        _sync_document_vectors(index)  # before a flat index is converted and its exact vectors are gone
+        index = maybe_upgrade_index(index)
+        # The stores are made durable first, so the saved index never refers to passages,
+        # texts or vectors that a crash could still lose
+        text_store.sync()
+        passage_map.sync()
+        document_vectors.sync()
+        # Written aside and renamed, so a crash mid-write leaves the previous index intact
+        faiss.write_index(index, FAISS_INDEX_FILE + ".tmp")
+        os.replace(FAISS_INDEX_FILE + ".tmp", FAISS_INDEX_FILE)
     print(f"FAISS index saved to {FAISS_INDEX_FILE} and texts saved to {TEXTS_FILE}")
+    return with_rerank(index, document_vectors)
@@ -0,0 +1,187 @@
+import math
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from config.settings import FAISS_INDEX_SPEC, FAISS_NPROBE, FAISS_EF_SEARCH
+
+# Corpus sizes at which "auto" switches backend
+AUTO_HNSW_MIN_VECTORS = 10_000
+AUTO_IVF_MIN_VECTORS = 100_000
+AUTO_PQ_MIN_VECTORS = 1_000_000
+
+# IVF needs this many training points per list for stable centroids
+TRAIN_POINTS_PER_LIST = 39
+MAX_TRAIN_POINTS_PER_LIST = 256
+# PQ codebooks have 256 centroids per sub-quantizer
+PQ_MIN_TRAIN_VECTORS = 256
+PQ_MAX_TRAIN_VECTORS = 65_536
+
+
+def ivf_nlist(n_vectors: int) -> int:
+    """Number of inverted lists for n vectors: ~4 * sqrt(n), capped so there is enough training data."""
+    return max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // TRAIN_POINTS_PER_LIST))
+
+
+def pq_subquantizers(dim: int) -> int:
+    """Largest of 48/32/16/8 sub-quantizers that divides dim (384 -> 48, i.e. 8 dims per code)."""
+    for m in (48, 32, 16, 8):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def resolve_index_spec(spec: str, n_vectors: int, dim: int) -> str:
+    """
+    Turn a backend name ("flat", "ivf_flat", "ivf_pq", "hnsw", "auto", or the compressed
+    "sq_fp16" / "pq" / "ivf_sq_fp16") or a raw faiss factory string into a factory string
+    for a corpus of n_vectors.
+    """
+    spec = (spec or "auto").strip()
+    name = spec.lower()
+
+    if name == "auto":
+        if n_vectors < AUTO_HNSW_MIN_VECTORS:
+            name = "flat"
+        elif n_vectors < AUTO_IVF_MIN_VECTORS:
+            name = "hnsw"
+        elif n_vectors < AUTO_PQ_MIN_VECTORS:
+            name = "ivf_flat"
+        else:
+            name = "ivf_pq"
+
+    if name == "flat":
+        return "Flat"
+    if name == "hnsw":
+        return "HNSW32,Flat"
+    if name == "ivf_flat":
+        return f"IVF{ivf_nlist(n_vectors)},Flat"
+    if name == "ivf_pq":
+        return f"IVF{ivf_nlist(n_vectors)},PQ{pq_subquantizers(dim)}x8"
+    # Compressed codes: 2 bytes per dimension (fp16) or one byte per sub-quantizer (PQ)
+    if name == "sq_fp16":
+        return "SQfp16"
+    if name == "ivf_sq_fp16":
+        return f"IVF{ivf_nlist(n_vectors)},SQfp16"
+    if name == "pq":
+        return f"PQ{pq_subquantizers(dim)}x8"
+    return spec
+
+
+def is_flat(index: faiss.Index) -> bool:
+    """True for a plain brute-force index (optionally wrapped in an id map)."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+
+def is_compressed(index: faiss.Index) -> bool:
+    """True when the index stores lossy codes (scalar / product quantized) rather than exact vectors."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        return not isinstance(index, faiss.IndexIVFFlat)
+    if isinstance(index, faiss.IndexHNSW):
+        return not isinstance(faiss.downcast_index(index.storage), faiss.IndexFlat)
+    return isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexPQ))
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    """HNSW graphs can't delete vectors; flat and IVF indexes can."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return not isinstance(faiss.downcast_index(index), faiss.IndexHNSW)
+
+
+def apply_search_params(index: faiss.Index, nprobe: int = FAISS_NPROBE, ef_search: int = FAISS_EF_SEARCH):
+    """Set nprobe (IVF) / efSearch (HNSW) on indexes that have them; no-op otherwise."""
+    ps = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            ps.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # parameter doesn't apply to this index type
+    return index
+
+
+def selector_params(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """
+    Search parameters restricting a search to the ids `selector` accepts, carrying over the
+    index's current nprobe / efSearch (per-call parameters replace the index settings).
+    """
+    inner = index
+    if isinstance(inner, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        inner = faiss.downcast_index(inner.index)  # the id map translates the selector itself
+    inner = faiss.downcast_index(inner)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def create_index(
+    vectors: Optional[np.ndarray],
+    dim: int,
+    spec: str = FAISS_INDEX_SPEC,
+    with_ids: bool = False,
+) -> faiss.Index:
+    """
+    Create an empty index for `dim`-dimensional vectors and train it if the type needs it.
+    `vectors` is the data the index is built for: it sizes "auto" and serves as training
+    data. It is not added to the index. With `with_ids=True` the index is wrapped in an
+    IndexIDMap2 so vectors can be added with explicit ids.
+    """
+    n_vectors = 0 if vectors is None else len(vectors)
+    factory = resolve_index_spec(spec, n_vectors, dim)
+    if with_ids:
+        factory = f"IDMap2,{factory}"
+    index = faiss.index_factory(dim, factory)
+
+    if not index.is_trained:
+        try:
+            nlist = faiss.extract_index_ivf(index).nlist
+            needed, max_train = nlist * TRAIN_POINTS_PER_LIST, nlist * MAX_TRAIN_POINTS_PER_LIST
+        except RuntimeError:
+            # not IVF: a PQ codebook
+            needed, max_train = PQ_MIN_TRAIN_VECTORS, PQ_MAX_TRAIN_VECTORS
+        if n_vectors < needed:
+            raise ValueError(
+                f"Index '{factory}' needs at least {needed} training vectors, got {n_vectors}. "
+                f"Use a smaller nlist, 'flat', 'sq_fp16' or 'auto'."
+            )
+        train = vectors
+        if n_vectors > max_train:
+            rng = np.random.default_rng(0)
+            train = vectors[rng.choice(n_vectors, size=max_train, replace=False)]
+        print(f"Training {factory} on {len(train)} vectors...")
+        index.train(np.ascontiguousarray(train, dtype=np.float32))
+
+    return apply_search_params(index)
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """All vectors of an index with exact storage (e.g. flat), in id order."""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def maybe_upgrade_index(index: faiss.Index, spec: str = FAISS_INDEX_SPEC) -> faiss.Index:
+    """
+    Re-create a flat, sequential-id index as the backend `spec` selects for its current size.
+    Only flat indexes are converted, since their stored vectors are exact; vector ids (positions)
+    are preserved. Returns the original index when no change is needed.
+    """
+    if not is_flat(index) or isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return index
+    if resolve_index_spec(spec, index.ntotal, index.d) == "Flat":
+        return index
+
+    vectors = reconstruct_all(index)
+    upgraded = create_index(vectors, index.d, spec)
+    upgraded.add(vectors)
+    print(f"Converted flat index with {index.ntotal} vectors to '{resolve_index_spec(spec, index.ntotal, index.d)}'.")
+    return upgraded
@@ -0,0 +1,77 @@
+"""
+Export all-MiniLM-L6-v2 to ONNX (plus an int8 dynamically quantized copy) for EMBED_BACKEND=onnx.
+
+    python -m document_ai.faiss_encode.onnx_export
+    python -m document_ai.faiss_encode.onnx_export --out models/all-MiniLM-L6-v2-onnx --no-quantize
+
+Needs torch and transformers (installed with sentence-transformers) and onnxruntime;
+serving the exported model only needs onnxruntime and tokenizers.
+"""
+import argparse
+import os
+
+from config.settings import EMBED_ONNX_MODEL_DIR
+from document_ai.faiss_encode.embedding import (
+    EMBED_MODEL_NAME,
+    ONNX_MODEL_FILE,
+    ONNX_INT8_MODEL_FILE,
+)
+
+HF_MODEL_ID = f"sentence-transformers/{EMBED_MODEL_NAME}"
+ONNX_OPSET = 14
+
+
+def export_onnx(out_dir: str = EMBED_ONNX_MODEL_DIR, quantize: bool = True) -> str:
+    """Write model.onnx, tokenizer.json and (with `quantize`) model_int8.onnx to out_dir."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_ID)
+    model = AutoModel.from_pretrained(HF_MODEL_ID).eval()
+
+    # The transformer only; mean pooling and normalization run in numpy (see OnnxEmbedder)
+    sample = tokenizer(["a sample sentence for tracing"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_path = os.path.join(out_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+        )
+    tokenizer.save_pretrained(out_dir)  # writes tokenizer.json
+    print(f"Exported {HF_MODEL_ID} to {model_path}")
+
+    if quantize:
+        quantize_onnx(model_path, os.path.join(out_dir, ONNX_INT8_MODEL_FILE))
+    return out_dir
+
+
+def quantize_onnx(model_path: str, out_path: str) -> str:
+    """int8 dynamic quantization of the weights (activations are quantized on the fly)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(model_path, out_path, weight_type=QuantType.QInt8)
+    size_mb = os.path.getsize(out_path) / 1e6
+    print(f"Quantized model written to {out_path} ({size_mb:.1f} MB)")
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=EMBED_ONNX_MODEL_DIR)
+    parser.add_argument("--no-quantize", action="store_true", help="skip the int8 copy")
+    args = parser.parse_args()
+    export_onnx(args.out, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
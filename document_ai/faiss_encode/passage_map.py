@@ -0,0 +1,128 @@
+import os
+import threading
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+# ----------------- Settings -----------------
+# One fixed-size record per passage vector: owning document id, character span and page
+PASSAGE_DTYPE = np.dtype([("doc", "<u8"), ("start", "<u8"), ("end", "<u8"), ("page", "<u4")])
+
+
+class PassageMap:
+    """
+    Append-only map from FAISS vector id (passage id) to the document it came from.
+    Record i in `passages.idx` describes vector i: the document id in the TextStore and
+    the [start, end) character span of the passage in that document's text.
+    The file is memory-mapped for reads and appended to like the TextStore.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.RLock()
+        self._fh = None
+        self._records = np.zeros(0, dtype=PASSAGE_DTYPE)
+        self._remap()
+
+    # ----------------- Reading -----------------
+    def _disk_count(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // PASSAGE_DTYPE.itemsize
+
+    def _remap(self):
+        count = self._disk_count()
+        if count == 0:
+            self._records = np.zeros(0, dtype=PASSAGE_DTYPE)
+            return
+        self._records = np.memmap(self.path, dtype=PASSAGE_DTYPE, mode="r", shape=(count,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._disk_count() != len(self._records):
+                self._remap()
+            return len(self._records)
+
+    def get(self, passage_id: int) -> Tuple[int, int, int, int]:
+        """Return (doc_id, start, end, page) of a passage."""
+        with self._lock:
+            if passage_id >= len(self._records):
+                self._remap()
+            if not 0 <= passage_id < len(self._records):
+                raise IndexError(f"Passage id {passage_id} out of range (map has {len(self._records)} passages)")
+            rec = self._records[passage_id]
+            return int(rec["doc"]), int(rec["start"]), int(rec["end"]), int(rec["page"])
+
+    # ----------------- Writing -----------------
+    def extend(self, entries: Iterable[Tuple[int, int, int, int]]) -> int:
+        """Append (doc_id, start, end, page) records; returns the number appended. Call sync() after the batch."""
+        records = np.array(list(entries), dtype=PASSAGE_DTYPE)
+        if not len(records):
+            return 0
+        with self._lock:
+            if self._fh is None:
+                # Drop a torn trailing record from an interrupted append
+                if os.path.exists(self.path):
+                    size = os.path.getsize(self.path)
+                    os.truncate(self.path, size - size % PASSAGE_DTYPE.itemsize)
+                self._fh = open(self.path, "ab")
+            self._fh.write(records.tobytes())
+            self._fh.flush()
+        return len(records)
+
+    def truncate(self, count: int):
+        """Drop records past `count`, e.g. passages whose vectors were never saved to the index."""
+        with self._lock:
+            self.close()
+            if self._disk_count() > count:
+                os.truncate(self.path, count * PASSAGE_DTYPE.itemsize)
+            self._remap()
+
+    def sync(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+
+    def close(self):
+        with self._lock:
+            self.sync()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    def migrate_whole_documents(self, texts) -> int:
+        """
+        One-off for indexes built before chunking, where vector i is the whole text i:
+        record every stored text as a single passage covering it.
+        """
+        count = self.extend((i, 0, len(texts[i]), 0) for i in range(len(texts)))
+        self.sync()
+        print(f"Mapped {count} existing document vector(s) to passages in {self.path}.")
+        return count
+
+
+def merge_passage_hits(
+    passage_map: PassageMap,
+    distances: Iterable[float],
+    passage_ids: Iterable[int],
+    top_k: int,
+) -> List[dict]:
+    """
+    Collapse passage hits (closest first) into document hits: a document ranks by its
+    closest passage and lists every matching passage. Returns at most `top_k` documents.
+    """
+    docs = {}
+    count = len(passage_map)
+    for dist, pid in zip(distances, passage_ids):
+        if pid < 0 or pid >= count:
+            continue
+        doc_id, start, end, page = passage_map.get(int(pid))
+        hit = docs.get(doc_id)
+        if hit is None:
+            if len(docs) >= top_k:
+                continue
+            hit = docs[doc_id] = {"doc_id": doc_id, "distance": float(dist), "passages": []}
+        hit["passages"].append({"start": start, "end": end, "page": page, "distance": float(dist)})
+    return list(docs.values())
@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from config.metrics import Trace, current_trace, record, stage
+from config.settings import QUERY_BATCH_WORKERS
+
+# Coalescing window: a batch is closed when it is full or this long after its first query
+# (a query arriving while nothing else is pending is dispatched at once)
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 2.0
+
+
+@dataclass
+class _PendingQuery:
+    query: str
+    top_k: int
+    index: faiss.Index
+    future: Future = field(default_factory=Future)
+    # Request the query belongs to: batch stage times are recorded into it
+    trace: Optional[Trace] = field(default_factory=current_trace)
+    submitted: float = field(default_factory=time.perf_counter)
+
+
+class QueryBatcher:
+    """
+    Coalesces concurrent searches into batches.
+    Queries submitted within `max_wait_ms` of each other (up to `max_batch_size`) are encoded
+    with one `encode` call and run through one `index.search` call per index; each caller
+    gets back only its own (distances, ids) row, trimmed to its top_k. A query that finds
+    nothing else pending is dispatched straight away instead of waiting out the window.
+    `workers` threads take batches from the queue, so a slow batch doesn't hold up the next.
+    `encode` takes a list of query strings and returns a 2-D float32 array.
+    Queue wait, encode and search times are recorded as stages of every request in the batch.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        workers: int = QUERY_BATCH_WORKERS,
+    ):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.workers = max(1, workers)
+
+        self._queue: "queue.Queue[_PendingQuery]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"query-batcher-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # ----------------- Public API -----------------
+    def submit(self, query: str, top_k: int, index: faiss.Index) -> Future:
+        """Queue one search; the future resolves to (distances, ids), each of length top_k."""
+        self._ensure_workers()
+        pending = _PendingQuery(query=query, top_k=max(1, top_k), index=index)
+        self._queue.put(pending)
+        return pending.future
+
+    def search(self, query: str, top_k: int, index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+        return self.submit(query, top_k, index).result()
+
+    def search_many(self, queries: List[str], top_k: int, index: faiss.Index) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Search several queries; they are queued together so they share batches."""
+        futures = [self.submit(q, top_k, index) for q in queries]
+        return [f.result() for f in futures]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+    # ----------------- Worker -----------------
+    def _collect(self) -> List[_PendingQuery]:
+        batch = [self._queue.get()]
+        if self._queue.empty():
+            return batch  # idle: nothing to coalesce with, so don't wait for company
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self._process(batch)
+
+    def _process(self, batch: List[_PendingQuery]):
+        with self._stats_lock:
+            self.batches += 1
+            self.queries += len(batch)
+        now = time.perf_counter()
+        for p in batch:
+            record("queue_wait", now - p.submitted, [p.trace])
+        try:
+            with stage("embed", [p.trace for p in batch]):
+                vectors = np.ascontiguousarray(self.encode([p.query for p in batch]), dtype=np.float32)
+        except Exception as e:
+            for p in batch:
+                p.future.set_exception(e)
+            return
+
+        # One search per distinct index (e.g. old and new summary snapshots during a reload)
+        groups: Dict[int, List[int]] = {}
+        for row, p in enumerate(batch):
+            groups.setdefault(id(p.index), []).append(row)
+
+        for rows in groups.values():
+            index = batch[rows[0]].index
+            k = max(batch[r].top_k for r in rows)
+            try:
+                with stage("faiss_search", [batch[r].trace for r in rows]):
+                    distances, ids = index.search(vectors[rows], k)
+            except Exception as e:
+                for r in rows:
+                    batch[r].future.set_exception(e)
+                continue
+            for i, r in enumerate(rows):
+                top_k = batch[r].top_k
+                batch[r].future.set_result((distances[i, :top_k], ids[i, :top_k]))
@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import QUERY_EMBEDDING_CACHE_FILE, QUERY_EMBEDDING_CACHE_SIZE
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used as the cache key."""
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    LRU cache of query embeddings keyed by (model name, normalized query text).
+    Holds at most `max_entries` vectors in memory. When `disk_path` is set, vectors are
+    also written to a small SQLite file so a restarted process starts warm.
+    """
+
+    def __init__(self, max_entries: int = 1024, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT, query TEXT, vector BLOB, PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    # ----------------- Memory + disk tiers -----------------
+    def _get(self, key: Tuple[str, str]) -> Optional[np.ndarray]:
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+            return vector
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?", key
+            ).fetchone()
+            if row is not None:
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, vector)
+                return vector
+        return None
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _put(self, key: Tuple[str, str], vector: np.ndarray):
+        self._remember(key, vector)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, query, vector) VALUES (?, ?, ?)",
+                (key[0], key[1], vector.astype(np.float32).tobytes()),
+            )
+
+    # ----------------- Public API -----------------
+    def encode(self, model, queries: List[str], model_name: str = DEFAULT_MODEL_NAME) -> np.ndarray:
+        """
+        Drop-in for model.encode(queries, convert_to_numpy=True).
+        Cached queries are served from the cache; the rest are encoded in one call.
+        """
+        keys = [(model_name, normalize_query(q)) for q in queries]
+        vectors: List[Optional[np.ndarray]] = [None] * len(queries)
+        missing: Dict[Tuple[str, str], List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._get(key)
+                if vector is not None:
+                    vectors[i] = vector
+                    self.hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+                    self.misses += 1
+
+        if missing:
+            # Encode the normalized text so a cached vector never depends on which
+            # spelling of the query came first (MiniLM is uncased anyway)
+            texts = [key[1] for key in missing]
+            encoded = np.asarray(model.encode(texts, convert_to_numpy=True), dtype=np.float32)
+            with self._lock:
+                for (key, positions), vector in zip(missing.items(), encoded):
+                    self._put(key, vector)
+                    for i in positions:
+                        vectors[i] = vector
+                if self._db is not None:
+                    self._db.commit()
+
+        return np.stack(vectors).astype(np.float32, copy=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+
+
+# Shared cache used by both /search (main.py) and the summary search (rag_agent)
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=QUERY_EMBEDDING_CACHE_SIZE,
+    disk_path=QUERY_EMBEDDING_CACHE_FILE,
+)
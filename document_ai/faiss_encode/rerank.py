@@ -0,0 +1,187 @@
+import os
+import threading
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from config.settings import FAISS_RERANK_K_FACTOR
+
+VECTOR_DTYPE = np.dtype("<f4")
+
+
+class VectorFile:
+    """
+    Full-precision float32 vectors on disk, row i holding the vector with id i, so a
+    compressed index can keep its exact vectors out of memory. The file is raw rows
+    (no header); reads go through a memory map and touch only the rows asked for.
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._row_bytes = dim * VECTOR_DTYPE.itemsize
+        self._lock = threading.RLock()
+        self._fh = None
+        self._rows = np.zeros((0, dim), dtype=VECTOR_DTYPE)
+        self._remap()
+
+    def _disk_count(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // self._row_bytes
+
+    def _remap(self):
+        count = self._disk_count()
+        if count == 0:
+            self._rows = np.zeros((0, self.dim), dtype=VECTOR_DTYPE)
+            return
+        self._rows = np.memmap(self.path, dtype=VECTOR_DTYPE, mode="r", shape=(count, self.dim))
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._disk_count() != len(self._rows):
+                self._remap()
+            return len(self._rows)
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        """Rows for `ids` (all must be < len(self))."""
+        with self._lock:
+            if len(ids) and int(ids.max()) >= len(self._rows):
+                self._remap()
+            return np.asarray(self._rows[ids])
+
+    def append(self, vectors: np.ndarray):
+        """Append rows (ids continue from len(self)). Call sync() once the batch is complete."""
+        vectors = np.ascontiguousarray(vectors, dtype=VECTOR_DTYPE).reshape(-1, self.dim)
+        with self._lock:
+            if self._fh is None:
+                # Drop a torn trailing row from an interrupted append
+                if os.path.exists(self.path):
+                    size = os.path.getsize(self.path)
+                    os.truncate(self.path, size - size % self._row_bytes)
+                self._fh = open(self.path, "ab")
+            self._fh.write(vectors.tobytes())
+            self._fh.flush()
+
+    def truncate(self, count: int):
+        with self._lock:
+            self.close()
+            if self._disk_count() > count:
+                os.truncate(self.path, count * self._row_bytes)
+            self._remap()
+
+    def sync(self):
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+
+    def close(self):
+        with self._lock:
+            self.sync()
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class MappedVectors:
+    """
+    Read-only view of a vector file as it was when opened (rows appended or a file
+    replaced later aren't seen, so a reader keeps the vectors that match its index).
+    """
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        count = os.path.getsize(path) // (dim * VECTOR_DTYPE.itemsize)
+        self._rows = (
+            np.memmap(path, dtype=VECTOR_DTYPE, mode="r", shape=(count, dim))
+            if count else np.zeros((0, dim), dtype=VECTOR_DTYPE)
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        return np.asarray(self._rows[ids])
+
+
+def write_vector_file(path: str, vectors: np.ndarray):
+    """Write a whole vector file at once (a new store, or one being compacted)."""
+    with open(path, "wb") as fh:
+        fh.write(np.ascontiguousarray(vectors, dtype=VECTOR_DTYPE).tobytes())
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+class RerankedIndex:
+    """
+    Search wrapper for a compressed index: fetches `k * k_factor` candidates from the
+    compressed codes, recomputes their exact L2 distances from the full-precision vectors
+    and returns the best k. Looks like a faiss index to search code (search / ntotal / d);
+    anything else is passed through to the wrapped index.
+    """
+
+    def __init__(self, index: faiss.Index, vectors, k_factor: int = FAISS_RERANK_K_FACTOR):
+        self.index = index
+        self.vectors = vectors
+        self.k_factor = max(1, k_factor)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    def search(self, x: np.ndarray, k: int, params: faiss.SearchParameters = None):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        shortlist = max(k, min(k * self.k_factor, self.index.ntotal))
+        _, candidates = self.index.search(x, shortlist, params=params)
+
+        distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        labels = np.full((len(x), k), -1, dtype=np.int64)
+        for row, (query, ids) in enumerate(zip(x, candidates)):
+            ids = ids[ids >= 0]
+            if not len(ids):
+                continue
+            exact = ((self.vectors.get(ids) - query) ** 2).sum(axis=1)
+            order = np.argsort(exact, kind="stable")[:k]
+            distances[row, :len(order)] = exact[order]
+            labels[row, :len(order)] = ids[order]
+        return distances, labels
+
+    def range_search(self, x: np.ndarray, radius: float, params: faiss.SearchParameters = None):
+        raise RuntimeError("range_search is not supported with re-ranking")  # callers fall back to search()
+
+
+def with_rerank(index: faiss.Index, vectors, k_factor: int = FAISS_RERANK_K_FACTOR):
+    """
+    Wrap `index` for exact re-ranking when it holds compressed codes and `vectors` covers
+    every id in it; otherwise return it unchanged. k_factor <= 0 disables re-ranking.
+    """
+    from document_ai.faiss_encode.index_factory import is_compressed
+
+    if k_factor <= 0 or vectors is None or not is_compressed(index) or index.ntotal == 0:
+        return index
+    max_id = _max_id(index)
+    if max_id is not None and max_id >= len(vectors):
+        print(f"Full-precision vectors cover {len(vectors)} ids, index needs {max_id + 1}; not re-ranking.")
+        return index
+    return RerankedIndex(index, vectors, k_factor)
+
+
+def unwrap(index):
+    """The faiss index behind a RerankedIndex (e.g. before writing it to disk)."""
+    return index.index if isinstance(index, RerankedIndex) else index
+
+
+def _max_id(index: faiss.Index) -> Optional[int]:
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        ids = faiss.vector_to_array(index.id_map)
+        return int(ids.max()) if len(ids) else None
+    return index.ntotal - 1
@@ -0,0 +1,210 @@
+import os
+import mmap
+import threading
+from collections.abc import Sequence
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+# ----------------- Settings -----------------
+# Each entry in the offsets file is the end offset of one text in the data file
+OFFSET_DTYPE = np.dtype("<u8")
+
+
+class TextStore(Sequence):
+    """
+    Append-only store for document texts, addressed by the same ids as the FAISS vectors.
+
+    - `texts.dat` holds the UTF-8 bytes of every text back to back.
+    - `texts.idx` holds one little-endian uint64 end offset per text.
+
+    Both files are memory-mapped for reads, so looking up a text by id touches only that
+    text. Appends go straight to the end of the files; `sync()` makes them durable with a
+    single fsync per batch. A crash between the data write and the offset write leaves
+    unreferenced bytes at the end of the data file, which are trimmed on the next append.
+    """
+
+    def __init__(
+        self,
+        data_file: str,
+        offsets_file: str,
+        legacy_file: Optional[str] = None,
+    ):
+        self.data_file = data_file
+        self.offsets_file = offsets_file
+        os.makedirs(os.path.dirname(data_file) or ".", exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._data_fh = None
+        self._offsets_fh = None
+        self._data_mm = None
+        self._offsets = np.zeros(0, dtype=OFFSET_DTYPE)
+        # Write position, tracked separately so appends don't need to remap
+        self._count = 0
+        self._end = 0
+
+        # An old texts.npy is migrated on first use (or by ensure_migrated() during warm-up),
+        # not here: loading it can take long and the store is opened at import time
+        self._legacy_file = None
+        if legacy_file and not os.path.exists(offsets_file) and os.path.exists(legacy_file):
+            self._legacy_file = legacy_file
+        else:
+            self._remap()
+
+    def ensure_migrated(self):
+        """Import a pending legacy texts.npy; a no-op once done (or when there is none)."""
+        if self._legacy_file is None:
+            return
+        with self._lock:
+            if self._legacy_file is None:
+                return
+            legacy_file, self._legacy_file = self._legacy_file, None
+            self._migrate_from_npy(legacy_file)
+            self._remap()
+
+    # ----------------- Reading -----------------
+    def _disk_count(self) -> int:
+        if not os.path.exists(self.offsets_file):
+            return 0
+        return os.path.getsize(self.offsets_file) // OFFSET_DTYPE.itemsize
+
+    def _remap(self):
+        """(Re)map the files so that texts appended since the last map become visible."""
+        count = self._disk_count()
+        if count == 0:
+            self._offsets = np.zeros(0, dtype=OFFSET_DTYPE)
+            self._data_mm = None
+            return
+
+        self._offsets = np.memmap(self.offsets_file, dtype=OFFSET_DTYPE, mode="r", shape=(count,))
+        data_size = int(self._offsets[-1])
+        if data_size == 0:
+            self._data_mm = None
+            return
+        with open(self.data_file, "rb") as fh:
+            self._data_mm = mmap.mmap(fh.fileno(), data_size, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        self.ensure_migrated()
+        with self._lock:
+            if self._disk_count() != len(self._offsets):
+                self._remap()
+            return len(self._offsets)
+
+    def get(self, idx: int) -> str:
+        """Return the text stored under id `idx`."""
+        self.ensure_migrated()
+        with self._lock:
+            if idx >= len(self._offsets) or idx < -len(self._offsets):
+                # Texts appended since the last map (by us or by another process)
+                self._remap()
+            if idx < 0:
+                idx += len(self._offsets)
+            if idx < 0 or idx >= len(self._offsets):
+                raise IndexError(f"Text id {idx} out of range (store has {len(self._offsets)} texts)")
+            start = int(self._offsets[idx - 1]) if idx > 0 else 0
+            end = int(self._offsets[idx])
+            if end == start:
+                return ""
+            return self._data_mm[start:end].decode("utf-8")
+
+    def get_many(self, ids: Iterable[int]) -> List[str]:
+        return [self.get(int(i)) for i in ids]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return _TextStoreSlice(self, range(*key.indices(len(self))))
+        return self.get(key)
+
+    # ----------------- Writing -----------------
+    def _open_for_append(self):
+        if self._data_fh is not None:
+            return
+        # Trim a torn trailing offset and any data bytes not referenced by an offset
+        if os.path.exists(self.offsets_file):
+            size = os.path.getsize(self.offsets_file)
+            whole = size - size % OFFSET_DTYPE.itemsize
+            if whole != size:
+                os.truncate(self.offsets_file, whole)
+        committed = int(self._offsets[-1]) if len(self._offsets) else 0
+        if os.path.exists(self.data_file) and os.path.getsize(self.data_file) > committed:
+            os.truncate(self.data_file, committed)
+
+        self._data_fh = open(self.data_file, "ab")
+        self._offsets_fh = open(self.offsets_file, "ab")
+        self._count = len(self._offsets)
+        self._end = committed
+
+    def extend(self, texts: Iterable[str]) -> List[int]:
+        """Append texts and return their ids. Call sync() once the batch is complete."""
+        self.ensure_migrated()
+        with self._lock:
+            if self._data_fh is None:
+                self._remap()
+            self._open_for_append()
+
+            end = self._end
+            first_id = self._count
+            chunks, ends = [], []
+            for text in texts:
+                encoded = text.encode("utf-8")
+                chunks.append(encoded)
+                end += len(encoded)
+                ends.append(end)
+            if not ends:
+                return []
+
+            # Data first, then offsets: an offset never points past written data
+            self._data_fh.write(b"".join(chunks))
+            self._data_fh.flush()
+            self._offsets_fh.write(np.asarray(ends, dtype=OFFSET_DTYPE).tobytes())
+            self._offsets_fh.flush()
+
+            self._count += len(ends)
+            self._end = end
+            return list(range(first_id, first_id + len(ends)))
+
+    def append(self, text: str) -> int:
+        return self.extend([text])[0]
+
+    def sync(self):
+        """Flush pending appends to disk (one fsync per file)."""
+        with self._lock:
+            if self._data_fh is None:
+                return
+            self._data_fh.flush()
+            os.fsync(self._data_fh.fileno())
+            self._offsets_fh.flush()
+            os.fsync(self._offsets_fh.fileno())
+
+    def close(self):
+        with self._lock:
+            self.sync()
+            if self._data_fh is not None:
+                self._data_fh.close()
+                self._offsets_fh.close()
+                self._data_fh = None
+                self._offsets_fh = None
+
+    def _migrate_from_npy(self, legacy_file: str):
+        """One-off import of the old pickled texts.npy list."""
+        texts = np.load(legacy_file, allow_pickle=True).tolist()
+        print(f"Migrating {len(texts)} texts from {legacy_file} to {self.data_file}...")
+        self.extend(str(t) for t in texts)
+        self.sync()
+
+
+class _TextStoreSlice(Sequence):
+    """Lazy view over a range of ids in a TextStore."""
+
+    def __init__(self, store: TextStore, ids: range):
+        self._store = store
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return _TextStoreSlice(self._store, self._ids[key])
+        return self._store.get(self._ids[key])
@@ -1,11 +1,25 @@
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as OperationTimeout, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
 from google.api_core.client_options import ClientOptions
-from google.api_core.exceptions import InternalServerError, RetryError
+from google.api_core.exceptions import GoogleAPICallError, RetryError
 from google.cloud import documentai
-from google.cloud import storage
+
+from config.resources import resources
+from config.metrics import operation, stage, count, current_trace, in_context
 
 # Import FAISS functions
-from document_ai.faiss_encode.faiss_utils import create_or_load_faiss_index, add_text_to_faiss, save_faiss_index
+from document_ai.faiss_encode.faiss_utils import (
+    create_or_load_faiss_index,
+    add_texts_to_faiss,
+    save_faiss_index,
+    EMBED_BATCH_SIZE,
+)
+from document_ai.services.output_fetcher import OutputShardFetcher, create_storage_client, DOWNLOAD_WORKERS
+from config.settings import DOCAI_PARSE_PROCESSES
 
 # GCP variables
 from config.settings import (
@@ -17,12 +31,30 @@ from config.settings import (
 )
 
 processor_version_id = None
-field_mask = "text,entities,pages.pageNumber"
+# pages.layout.textAnchor gives each page's character range, used to chunk on page boundaries
+field_mask = "text,entities,pages.pageNumber,pages.layout.textAnchor"
+
+# Batching: Document AI accepts up to 5,000 documents per batch request
+MAX_DOCUMENTS_PER_REQUEST = 5000
+DOCUMENTS_PER_REQUEST = 100
+MAX_OPERATIONS_IN_FLIGHT = 4
+
+# Embedding: flush extracted texts to FAISS once this many are buffered or the oldest is this old
+FLUSH_MAX_DOCUMENTS = 256
+FLUSH_MAX_SECONDS = 10.0
 
 # Supported MIME types
 MIME_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
 
 
+def get_documentai_client(location: str) -> documentai.DocumentProcessorServiceClient:
+    """Shared Document AI client for a location, created on first use."""
+    def create():
+        opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+        return documentai.DocumentProcessorServiceClient(client_options=opts)
+    return resources.register(f"documentai_client:{location}", create).get()
+
+
 def get_mime_type(filename: str) -> str:
     for ext, mime in MIME_TYPES.items():
         if filename.lower().endswith(ext):
@@ -30,6 +62,237 @@ def get_mime_type(filename: str) -> str:
     raise ValueError(f"Unsupported file type: {filename}")
 
 
+def split_gcs_uri(gcs_uri: str) -> Tuple[str, str]:
+    matches = re.match(r"gs://(.*?)/(.*)", gcs_uri)
+    if not matches:
+        raise ValueError(f"Invalid GCS URI: {gcs_uri}")
+    return matches.groups()
+
+
+def iter_input_documents(storage_client, gcs_input_uri: str, start_after: Optional[str] = None):
+    """
+    Yield a GcsDocument for every supported file under the input URI, in name order.
+    `start_after` (a gs:// URI) skips that file and everything listed before it.
+    """
+    input_bucket_name, input_prefix = split_gcs_uri(gcs_input_uri)
+    list_kwargs = {"prefix": input_prefix}
+    start_name = None
+    if start_after:
+        start_name = split_gcs_uri(start_after)[1]
+        list_kwargs["start_offset"] = start_name  # listing starts at this name (inclusive)
+
+    for blob in storage_client.list_blobs(input_bucket_name, **list_kwargs):
+        if start_name is not None and blob.name <= start_name:
+            continue
+        try:
+            mime_type = get_mime_type(blob.name)
+        except ValueError:
+            print(f"Skipping unsupported file: {blob.name}")
+            continue
+        yield documentai.GcsDocument(
+            gcs_uri=f"gs://{input_bucket_name}/{blob.name}", mime_type=mime_type
+        )
+
+
+def count_input_documents(storage_client, gcs_input_uri: str) -> int:
+    """Number of supported files under the input URI (one listing pass, nothing downloaded)."""
+    input_bucket_name, input_prefix = split_gcs_uri(gcs_input_uri)
+    return sum(
+        1 for blob in storage_client.list_blobs(input_bucket_name, prefix=input_prefix)
+        if blob.name.lower().endswith(tuple(MIME_TYPES))
+    )
+
+
+def chunked(items: Iterable, size: int) -> Iterator[List]:
+    """Group an iterable into lists of at most `size` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_batch_request(
+    processor_name: str,
+    documents: List[documentai.GcsDocument],
+    gcs_output_uri: str,
+    field_mask: str = None,
+) -> documentai.BatchProcessRequest:
+    """Pack several input documents into one BatchProcessRequest."""
+    input_config = documentai.BatchDocumentsInputConfig(
+        gcs_documents=documentai.GcsDocuments(documents=documents)
+    )
+    gcs_output_config = documentai.DocumentOutputConfig.GcsOutputConfig(
+        gcs_uri=gcs_output_uri, field_mask=field_mask
+    )
+    output_config = documentai.DocumentOutputConfig(gcs_output_config=gcs_output_config)
+    return documentai.BatchProcessRequest(
+        name=processor_name, input_documents=input_config, document_output_config=output_config
+    )
+
+
+def run_batch_operation(client, request: documentai.BatchProcessRequest, timeout: int):
+    """Start one batch operation and wait for it. Runs on a worker thread."""
+    with stage("docai_operation"):
+        operation = client.batch_process_documents(request)
+        print(f"Waiting for operation {operation.operation.name} to complete...")
+        operation.result(timeout=timeout)
+    return operation
+
+
+class IndexWriter:
+    """
+    The FAISS index a batch run adds to, loaded on first use. Runs sharing one writer
+    (background jobs) add and save under its lock, so several can ingest into the same
+    index at once. `on_save` callbacks run under the lock right after each save with
+    the saved index, which is when added texts become durable.
+    """
+
+    def __init__(self, index=None):
+        self._index = index
+        self.lock = threading.RLock()
+        self.on_save: List[Callable] = []
+        self.saved_at = time.monotonic()
+
+    @property
+    def index(self):
+        with self.lock:
+            if self._index is None:
+                self._index = create_or_load_faiss_index()
+            return self._index
+
+    def add(self, texts: List[str], **kwargs):
+        with self.lock:
+            self._index = add_texts_to_faiss(texts, index=self.index, **kwargs)
+
+    def save(self):
+        with self.lock:
+            self._index = save_faiss_index(self.index)
+            self.saved_at = time.monotonic()
+            for callback in list(self.on_save):
+                callback(self._index)
+            return self._index
+
+
+class BatchProgress:
+    """
+    Hooks through which a caller follows and resumes a batch run (see
+    document_ai.services.jobs). The defaults process everything and record nothing.
+    """
+
+    # Inputs up to and including this gs:// URI were finished by an earlier run
+    cursor: Optional[str] = None
+
+    def should_process(self, gcs_uri: str) -> bool:
+        """Called for every listed input, in name order."""
+        return True
+
+    def flushed(self, gcs_uris: List[str]):
+        """Texts of these inputs were added to the index (under the writer lock)."""
+
+    def failed(self, gcs_uris: List[str], error: str):
+        """These inputs' batch operation failed."""
+
+    def stopped(self) -> bool:
+        """When True, no further operations are started and the run winds down."""
+        return False
+
+
+class IngestBuffer:
+    """
+    Accumulates extracted texts and adds them to the FAISS index and text store in bulk.
+    A flush happens when `max_documents` texts are buffered or the oldest buffered text is
+    `max_seconds` old (checked by the caller between operations, so every input's texts
+    go into the index together). Keeps running totals so ingestion throughput can be reported.
+    """
+
+    def __init__(
+        self,
+        writer: IndexWriter,
+        max_documents: int = FLUSH_MAX_DOCUMENTS,
+        max_seconds: float = FLUSH_MAX_SECONDS,
+        embed_batch_size: int = EMBED_BATCH_SIZE,
+        on_flush: Optional[Callable[[List[str]], None]] = None,
+    ):
+        self.writer = writer
+        self.max_documents = max_documents
+        self.max_seconds = max_seconds
+        self.embed_batch_size = embed_batch_size
+        self.on_flush = on_flush
+
+        self._texts: List[str] = []
+        self._page_spans: List[List[Tuple[int, int]]] = []
+        self._page_numbers: List[List[int]] = []
+        # Inputs whose texts are all in the buffer
+        self._sources: List[str] = []
+        self._oldest = None
+        self.started_at = time.monotonic()
+        self.documents_added = 0
+
+    def add(self, text: str, page_spans: List[Tuple[int, int]] = None, page_numbers: List[int] = None):
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self._texts.append(text)
+        self._page_spans.append(page_spans or [])
+        self._page_numbers.append(page_numbers or [])
+
+    def add_sources(self, gcs_uris: List[str]):
+        """Mark inputs as complete: all their texts were added (or they had none)."""
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        self._sources.extend(gcs_uris)
+
+    def due(self) -> bool:
+        if self._oldest is None:
+            return False
+        return (
+            len(self._texts) >= self.max_documents
+            or time.monotonic() - self._oldest >= self.max_seconds
+        )
+
+    def flush(self):
+        if self._oldest is None:
+            return
+        count = len(self._texts)
+        flush_start = time.monotonic()
+        with self.writer.lock:
+            if self._texts:
+                self.writer.add(
+                    self._texts,
+                    batch_size=self.embed_batch_size,
+                    page_spans=self._page_spans,
+                    page_numbers=self._page_numbers,
+                )
+            if self.on_flush is not None:
+                self.on_flush(self._sources)
+        self._texts = []
+        self._page_spans = []
+        self._page_numbers = []
+        self._sources = []
+        self._oldest = None
+        if not count:
+            return
+        self.documents_added += count
+        elapsed = time.monotonic() - flush_start
+        print(f"Embedded {count} document(s) in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.1f} docs/sec); "
+              f"{self.documents_added} total at {self.docs_per_sec:.1f} docs/sec overall.")
+
+    @property
+    def docs_per_sec(self) -> float:
+        return self.documents_added / max(time.monotonic() - self.started_at, 1e-9)
+
+    def stats(self) -> dict:
+        return {
+            "documents": self.documents_added,
+            "seconds": round(time.monotonic() - self.started_at, 3),
+            "docs_per_sec": round(self.docs_per_sec, 2),
+        }
+
+
+@operation("batch_process")
 def batch_process_documents(
     project_id: str,
     location: str,
@@ -39,74 +302,127 @@ def batch_process_documents(
     processor_version_id: str = None,
     field_mask: str = None,
     timeout: int = 400,
+    documents_per_request: int = DOCUMENTS_PER_REQUEST,
+    max_in_flight: int = MAX_OPERATIONS_IN_FLIGHT,
+    download_workers: int = DOWNLOAD_WORKERS,
+    parse_processes: int = DOCAI_PARSE_PROCESSES,
+    flush_max_documents: int = FLUSH_MAX_DOCUMENTS,
+    flush_max_seconds: float = FLUSH_MAX_SECONDS,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    client=None,
+    storage_client=None,
+    writer: Optional[IndexWriter] = None,
+    progress: Optional[BatchProgress] = None,
+    checkpoint_seconds: Optional[float] = None,
 ):
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
-    storage_client = storage.Client()
-    faiss_index = create_or_load_faiss_index()
+    """
+    Process every supported file under gcs_input_uri and add the extracted text to FAISS.
+    Input files are packed `documents_per_request` at a time into batch requests and up to
+    `max_in_flight` operations run concurrently. Each operation's output shards are downloaded
+    in parallel (`download_workers`) and parsed in `parse_processes` worker processes as soon
+    as that operation finishes; texts are embedded in bulk whenever `flush_max_documents`
+    are buffered or `flush_max_seconds` pass.
+    `client` / `storage_client` can be passed in (e.g. fakes in tests).
+    Background jobs pass a shared `writer`, a `progress` tracker (skips finished inputs,
+    records flushed and failed ones) and `checkpoint_seconds`, how often the index is saved.
+    Returns ingestion stats: documents added, elapsed seconds, docs/sec and the seconds spent
+    per stage (summed over the worker threads, so stages overlap).
+    """
+    if not 1 <= documents_per_request <= MAX_DOCUMENTS_PER_REQUEST:
+        raise ValueError(f"documents_per_request must be between 1 and {MAX_DOCUMENTS_PER_REQUEST}")
 
-    matches = re.match(r"gs://(.*?)/(.*)", gcs_input_uri)
-    if not matches:
-        raise ValueError(f"Invalid GCS URI: {gcs_input_uri}")
-    input_bucket_name, input_prefix = matches.groups()
-    blobs = storage_client.list_blobs(input_bucket_name, prefix=input_prefix)
+    if client is None:
+        client = get_documentai_client(location)
+    if storage_client is None:
+        storage_client = create_storage_client(pool_size=download_workers + max_in_flight)
+    if writer is None:
+        writer = IndexWriter()
+    if progress is None:
+        progress = BatchProgress()
+    buffer = IngestBuffer(
+        writer,
+        max_documents=flush_max_documents,
+        max_seconds=flush_max_seconds,
+        embed_batch_size=embed_batch_size,
+        on_flush=progress.flushed,
+    )
 
-    for blob in blobs:
-        try:
-            mime_type = get_mime_type(blob.name)
-        except ValueError:
-            print(f"Skipping unsupported file: {blob.name}")
-            continue
+    if processor_version_id:
+        name = client.processor_version_path(project_id, location, processor_id, processor_version_id)
+    else:
+        name = client.processor_path(project_id, location, processor_id)
 
-        print(f"Processing {blob.name} with MIME type {mime_type}...")
+    inputs = iter_input_documents(storage_client, gcs_input_uri, start_after=progress.cursor)
+    batches = chunked((doc for doc in inputs if progress.should_process(doc.gcs_uri)), documents_per_request)
 
-        gcs_document = documentai.GcsDocument(
-            gcs_uri=f"gs://{input_bucket_name}/{blob.name}", mime_type=mime_type
-        )
-        input_config = documentai.BatchDocumentsInputConfig(
-            gcs_documents=documentai.GcsDocuments(documents=[gcs_document])
-        )
-        gcs_output_config = documentai.DocumentOutputConfig.GcsOutputConfig(
-            gcs_uri=gcs_output_uri, field_mask=field_mask
-        )
-        output_config = documentai.DocumentOutputConfig(gcs_output_config=gcs_output_config)
+    fetcher = OutputShardFetcher(storage_client, download_workers=download_workers, parse_processes=parse_processes)
+    with fetcher, ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = {}
 
-        if processor_version_id:
-            name = client.processor_version_path(project_id, location, processor_id, processor_version_id)
-        else:
-            name = client.processor_path(project_id, location, processor_id)
+        def submit_next() -> bool:
+            if progress.stopped():
+                return False
+            documents = next(batches, None)
+            if documents is None:
+                return False
+            print(f"Submitting batch of {len(documents)} document(s)...")
+            request = build_batch_request(name, documents, gcs_output_uri, field_mask)
+            future = executor.submit(in_context(run_batch_operation), client, request, timeout)
+            pending[future] = documents
+            return True
 
-        request = documentai.BatchProcessRequest(
-            name=name, input_documents=input_config, document_output_config=output_config
-        )
+        while len(pending) < max_in_flight and submit_next():
+            pass
 
-        operation = client.batch_process_documents(request)
-        try:
-            print(f"Waiting for operation {operation.operation.name} to complete...")
-            operation.result(timeout=timeout)
-        except (RetryError, InternalServerError) as e:
-            print(f"Error processing {blob.name}: {e}")
-            continue
-
-        # Fetch output JSON
-        metadata = documentai.BatchProcessMetadata(operation.metadata)
-        for process in metadata.individual_process_statuses:
-            output_matches = re.match(r"gs://(.*?)/(.*)", process.output_gcs_destination)
-            if not output_matches:
-                continue
-            output_bucket, output_prefix = output_matches.groups()
-            output_blobs = storage_client.list_blobs(output_bucket, prefix=output_prefix)
-            for oblob in output_blobs:
-                if oblob.content_type != "application/json":
-                    continue
-                document = documentai.Document.from_json(oblob.download_as_bytes(), ignore_unknown_fields=True)
-                text = document.text.strip()
-                if not text:
+        while pending:
+            # Wake up periodically so a partially filled buffer is flushed on time
+            done, _ = wait(pending, timeout=flush_max_seconds, return_when=FIRST_COMPLETED)
+            if buffer.due():
+                buffer.flush()
+            for future in done:
+                documents = pending.pop(future)
+                # Keep the pipeline full before doing local work on this result
+                submit_next()
+                try:
+                    operation = future.result()
+                except (GoogleAPICallError, RetryError, OperationTimeout, OSError) as e:
+                    # One failed or timed-out operation doesn't stop the others from being drained
+                    count("failed_batches")
+                    error = str(e) or type(e).__name__
+                    print(f"Error processing batch of {len(documents)} document(s) "
+                          f"starting at {documents[0].gcs_uri}: {error}")
+                    progress.failed([d.gcs_uri for d in documents], error)
                     continue
-                print(f"Adding text from {blob.name} to FAISS index...")
-                faiss_index = add_text_to_faiss(text, index=faiss_index)
 
-    save_faiss_index(faiss_index)
+                # Inputs whose output wasn't read completely are failed, not marked complete
+                failed = {}
+                try:
+                    for doc in fetcher.iter_documents(operation, failed):
+                        buffer.add(doc.text, doc.page_spans, doc.page_numbers)
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                    print(f"Error reading the output of batch starting at {documents[0].gcs_uri}: {error}")
+                    failed = {d.gcs_uri: error for d in documents}
+                for source, error in failed.items():
+                    print(f"Output of {source} not ingested: {error}")
+                    progress.failed([source], error)
+                if failed:
+                    count("failed_outputs", len(failed))
+                buffer.add_sources([d.gcs_uri for d in documents if d.gcs_uri not in failed])
+                if buffer.due():
+                    buffer.flush()
+                if checkpoint_seconds is not None and time.monotonic() - writer.saved_at >= checkpoint_seconds:
+                    buffer.flush()
+                    writer.save()
+
+    buffer.flush()
+    writer.save()
+
+    stats = buffer.stats()
+    stats["stage_seconds"] = {name: round(seconds, 3) for name, seconds in current_trace().stages.items()}
+    print(f"Ingested {stats['documents']} document(s) in {stats['seconds']}s ({stats['docs_per_sec']} docs/sec).")
+    print("Stage seconds (summed over threads): " + ", ".join(f"{k}={v}" for k, v in stats["stage_seconds"].items()))
+    return stats
 
 
 if __name__ == "__main__":
@@ -0,0 +1,362 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from config.resources import resources
+from config.settings import (
+    PROJECT_ID,
+    PROCESSOR_ID,
+    LOCATION,
+    GCS_INPUT_URI,
+    GCS_OUTPUT_URI,
+    JOBS_DIR,
+    JOB_WORKERS,
+    JOB_CHECKPOINT_SECONDS,
+)
+from document_ai.faiss_encode.faiss_utils import create_or_load_faiss_index, open_saved_faiss_index
+from document_ai.services.batch_process import (
+    BatchProgress,
+    IndexWriter,
+    batch_process_documents,
+    count_input_documents,
+    split_gcs_uri,
+    MAX_OPERATIONS_IN_FLIGHT,
+)
+from document_ai.services.output_fetcher import create_storage_client, DOWNLOAD_WORKERS
+
+# Jobs with work left; resume_unfinished() picks them up after a restart
+UNFINISHED = ("queued", "running", "interrupted")
+
+# Failed inputs listed in a job's state (documents_failed counts all of them)
+MAX_FAILED_URIS = 100
+
+
+class JobConflictError(RuntimeError):
+    """The input is already being processed by a queued or running job."""
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+# ----------------- Job -----------------
+class BatchJob(BatchProgress):
+    """
+    One ingestion run over an input prefix, persisted to `state_file`.
+    Progress is committed whenever the shared index is saved: inputs whose texts are in
+    the saved index (or whose operation failed) are done. Inputs finish out of order, so the
+    state keeps a cursor (every input listed up to it is done) plus the few done past it;
+    a resumed job lists inputs after the cursor and skips those.
+    """
+
+    def __init__(self, job_id: str, gcs_input_uri: str, gcs_output_uri: str, state_file: str):
+        self.id = job_id
+        self.gcs_input_uri = gcs_input_uri
+        self.gcs_output_uri = gcs_output_uri
+        self.state_file = state_file
+        self.status = "queued"
+        self.created_at = _now()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.runs = 0
+        self.error: Optional[str] = None
+        self.cursor: Optional[str] = None
+        self.done_past_cursor: Set[str] = set()
+        self.documents_total: Optional[int] = None
+        self.documents_committed = 0
+        self.documents_failed = 0
+        self.failed_uris: List[str] = []
+        self.last_run: Optional[Dict[str, Any]] = None
+
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self.reset_run()
+
+    def reset_run(self):
+        with self._lock:
+            self._listed: Deque[str] = deque()  # listed this run and not behind the cursor yet
+            self._flushed: List[str] = []  # in the index, durable at the next save
+            self._failed: List[str] = []
+            self._run_started = time.monotonic()
+            self._run_done = 0
+
+    # ----------------- Batch progress hooks -----------------
+    def should_process(self, gcs_uri: str) -> bool:
+        with self._lock:
+            self._listed.append(gcs_uri)
+            return gcs_uri not in self.done_past_cursor
+
+    def flushed(self, gcs_uris: List[str]):
+        with self._lock:
+            self._flushed.extend(gcs_uris)
+            self._run_done += len(gcs_uris)
+
+    def failed(self, gcs_uris: List[str], error: str):
+        with self._lock:
+            self._failed.extend(gcs_uris)
+            self._run_done += len(gcs_uris)
+
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def commit(self, index=None):
+        """Record everything flushed so far as done; called right after the shared index is saved."""
+        with self._lock:
+            self.done_past_cursor.update(self._flushed)
+            self.done_past_cursor.update(self._failed)
+            self.documents_committed += len(self._flushed)
+            self.documents_failed += len(self._failed)
+            self.failed_uris = (self.failed_uris + self._failed)[-MAX_FAILED_URIS:]
+            self._flushed, self._failed = [], []
+            while self._listed and self._listed[0] in self.done_past_cursor:
+                self.cursor = self._listed.popleft()
+                self.done_past_cursor.discard(self.cursor)
+            self.save()
+
+    # ----------------- State -----------------
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "gcs_input_uri": self.gcs_input_uri,
+                "gcs_output_uri": self.gcs_output_uri,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "runs": self.runs,
+                "error": self.error,
+                "cursor": self.cursor,
+                "done_past_cursor": sorted(self.done_past_cursor),
+                "documents_total": self.documents_total,
+                "documents_committed": self.documents_committed,
+                "documents_failed": self.documents_failed,
+                "failed_uris": list(self.failed_uris),
+                "last_run": self.last_run,
+            }
+
+    def save(self):
+        """Write the state file (aside, then renamed into place)."""
+        state = self.to_dict()
+        tmp = self.state_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(state, fh, indent=2)
+        os.replace(tmp, self.state_file)
+
+    @classmethod
+    def load(cls, state_file: str) -> "BatchJob":
+        with open(state_file, "r", encoding="utf-8") as fh:
+            state = json.load(fh)
+        job = cls(state["job_id"], state["gcs_input_uri"], state["gcs_output_uri"], state_file)
+        for key in ("status", "created_at", "started_at", "finished_at", "runs", "error", "cursor",
+                    "documents_total", "documents_committed", "documents_failed", "failed_uris", "last_run"):
+            setattr(job, key, state.get(key, getattr(job, key)))
+        job.done_past_cursor = set(state.get("done_past_cursor") or [])
+        return job
+
+    def status_dict(self) -> Dict[str, Any]:
+        """State plus live progress: documents done, throughput of the current run and ETA."""
+        with self._lock:
+            info = self.to_dict()
+            info.pop("done_past_cursor")
+            pending = len(self._flushed) + len(self._failed)
+            done = self.documents_committed + self.documents_failed + pending
+            info["documents_pending"] = pending  # in the index, committed at the next checkpoint
+            info["documents_done"] = done
+
+            rate = None
+            if self.status == "running":
+                elapsed = time.monotonic() - self._run_started
+                rate = self._run_done / elapsed if elapsed > 0 else None
+            elif self.last_run:
+                rate = self.last_run.get("docs_per_sec")
+            info["docs_per_sec"] = round(rate, 2) if rate is not None else None
+
+            total = self.documents_total
+            info["progress"] = round(min(1.0, done / total), 4) if total else None
+            eta = None
+            if self.status == "running" and total is not None and rate:
+                eta = round(max(0, total - done) / rate, 1)
+            info["eta_seconds"] = eta
+            return info
+
+
+def refresh_search_index(index):
+    """After a save, swap the saved index file (memory-mapped) in for the search API's index, if it is loaded."""
+    resource = resources.register("document_index", create_or_load_faiss_index)
+    if resource.loaded:
+        resource.set(open_saved_faiss_index())
+
+
+# ----------------- Manager -----------------
+class JobManager:
+    """
+    Runs batch jobs on `workers` background threads. All jobs add to one shared index
+    writer, which saves every `checkpoint_seconds` and commits the progress of every
+    running job. Job state lives in `jobs_dir`, so jobs left unfinished by a crash or a
+    restart are resumed from their cursor by resume_unfinished().
+    `client` / `storage_client` and extra batch_process_documents options can be passed
+    in (e.g. fakes in benchmarks).
+    """
+
+    def __init__(
+        self,
+        jobs_dir: str = JOBS_DIR,
+        workers: int = JOB_WORKERS,
+        checkpoint_seconds: float = JOB_CHECKPOINT_SECONDS,
+        client=None,
+        storage_client=None,
+        writer: Optional[IndexWriter] = None,
+        **batch_options,
+    ):
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.jobs_dir = jobs_dir
+        self.checkpoint_seconds = checkpoint_seconds
+        self.client = client
+        self.storage_client = storage_client
+        self.batch_options = batch_options
+        self.writer = writer or IndexWriter()
+        self.writer.on_save.append(refresh_search_index)
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-job")
+        self._jobs: Dict[str, BatchJob] = {}
+        for name in sorted(os.listdir(jobs_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                job = BatchJob.load(os.path.join(jobs_dir, name))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipping unreadable job state {name}: {e}")
+                continue
+            if job.status in ("queued", "running"):
+                job.status = "interrupted"  # left by a previous process; no thread here owns it
+            self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[BatchJob]:
+        return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def submit(self, gcs_input_uri: str = GCS_INPUT_URI, gcs_output_uri: str = GCS_OUTPUT_URI) -> BatchJob:
+        """Queue a job over every supported file under gcs_input_uri."""
+        split_gcs_uri(gcs_input_uri)
+        split_gcs_uri(gcs_output_uri)
+        with self._lock:
+            for other in self._jobs.values():
+                if other.gcs_input_uri == gcs_input_uri and other.status in ("queued", "running"):
+                    raise JobConflictError(f"Job {other.id} is already processing {gcs_input_uri}")
+            job_id = uuid.uuid4().hex
+            job = BatchJob(job_id, gcs_input_uri, gcs_output_uri, os.path.join(self.jobs_dir, f"{job_id}.json"))
+            self._jobs[job_id] = job
+        self._enqueue(job)
+        return job
+
+    def resume(self, job_id: str) -> BatchJob:
+        """
+        Run a job again from its cursor: after a failure, or on a finished job to pick up
+        files added to the input since. Only inputs listed after the cursor are seen, so a
+        new file whose name sorts before it needs a new job.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        with self._lock:
+            if job.status in ("queued", "running"):
+                raise JobConflictError(f"Job {job_id} is already {job.status}")
+            job.status = "queued"
+        self._enqueue(job)
+        return job
+
+    def resume_unfinished(self) -> List[BatchJob]:
+        """Queue the jobs a previous process left unfinished (loaded as interrupted)."""
+        jobs = [job for job in self.list() if job.status in UNFINISHED]
+        for job in reversed(jobs):  # oldest first
+            print(f"Resuming job {job.id} ({job.status}) after {job.cursor or 'the start'}")
+            self._enqueue(job)
+        return jobs
+
+    def stop(self):
+        """Stop starting operations; running jobs finish the ones in flight and are left interrupted."""
+        for job in self._jobs.values():
+            job._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _enqueue(self, job: BatchJob):
+        with job._lock:
+            job.status = "queued"
+            job._stop.clear()
+            job.save()
+        self._executor.submit(self._run, job)
+
+    def _count_inputs(self, job: BatchJob, storage_client):
+        try:
+            total = count_input_documents(storage_client, job.gcs_input_uri)
+        except Exception as e:
+            print(f"Job {job.id}: counting input files failed: {e}")
+            return
+        with job._lock:
+            job.documents_total = total
+
+    def _run(self, job: BatchJob):
+        job.reset_run()
+        with job._lock:
+            job.status = "running"
+            job.runs += 1
+            job.started_at = _now()
+            job.finished_at = None
+            job.error = None
+            job.save()
+        print(f"Job {job.id}: processing {job.gcs_input_uri}" + (f" after {job.cursor}" if job.cursor else ""))
+
+        storage_client = self.storage_client or create_storage_client(
+            pool_size=DOWNLOAD_WORKERS + MAX_OPERATIONS_IN_FLIGHT + 1
+        )
+        threading.Thread(
+            target=self._count_inputs, args=(job, storage_client), name="batch-job-count", daemon=True
+        ).start()
+
+        with self.writer.lock:
+            self.writer.on_save.append(job.commit)
+        # Stays "interrupted" if the run is cut short by something other than an Exception
+        stats, status, error = None, "interrupted", None
+        options = {"project_id": PROJECT_ID, "location": LOCATION, "processor_id": PROCESSOR_ID}
+        options.update(self.batch_options)
+        try:
+            stats = batch_process_documents(
+                gcs_input_uri=job.gcs_input_uri,
+                gcs_output_uri=job.gcs_output_uri,
+                client=self.client,
+                storage_client=storage_client,
+                writer=self.writer,
+                progress=job,
+                checkpoint_seconds=self.checkpoint_seconds,
+                **options,
+            )
+            status = "interrupted" if job.stopped() else "completed"
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            status, error = "failed", str(e)
+            try:
+                self.writer.save()  # commit what this job already added to the index
+            except Exception as save_error:
+                print(f"Job {job.id}: saving the index failed: {save_error}")
+        finally:
+            with self.writer.lock:
+                self.writer.on_save.remove(job.commit)
+            with job._lock:
+                job.status = status
+                job.error = error
+                job.finished_at = _now()
+                if stats is not None:
+                    job.last_run = stats
+                job.save()
+        print(f"Job {job.id} {status}: {job.documents_committed} document(s) committed, "
+              f"{job.documents_failed} failed.")
@@ -1,32 +1,36 @@
-from google.api_core.client_options import ClientOptions
 from google.cloud import documentai
 from config.settings import PROJECT_ID, LOCATION, PROCESSOR_ID
+from document_ai.services.batch_process import get_documentai_client
 
 # The local file in your current working directory
 FILE_PATH = "image.jpg"
 MIME_TYPE = "image/jpeg"
 
-# Instantiates a client
-docai_client = documentai.DocumentProcessorServiceClient(
-    client_options=ClientOptions(api_endpoint=f"{LOCATION}-documentai.googleapis.com")
-)
 
-# Full resource name
-RESOURCE_NAME = docai_client.processor_path(PROJECT_ID, LOCATION, PROCESSOR_ID)
+def process_document(file_path: str = FILE_PATH, mime_type: str = MIME_TYPE) -> documentai.Document:
+    """Process one local file synchronously with Document AI and return the document."""
+    # Shared client (created on first use)
+    docai_client = get_documentai_client(LOCATION)
 
-# Read the file into memory
-with open(FILE_PATH, "rb") as image:
-    image_content = image.read()
+    # Full resource name
+    resource_name = docai_client.processor_path(PROJECT_ID, LOCATION, PROCESSOR_ID)
 
-# Load Binary Data into Document AI RawDocument Object
-raw_document = documentai.RawDocument(content=image_content, mime_type=MIME_TYPE)
+    # Read the file into memory
+    with open(file_path, "rb") as image:
+        image_content = image.read()
 
-# Configure the process request
-request = documentai.ProcessRequest(name=RESOURCE_NAME, raw_document=raw_document)
+    # Load Binary Data into Document AI RawDocument Object
+    raw_document = documentai.RawDocument(content=image_content, mime_type=mime_type)
 
-# Process the document
-result = docai_client.process_document(request=request)
+    # Configure the process request
+    request = documentai.ProcessRequest(name=resource_name, raw_document=raw_document)
 
-document_object = result.document
-print("Document processing complete.")
-print(f"Text: {document_object.text}")
+    # Process the document
+    result = docai_client.process_document(request=request)
+    return result.document
+
+
+if __name__ == "__main__":
+    document_object = process_document()
+    print("Document processing complete.")
+    print(f"Text: {document_object.text}")
@@ -0,0 +1,229 @@
+import json
+import multiprocessing
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from google.cloud import documentai
+
+from config.metrics import stage, in_context
+from config.settings import DOCAI_PARSE_PROCESSES
+from google.cloud import storage
+from requests.adapters import HTTPAdapter
+
+# Defaults for the output fetch stage
+DOWNLOAD_WORKERS = 8
+MAX_BUFFERED_DOCUMENTS = 32
+
+_DONE = object()
+
+
+@dataclass
+class ExtractedDocument:
+    """The fields we use from one Document AI output shard (matches the batch field_mask)."""
+    source: str
+    text: str
+    entities: List[Dict[str, Any]] = field(default_factory=list)
+    page_numbers: List[int] = field(default_factory=list)
+    # (start, end) character range of each page in `text`, aligned with page_numbers
+    page_spans: List[Tuple[int, int]] = field(default_factory=list)
+
+
+@dataclass
+class _ShardError:
+    source: str
+    name: str
+    error: Exception
+
+
+def create_storage_client(pool_size: int = DOWNLOAD_WORKERS) -> storage.Client:
+    """Storage client whose HTTP connection pool is large enough for parallel downloads."""
+    client = storage.Client()
+    http = getattr(client, "_http", None)
+    if http is not None and hasattr(http, "mount"):
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        http.mount("https://", adapter)
+        http.mount("http://", adapter)
+    return client
+
+
+def _page_span(page: Dict[str, Any]) -> Tuple[int, int]:
+    """Character range of a page from its layout text anchor (indexes are int64 strings in JSON)."""
+    segments = ((page.get("layout") or {}).get("textAnchor") or {}).get("textSegments") or []
+    if not segments:
+        return 0, 0
+    starts = [int(s.get("startIndex", 0)) for s in segments]
+    ends = [int(s.get("endIndex", 0)) for s in segments]
+    return min(starts), max(ends)
+
+
+def extract_document_fields(raw: bytes) -> Dict[str, Any]:
+    """
+    Parse a Document AI JSON shard into plain fields without building the Document proto.
+    Only `text`, `entities`, `pages[].pageNumber` and the pages' text anchors are kept.
+    """
+    data = json.loads(raw)
+    full_text = data.get("text") or ""
+    text = full_text.strip()
+    # Page offsets refer to the unstripped text
+    lead = len(full_text) - len(full_text.lstrip())
+
+    pages = [p for p in data.get("pages") or [] if "pageNumber" in p]
+    page_spans = []
+    for page in pages:
+        start, end = _page_span(page)
+        page_spans.append((max(0, start - lead), max(0, min(len(text), end - lead))))
+    if not any(end > start for start, end in page_spans):
+        page_spans = []  # no text anchors in the output (older field mask)
+
+    return {
+        "text": text,
+        "entities": data.get("entities") or [],
+        "page_numbers": [p["pageNumber"] for p in pages],
+        "page_spans": page_spans,
+    }
+
+
+class OutputShardFetcher:
+    """
+    Downloads and parses the JSON output shards of finished batch operations.
+    Shards are downloaded in parallel over one shared storage client, parsed in the
+    download threads (or in a process pool when `parse_processes` > 0) and handed to
+    the consumer through a bounded buffer, so memory stays flat however many shards
+    an operation produced.
+    """
+
+    def __init__(
+        self,
+        storage_client=None,
+        download_workers: int = DOWNLOAD_WORKERS,
+        max_buffered: int = MAX_BUFFERED_DOCUMENTS,
+        parse_processes: int = DOCAI_PARSE_PROCESSES,
+    ):
+        self.storage_client = storage_client or create_storage_client(download_workers)
+        self.max_buffered = max_buffered
+        self._download_pool = ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="docai-fetch")
+        self._parse_pool = None
+        if parse_processes > 0:
+            # Spawned, not forked: the parent runs many threads (downloads, jobs, the API)
+            self._parse_pool = ProcessPoolExecutor(
+                max_workers=parse_processes, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def close(self):
+        self._download_pool.shutdown(wait=True, cancel_futures=True)
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _iter_output_shards(self, operation, failed: Dict[str, str]):
+        """(input, shard blob) pairs; inputs without readable output go to `failed` instead."""
+        metadata = documentai.BatchProcessMetadata(operation.metadata)
+        for process in metadata.individual_process_statuses:
+            source = process.input_gcs_source
+            if process.status.code:
+                failed[source] = f"Document AI error {process.status.code}: {process.status.message}"
+                continue
+            output_matches = re.match(r"gs://(.*?)/(.*)", process.output_gcs_destination)
+            if not output_matches:
+                failed[source] = f"no output destination ({process.output_gcs_destination!r})"
+                continue
+            output_bucket, output_prefix = output_matches.groups()
+            # Listed in full before any download, so a listing error leaves nothing of the input half-read
+            try:
+                shards = [
+                    oblob for oblob in self.storage_client.list_blobs(output_bucket, prefix=output_prefix)
+                    if oblob.content_type == "application/json"
+                ]
+            except Exception as e:
+                failed[source] = f"listing output failed: {e}"
+                continue
+            if not shards:
+                failed[source] = f"no output shards under {process.output_gcs_destination}"
+                continue
+            for oblob in shards:
+                yield source, oblob
+
+    def _parse(self, raw: bytes) -> Dict[str, Any]:
+        pool = self._parse_pool
+        if pool is not None:
+            try:
+                return pool.submit(extract_document_fields, raw).result()
+            except BrokenProcessPool as e:
+                if self._parse_pool is pool:
+                    print(f"Parse processes unavailable ({e}); parsing on the download threads instead.")
+                    self._parse_pool = None
+        return extract_document_fields(raw)
+
+    def _fetch_shard(self, source: str, oblob, results: queue.Queue):
+        try:
+            with stage("download_output"):
+                raw = oblob.download_as_bytes()
+            with stage("parse_output"):
+                fields = self._parse(raw)
+            results.put(ExtractedDocument(source=source, **fields))
+        except Exception as e:
+            results.put(_ShardError(source=source, name=oblob.name, error=e))
+
+    def iter_documents(self, operation, failed: Optional[Dict[str, str]] = None) -> Iterator[ExtractedDocument]:
+        """
+        Yield the extracted documents of a finished operation as their shards arrive.
+        Inputs whose output could not be read completely (a per-document Document AI error,
+        or a failed listing, download or parse) are recorded in `failed` as input -> error;
+        other shards of such an input may still have been yielded. An error reading the
+        operation's metadata is raised.
+        If the consumer stops early (error, job stop), the listing thread is released and
+        downloads not yet started are cancelled.
+        """
+        if failed is None:
+            failed = {}
+        results: queue.Queue = queue.Queue()
+        # One slot per document downloaded but not yet consumed
+        slots = threading.Semaphore(self.max_buffered)
+        abandoned = threading.Event()
+
+        def produce():
+            futures = []
+            try:
+                for source, oblob in self._iter_output_shards(operation, failed):
+                    slots.acquire()
+                    if abandoned.is_set():
+                        break
+                    futures.append(self._download_pool.submit(in_context(self._fetch_shard), source, oblob, results))
+                if abandoned.is_set():
+                    for future in futures:
+                        future.cancel()
+                wait(futures)
+            except Exception as e:
+                results.put(e)
+            finally:
+                results.put(_DONE)
+
+        threading.Thread(target=in_context(produce), name="docai-list", daemon=True).start()
+
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                slots.release()
+                if isinstance(item, Exception):
+                    raise item
+                if isinstance(item, _ShardError):
+                    print(f"Error fetching output {item.name} for {item.source}: {item.error}")
+                    failed[item.source] = f"fetching output {item.name} failed: {item.error}"
+                    continue
+                if item.text:
+                    yield item
+        finally:
+            abandoned.set()
+            slots.release()  # wake the listing thread if it is waiting for a slot
@@ -1,28 +1,87 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from typing import List, Optional
 from fastapi.responses import HTMLResponse
 import logging
+import os
+import threading
 import faiss
 
-from document_ai.services.batch_process import batch_process_documents
-from document_ai.faiss_encode.faiss_utils import create_or_load_faiss_index, embed_model, stored_texts, save_faiss_index
+from config.resources import resources
+from config.metrics import instrument_app, operation, stage, current_trace
+from document_ai.faiss_encode.embedding import get_embed_model, embed_model_key
+from document_ai.faiss_encode.faiss_utils import text_store, passage_map
+from document_ai.faiss_encode.passage_map import merge_passage_hits
+from document_ai.faiss_encode.query_cache import query_embedding_cache
+from document_ai.faiss_encode.query_batcher import QueryBatcher
 
 
-from config.settings import PROJECT_ID, PROCESSOR_ID, LOCATION, GCS_INPUT_URI, GCS_OUTPUT_URI
+from config.settings import GCS_INPUT_URI, GCS_OUTPUT_URI, WARMUP_ON_STARTUP, JOBS_DIR, JOBS_RESUME_ON_STARTUP
 
 # ----------------- Setup -----------------
 app = FastAPI(title="Document AI + FAISS Search API 🚀")
 
+# Request / stage latency histograms on /metrics
+instrument_app(app)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize FAISS index on startup
-faiss_index = create_or_load_faiss_index()
+# The FAISS index and embedding model are loaded lazily (see config.resources), and a legacy
+# texts.npy is migrated on first use, so the server binds its port immediately; warm_up()
+# does all three in the background after that
+STARTUP_RESOURCES = ["embed_model", "document_index", "text_store"]
+
+def document_index():
+    return resources.get("document_index")
+
+def create_job_manager():
+    # Imported on use: the Document AI client library is slow to import
+    from document_ai.services.jobs import JobManager
+    return JobManager()
+
+# Background batch jobs (POST /process/batch), started on first use
+resources.register("batch_jobs", create_job_manager)
+
+def job_manager():
+    return resources.get("batch_jobs")
+
+# Passages fetched per requested document, so documents with several matching passages still fill top_k
+PASSAGE_OVERFETCH = 4
+
+# Coalesces concurrent searches into one encode + one FAISS search call
+query_batcher = QueryBatcher(
+    lambda queries: query_embedding_cache.encode(get_embed_model(), queries, model_name=embed_model_key())
+)
 
 # ----------------- Models -----------------
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 5
+    timings: bool = False  # add per-stage timings to the response
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+    timings: bool = False
+
+class BatchJobRequest(BaseModel):
+    gcs_input_uri: Optional[str] = None  # defaults to the configured input bucket
+    gcs_output_uri: Optional[str] = None
+
+# ----------------- Startup -----------------
+@app.on_event("startup")
+def warm_up():
+    if WARMUP_ON_STARTUP:
+        resources.warm_up(STARTUP_RESOURCES)
+    if JOBS_RESUME_ON_STARTUP and os.path.isdir(JOBS_DIR) and os.listdir(JOBS_DIR):
+        # Pick up jobs a crash or restart left unfinished, from their last checkpoint
+        threading.Thread(target=lambda: job_manager().resume_unfinished(), name="resume-jobs", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_jobs():
+    if resources.ready(["batch_jobs"]):
+        job_manager().stop()
 
 # ----------------- Routes -----------------
 @app.get("/", response_class=HTMLResponse)
@@ -32,44 +91,107 @@ def root():
     <p>Use <a href="/docs">/docs</a> to explore the API endpoints.</p>
     """
 
-@app.post("/process/batch")
-def process_batch():
-    """Trigger batch processing of all files in the input bucket."""
+@app.get("/health")
+def health():
+    """Liveness plus warm-up state of the lazily loaded resources."""
+    return {"status": "ok", "ready": resources.ready(STARTUP_RESOURCES), "resources": resources.status()}
+
+@app.post("/process/batch", status_code=202)
+def process_batch(req: Optional[BatchJobRequest] = None):
+    """Start a background job processing all files in the input bucket; poll GET /jobs/{job_id}."""
+    from document_ai.services.jobs import JobConflictError
+    req = req or BatchJobRequest()
     try:
-        batch_process_documents(
-            project_id=PROJECT_ID,
-            location=LOCATION,
-            processor_id=PROCESSOR_ID,
-            gcs_input_uri=GCS_INPUT_URI,
-            gcs_output_uri=GCS_OUTPUT_URI,
-        )
-        save_faiss_index(faiss_index)
-        return {"status": "Batch processing completed successfully"}
-    except Exception as e:
-        logger.error(f"Batch processing failed: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        job = job_manager().submit(req.gcs_input_uri or GCS_INPUT_URI, req.gcs_output_uri or GCS_OUTPUT_URI)
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+@app.get("/jobs")
+def list_jobs():
+    """All batch jobs, newest first."""
+    return {"jobs": [job.status_dict() for job in job_manager().list()]}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Progress of a batch job: documents done, throughput and ETA."""
+    job = job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.status_dict()
+
+@app.post("/jobs/{job_id}/resume", status_code=202)
+def resume_job(job_id: str):
+    """Run a failed or finished job again from its last checkpoint."""
+    from document_ai.services.jobs import JobConflictError
+    try:
+        job = job_manager().resume(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+def _search_results(distances, indices, top_k: int):
+    """Turn one row of FAISS passage hits into document hits with their matching passages."""
+    results = []
+    with stage("fetch_texts"):
+        for hit in merge_passage_hits(passage_map, distances, indices, top_k):
+            text = text_store.get(hit["doc_id"])
+            for p in hit["passages"]:
+                p["text"] = text[p["start"]:p["end"]]
+            results.append({"text": text, "distance": hit["distance"], "doc_id": hit["doc_id"], "passages": hit["passages"]})
+    return results
+
+def _with_timings(response: dict, enabled: bool) -> dict:
+    trace = current_trace()
+    if enabled and trace is not None:
+        response["timings"] = trace.as_dict()
+    return response
 
 @app.post("/search")
 def search_faiss(req: SearchRequest):
     """Search FAISS index by query and return raw text from top-k documents."""
     try:
-        if faiss_index.ntotal == 0 or len(stored_texts) == 0:
-            return {"results": [], "message": "FAISS index is empty"}
-
-        # Encode query
-        query_vector = embed_model.encode([req.query], convert_to_numpy=True)
+        with operation("search"):
+            with stage("index_load"):
+                faiss_index = document_index()
+            if faiss_index.ntotal == 0 or len(text_store) == 0:
+                return {"results": [], "message": "FAISS index is empty"}
 
-        # Search FAISS
-        distances, indices = faiss_index.search(query_vector, req.top_k)
+            # Encode + search passages (batched with concurrent requests; embeddings served from cache when possible)
+            distances, indices = query_batcher.search(req.query, req.top_k * PASSAGE_OVERFETCH, faiss_index)
 
-        # Retrieve original texts
-        results = []
-        for idx, dist in zip(indices[0], distances[0]):
-            if idx < len(stored_texts):
-                results.append({"text": stored_texts[idx], "distance": float(dist)})
+            # Merge passage hits into documents and retrieve original texts
+            results = _search_results(distances, indices, req.top_k)
 
-        return {"query": req.query, "results": results, "retrieved_docs_count": len(results)}
+        response = {"query": req.query, "results": results, "retrieved_docs_count": len(results)}
+        return _with_timings(response, req.timings)
 
     except Exception as e:
         logger.error(f"FAISS search failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/batch")
+def search_faiss_batch(req: BatchSearchRequest):
+    """Search FAISS index for several queries at once (one encode and one search call)."""
+    try:
+        with operation("search_batch"):
+            with stage("index_load"):
+                faiss_index = document_index()
+            if faiss_index.ntotal == 0 or len(text_store) == 0:
+                return {"results": [], "message": "FAISS index is empty"}
+
+            batch = []
+            hits = query_batcher.search_many(req.queries, req.top_k * PASSAGE_OVERFETCH, faiss_index)
+            for query, (distances, indices) in zip(req.queries, hits):
+                results = _search_results(distances, indices, req.top_k)
+                batch.append({"query": query, "results": results, "retrieved_docs_count": len(results)})
+
+        return _with_timings({"results": batch, "query_count": len(batch)}, req.timings)
+
+    except Exception as e:
+        logger.error(f"FAISS batch search failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,14 +1,28 @@
 # rag_agent/api/fastapi_app.py
+import asyncio
+import json
+import threading
+from datetime import datetime
+from typing import Optional
+
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from rag_agent.services.llm_agent import answer_query
+from rag_agent.services.llm_agent import answer_query_async, stream_answer_query
+from rag_agent.services.metadata_filter import SummaryFilter
+from rag_agent.services.index_store import summary_store
+from config.resources import resources
+from config.metrics import instrument_app, current_trace
+from config.settings import WARMUP_ON_STARTUP
 
 # Initialize FastAPI app
 app = FastAPI(title="RAG Medical Assistant", version="1.0")
 
+# Request / stage latency histograms on /metrics
+instrument_app(app)
+
 # Mount static files (CSS, JS, images)
 app.mount("/static", StaticFiles(directory="rag_agent/static"), name="static")
 
@@ -16,10 +30,94 @@ app.mount("/static", StaticFiles(directory="rag_agent/static"), name="static")
 templates = Jinja2Templates(directory="rag_agent/templates")
 
 
+# Loaded in the background after startup, together with the summary index
+WARMUP_RESOURCES = ["embed_model", "gemini"]
+
+
+def _load_summary_store():
+    try:
+        summary_store.get()
+    except FileNotFoundError as e:
+        print(f"Warning: {e}")
+
+
+@app.on_event("startup")
+def warm_up():
+    # Load the embedding model and summary index in the background so the server
+    # starts accepting connections at once and the first request doesn't pay for them
+    if not WARMUP_ON_STARTUP:
+        return
+
+    def run():
+        resources.warm_up(WARMUP_RESOURCES, background=False)
+        _load_summary_store()
+
+    threading.Thread(target=run, name="rag-warm-up", daemon=True).start()
+
+
+@app.get("/health")
+def health():
+    """Liveness plus warm-up state of the embedding model, Gemini client and summary index."""
+    return {
+        "status": "ok",
+        "ready": resources.ready(WARMUP_RESOURCES) and summary_store.loaded,
+        "resources": resources.status(),
+        "summary_index_version": list(summary_store.version) if summary_store.loaded else None,
+    }
+
+
+# How often to check whether the client is still connected while a request is running
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def run_until_disconnect(request: Request, coro):
+    """Await `coro`, cancelling it (and any Gemini call inside) if the client goes away."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected()
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # 499: client closed request (nobody is listening for the body anyway)
+    return Response(status_code=499)
+
+
+class QueryFilters(BaseModel):
+    """Metadata predicates applied inside the vector search (all optional, combined with AND)."""
+    patient: Optional[str] = None
+    processed_from: Optional[datetime] = None    # processed_at >= this
+    processed_before: Optional[datetime] = None  # processed_at < this
+    has_diagnosis: Optional[bool] = None
+
+    def to_filter(self) -> SummaryFilter:
+        return SummaryFilter(
+            patient=self.patient,
+            processed_from=self.processed_from,
+            processed_before=self.processed_before,
+            has_diagnosis=self.has_diagnosis,
+        )
+
+
 class QueryRequest(BaseModel):
     question: str
     top_k: int = 5
     use_gemini: bool = True
+    filters: Optional[QueryFilters] = None
+    timings: bool = False  # add per-stage timings (index load, embedding, FAISS, filter, Gemini, ...) to the response
 
 
 # --------- UI ROUTES ---------
@@ -29,11 +127,14 @@ def home(request: Request):
 
 
 @app.post("/ask-ui", response_class=HTMLResponse)
-def ask_ui(request: Request, question: str = Form(...), use_gemini: bool = Form(True)):
+async def ask_ui(request: Request, question: str = Form(...), use_gemini: bool = Form(False)):
+    # An unchecked checkbox sends no field at all, so a missing use_gemini means "off"
     # Determine top_k dynamically (optional: parse query for number)
     top_k = None  # None means fetch all summaries
 
-    result = answer_query(question=question, top_k=top_k, use_gemini=use_gemini)
+    result = await run_until_disconnect(
+        request, answer_query_async(question=question, top_k=top_k, use_gemini=use_gemini)
+    )
 
     return templates.TemplateResponse("results.html", {
         "request": request,
@@ -42,16 +143,44 @@ def ask_ui(request: Request, question: str = Form(...), use_gemini: bool = Form(
     })
 
 
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/ask-stream")
+async def ask_stream(question: str, use_gemini: bool = True, top_k: int = None):
+    """
+    Server-Sent Events version of /ask-ui: retrieved records are sent as soon as
+    they are found, then the Gemini answer is streamed token by token.
+    """
+    async def events():
+        # Flush headers and a first byte immediately, before any retrieval work
+        yield ": connected\n\n"
+        async for event, data in stream_answer_query(question=question, top_k=top_k, use_gemini=use_gemini):
+            yield sse_event(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # --------- API ROUTES (unchanged) ---------
 @app.get("/api")
 def api_status():
     return {"message": "RAG Medical Assistant API is running 🚀"}
 
 @app.post("/ask")
-def ask_question(request: QueryRequest):
-    result = answer_query(
+async def ask_question(request: QueryRequest, http_request: Request):
+    result = await run_until_disconnect(http_request, answer_query_async(
         question=request.question,
         top_k=request.top_k,
-        use_gemini=request.use_gemini
-    )
+        use_gemini=request.use_gemini,
+        where=request.filters.to_filter() if request.filters else None,
+    ))
+    trace = current_trace()
+    if request.timings and trace is not None:
+        result["timings"] = trace.as_dict()
     return result
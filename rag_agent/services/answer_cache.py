@@ -0,0 +1,102 @@
+# rag_agent/services/answer_cache.py
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = 512
+ANSWER_CACHE_TTL_SECONDS = 600
+ANSWER_SIMILARITY_THRESHOLD = 0.95  # cosine similarity between question embeddings
+
+
+def context_key(context_text: str) -> str:
+    """Identity of the retrieved record set, as sent to the LLM."""
+    return hashlib.sha256(context_text.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Cache of Gemini answers.
+    An entry matches when the retrieved context is identical and the new question's embedding
+    is within `similarity_threshold` cosine similarity of the cached question. Entries expire
+    after `ttl_seconds` and the least recently used are evicted beyond `max_entries`.
+    A summary index update doesn't clear the cache: the context key is a hash of the records
+    sent to the LLM, so only questions whose retrieved records changed stop matching.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold: float = ANSWER_SIMILARITY_THRESHOLD,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._by_context: Dict[str, set] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_context.get(entry["context"])
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_context[entry["context"]]
+
+    def get(self, context: str, question_vector: np.ndarray) -> Optional[str]:
+        """Return a cached answer for an equivalent question over the same context, or None."""
+        query = self._unit(question_vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_sim = None, self.similarity_threshold
+            for entry_id in list(self._by_context.get(context, ())):
+                entry = self._entries[entry_id]
+                if now - entry["created"] > self.ttl_seconds:
+                    self._drop(entry_id)
+                    continue
+                sim = float(np.dot(entry["vector"], query))
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]["answer"]
+
+    def put(self, context: str, question_vector: np.ndarray, answer: str):
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = {
+                "context": context,
+                "vector": self._unit(question_vector),
+                "answer": answer,
+                "created": time.monotonic(),
+            }
+            self._by_context.setdefault(context, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Shared instance used by answer_query
+answer_cache = AnswerCache()
@@ -0,0 +1,142 @@
+# rag_agent/services/context_planner.py
+import re
+from dataclasses import dataclass, field
+from typing import List, Dict, Any
+
+from config.settings import CONTEXT_TOKEN_BUDGET
+
+# Summary fields in the order they are packed into the prompt
+CORE_FIELDS = ["Patient", "Diagnosis"]
+DETAIL_FIELDS = ["Treatment", "Follow-up"]
+
+EMPTY_VALUES = {"", "NA", "N/A", "NOT SPECIFIED", "ERROR IN PROCESSING"}
+HONORIFICS = {"mr", "mrs", "ms", "miss", "dr", "name"}
+
+# Gemini's tokenizer isn't available offline, so token counts are an upper bound: one token per
+# run of up to 4 letters, per digit (SentencePiece splits numbers into digits) and per punctuation
+# mark; names and IDs cost far more than the ~4 characters per token of English prose.
+# Only BUDGET_FILL of the budget is used, as a margin for the prompt around the context.
+TOKEN_PIECE_RE = re.compile(r"[^\W\d_]{1,4}|\d|[^\w\s]|_")
+BUDGET_FILL = 0.9
+RECORD_SEPARATOR = "\n\n---\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(TOKEN_PIECE_RE.findall(text)) + 1
+
+
+def is_valid_value(value) -> bool:
+    return isinstance(value, str) and value.strip().upper() not in EMPTY_VALUES
+
+
+def patient_key(patient: str) -> str:
+    """
+    Normalized patient identity used to merge duplicate records:
+    the name part before any "(…)" details, lower-cased, without honorifics or punctuation.
+    """
+    name = patient.split("(")[0].lower()
+    tokens = [t for t in re.findall(r"[a-z0-9]+", name) if t not in HONORIFICS]
+    return " ".join(tokens)
+
+
+@dataclass
+class _MergedRecord:
+    metadata: Dict[str, Any]
+    distance: float
+    fields: Dict[str, List[str]] = field(default_factory=dict)
+    merged_count: int = 1
+
+    def add_fields(self, summary: Dict[str, Any]):
+        for k, v in summary.items():
+            if not is_valid_value(v):
+                continue
+            values = self.fields.setdefault(k, [])
+            if k == "Patient" and values:
+                continue  # same patient by key; keep the best-ranked spelling
+            if v.strip() not in values:
+                values.append(v.strip())
+
+    def field_text(self, name: str) -> str:
+        return "; ".join(self.fields.get(name, []))
+
+
+def merge_by_patient(retrieved: List[Dict[str, Any]]) -> List[_MergedRecord]:
+    """
+    Merge hits for the same patient, keeping the best-ranked one's metadata and distance;
+    the result is ordered by fused score (hybrid search), then distance.
+    """
+    merged: Dict[str, _MergedRecord] = {}
+    order = []
+    for r in sorted(retrieved, key=lambda r: (-r.get("score", 0.0), r["distance"])):
+        summary = r["metadata"].get("summary", {}) or {}
+        patient = summary.get("Patient", "")
+        key = patient_key(patient) if is_valid_value(patient) else f"__record_{id(r)}"
+        if not key:
+            key = f"__record_{id(r)}"
+
+        record = merged.get(key)
+        if record is None:
+            record = _MergedRecord(metadata=r["metadata"], distance=r["distance"])
+            merged[key] = record
+            order.append(key)
+        else:
+            record.merged_count += 1
+        record.add_fields(summary)
+    return [merged[k] for k in order if merged[k].fields]
+
+
+def plan_context(retrieved: List[Dict[str, Any]], token_budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Assemble the LLM context from retrieved summaries within `token_budget` tokens.
+
+    Records for the same patient are merged, then packed by relevance in two passes:
+    first the core fields (Patient, Diagnosis) of as many records as fit, then the
+    detail fields (Treatment, Follow-up and anything else) while budget remains.
+    Returns (records that made it into the context, context text); each record's summary
+    holds only the fields that were sent, so callers never cite what the LLM didn't see.
+    """
+    records = merge_by_patient(retrieved)
+    budget = int(token_budget * BUDGET_FILL)
+    used = 0
+    included: List[_MergedRecord] = []
+    lines: Dict[int, List[str]] = {}
+    sent: Dict[int, List[str]] = {}
+
+    # pass 1: core fields, most relevant record first
+    for record in records:
+        names = [k for k in CORE_FIELDS if k in record.fields] or list(record.fields)[:1]
+        rec_lines = [f"{k}: {record.field_text(k)}" for k in names]
+        cost = estimate_tokens("\n".join(rec_lines) + RECORD_SEPARATOR)
+        if used + cost > budget:
+            break
+        used += cost
+        lines[id(record)] = rec_lines
+        sent[id(record)] = names
+        included.append(record)
+
+    # pass 2: detail fields for the included records, in the same order
+    for record in included:
+        extra = [k for k in DETAIL_FIELDS if k in record.fields]
+        extra += [k for k in record.fields if k not in CORE_FIELDS + DETAIL_FIELDS]
+        for k in extra:
+            line = f"{k}: {record.field_text(k)}"
+            if line in lines[id(record)]:
+                continue
+            cost = estimate_tokens(line + "\n")
+            if used + cost > budget:
+                continue
+            used += cost
+            lines[id(record)].append(line)
+            sent[id(record)].append(k)
+
+    context_text = RECORD_SEPARATOR.join("\n".join(lines[id(r)]) for r in included)
+
+    contributing = []
+    for record in included:
+        summary = {k: record.field_text(k) for k in record.fields if k in sent[id(record)]}
+        metadata = dict(record.metadata, summary=summary)
+        if record.merged_count > 1:
+            metadata["merged_records"] = record.merged_count
+        contributing.append({"metadata": metadata, "distance": record.distance})
+
+    return contributing, context_text
@@ -0,0 +1,143 @@
+# rag_agent/services/index_store.py
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+import faiss
+
+from .rag_utils import (
+    SUMMARY_INDEX_FILE,
+    SUMMARY_TEXTS_FILE,
+    SUMMARY_METADATA_FILE,
+    SUMMARY_VERSION_FILE,
+    SUMMARY_LEXICAL_FILE,
+    load_summary_index,
+)
+from .lexical_index import LexicalIndex, load_lexical_index
+from .metadata_filter import FilterIndex
+
+
+@dataclass(frozen=True)
+class SummaryIndexSnapshot:
+    """One immutable copy of the summary vectorstore (memory-mapped; records are read on access)."""
+    index: faiss.Index
+    texts: Sequence[str]
+    metadata_list: Sequence[Dict[str, Any]]
+    lexical: LexicalIndex
+    filters: FilterIndex
+    version: Tuple
+
+
+class SummaryIndexStore:
+    """
+    Process-wide holder for the summary index.
+    The vectorstore is loaded once and shared by every request. On access the store
+    checks (at most every `check_interval` seconds) whether the files on disk changed
+    and, if so, loads a new snapshot and swaps it in. Readers that already hold a
+    snapshot keep using it, so a reload never blocks queries in flight.
+    """
+
+    def __init__(
+        self,
+        index_file: str = SUMMARY_INDEX_FILE,
+        texts_file: str = SUMMARY_TEXTS_FILE,
+        metadata_file: str = SUMMARY_METADATA_FILE,
+        version_file: str = SUMMARY_VERSION_FILE,
+        lexical_file: str = SUMMARY_LEXICAL_FILE,
+        check_interval: float = 2.0,
+    ):
+        self.index_file = index_file
+        self.texts_file = texts_file
+        self.metadata_file = metadata_file
+        self.version_file = version_file
+        self.lexical_file = lexical_file
+        self.check_interval = check_interval
+
+        self._snapshot: Optional[SummaryIndexSnapshot] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _current_version(self) -> Tuple:
+        """
+        Version stamp of the files on disk.
+        Prefer the stamp written last by build_summary_index(); fall back to file mtimes.
+        """
+        if os.path.exists(self.version_file):
+            try:
+                with open(self.version_file, "r", encoding="utf-8") as fh:
+                    return ("stamp", fh.read().strip())
+            except OSError:
+                pass
+
+        stamps = []
+        for path in (self.index_file, self.texts_file, self.metadata_file):
+            try:
+                st = os.stat(path)
+                stamps.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stamps.append(None)
+        return ("mtime", tuple(stamps))
+
+    def _load(self, version: Tuple) -> SummaryIndexSnapshot:
+        index, texts, metadata_list = load_summary_index(
+            index_file=self.index_file,
+            texts_file=self.texts_file,
+            metadata_file=self.metadata_file,
+        )
+        stamp = version[1] if version[0] == "stamp" else None
+        lexical = load_lexical_index(self.lexical_file, metadata_list, stamp)
+        filters = FilterIndex(metadata_list, lexical)  # column index for metadata predicates
+        return SummaryIndexSnapshot(
+            index=index, texts=texts, metadata_list=metadata_list, lexical=lexical, filters=filters, version=version
+        )
+
+    def get(self) -> SummaryIndexSnapshot:
+        """Return the current snapshot, reloading it first if the vectorstore changed on disk."""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._last_check < self.check_interval:
+            return snapshot
+
+        version = self._current_version()
+        if snapshot is not None and snapshot.version == version:
+            self._last_check = now
+            return snapshot
+
+        if snapshot is not None:
+            # Another thread is already reloading: keep serving the old copy
+            if not self._lock.acquire(blocking=False):
+                return snapshot
+        else:
+            self._lock.acquire()
+
+        try:
+            snapshot = self._snapshot
+            version = self._current_version()
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._load(version)
+                self._snapshot = snapshot
+                print(f"Loaded summary index ({snapshot.index.ntotal} vectors).")
+            self._last_check = time.monotonic()
+            return snapshot
+        finally:
+            self._lock.release()
+
+    @property
+    def loaded(self) -> bool:
+        """True once a snapshot has been loaded (without triggering a load)."""
+        return self._snapshot is not None
+
+    @property
+    def version(self) -> Tuple:
+        """Version stamp of the snapshot currently being served."""
+        return self.get().version
+
+    def invalidate(self):
+        """Force the next get() to re-check the files on disk."""
+        self._last_check = 0.0
+
+
+# Shared instance used by the API routes and the CLI
+summary_store = SummaryIndexStore()
@@ -0,0 +1,289 @@
+# rag_agent/services/lexical_index.py
+"""
+Lexical side index over the summary vectorstore: patient names and identifier tokens
+(passport / record numbers, "354-23-00442" == "354_23_00442") with exact lookup, plus
+BM25 over the Patient field for partial matches. Built by build_summary_index from the
+same metadata slots as the FAISS index (slot = vector id) and stamped with the
+vectorstore version, so a reader never mixes it with another build.
+The file holds one JSON line per build: a full build writes one line, an incremental
+build appends a line with the added slots and the slots it removed.
+"""
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .context_planner import HONORIFICS, is_valid_value
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Reciprocal rank fusion of the vector and BM25 rankings; exact name / ID matches rank first
+RRF_K = 60
+EXACT_MATCH_BOOST = 1.0
+# BM25 hits considered for fusion (vector hits are all kept)
+LEXICAL_CANDIDATES = 20
+
+# Identifier: alphanumeric runs joined by - _ / . containing a digit; separators are dropped
+ID_RE = re.compile(r"[a-z0-9]+(?:[-_/.][a-z0-9]+)*")
+ID_SEPARATORS_RE = re.compile(r"[-_/.]")
+MIN_ID_CHARS = 4
+WORD_RE = re.compile(r"[a-z]+")
+
+# Words in Patient values that label a value rather than identify anyone
+FIELD_LABELS = {"id", "passport", "gender", "age", "date", "not", "specified"}
+# Query words that don't change what a lookup asks for ("show me record 4143")
+LOOKUP_WORDS = {
+    "a", "about", "all", "any", "are", "details", "do", "find", "for", "get", "have", "info",
+    "is", "list", "look", "lookup", "me", "of", "on", "patient", "patients", "record", "records",
+    "s", "show", "summary", "the", "up", "we", "what", "who", "with",
+} | FIELD_LABELS | HONORIFICS
+
+
+def identifier_tokens(text: str) -> List[str]:
+    """Normalized identifiers in `text` ("ID: 354-23-00442" -> ["3542300442"])."""
+    tokens = []
+    for match in ID_RE.findall(text.lower()):
+        parts = ID_SEPARATORS_RE.split(match)
+        while parts and not any(c.isdigit() for c in parts[0]):
+            parts.pop(0)  # a label glued on, as in "ID_354_23_00442"
+        token = "".join(parts)
+        if len(token) >= MIN_ID_CHARS:
+            tokens.append(token)
+    return tokens
+
+
+def word_tokens(text: str) -> List[str]:
+    return WORD_RE.findall(text.lower())
+
+
+def patient_name(patient: str) -> Tuple[str, ...]:
+    """Name tokens of a Patient value: the part before any "(" or ",", without labels or honorifics."""
+    name = re.split(r"[(,]", patient, maxsplit=1)[0]
+    return tuple(t for t in word_tokens(name) if t not in HONORIFICS and t not in FIELD_LABELS)
+
+
+def _record_terms(record: Dict[str, Any]) -> Tuple[List[str], Tuple[str, ...], Set[str]]:
+    """(BM25 terms, patient name, identifiers) of one summary record."""
+    summary = record.get("summary", {}) or {}
+    patient = summary.get("Patient", "")
+    patient = patient if is_valid_value(patient) else ""
+
+    ids: Set[str] = set(identifier_tokens(patient))
+    for key, value in summary.items():
+        if key != "Patient" and is_valid_value(value):
+            ids.update(identifier_tokens(value))
+    if record.get("record_id") is not None:
+        ids.update(identifier_tokens(str(record["record_id"])))
+
+    words = [t for t in word_tokens(patient) if t not in HONORIFICS and t not in FIELD_LABELS]
+    return words + sorted(ids), patient_name(patient), ids
+
+
+class LexicalIndex:
+    """Inverted index over summary slots: identifier and name lookup tables and BM25 postings."""
+
+    def __init__(
+        self,
+        postings: Dict[str, Dict[int, int]],
+        doc_len: Dict[int, int],
+        ids: Dict[str, List[int]],
+        names: Dict[Tuple[str, ...], List[int]],
+        rows: int,
+        version: Optional[str] = None,
+    ):
+        self.postings = postings
+        self.doc_len = doc_len
+        self.ids = ids
+        self.names = names
+        self.rows = rows
+        self.version = version
+        self._avg_len = sum(doc_len.values()) / len(doc_len) if doc_len else 0.0
+        # Names by their first token, to find them in a query in one pass
+        self._names_by_first: Dict[str, List[Tuple[str, ...]]] = {}
+        for name in names:
+            self._names_by_first.setdefault(name[0], []).append(name)
+
+    @classmethod
+    def build(
+        cls,
+        metadata_list: Sequence[Optional[Dict[str, Any]]],
+        version: Optional[str] = None,
+        first_slot: int = 0,
+    ) -> "LexicalIndex":
+        """Index of `metadata_list`, whose records fill the slots from `first_slot` on."""
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_len: Dict[int, int] = {}
+        ids: Dict[str, List[int]] = {}
+        names: Dict[Tuple[str, ...], List[int]] = {}
+        for slot, record in enumerate(metadata_list, first_slot):
+            if record is None:
+                continue  # removed summary
+            terms, name, record_ids = _record_terms(record)
+            if not terms:
+                continue
+            doc_len[slot] = len(terms)
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, {})[slot] = tf
+            for token in record_ids:
+                ids.setdefault(token, []).append(slot)
+            if name:
+                names.setdefault(name, []).append(slot)
+        return cls(postings, doc_len, ids, names, first_slot + len(metadata_list), version)
+
+    # ----------------- Persistence -----------------
+    def _line(self, removed: Iterable[int] = ()) -> str:
+        data = {
+            "version": self.version,
+            "rows": self.rows,
+            "doc_len": [[slot, n] for slot, n in self.doc_len.items()],
+            "postings": {term: [[slot, tf] for slot, tf in slots.items()] for term, slots in self.postings.items()},
+            "ids": self.ids,
+            "names": [[" ".join(name), slots] for name, slots in self.names.items()],
+            "removed": sorted(removed),
+        }
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(self._line())
+
+    def append(self, path: str, removed: Iterable[int] = ()):
+        """
+        Append this index (built with `first_slot` = the rows already saved) to the file at
+        `path`, dropping the slots in `removed`. Raises ValueError if the file's last line
+        is incomplete (an interrupted write): save the whole index instead.
+        """
+        with open(path, "rb+") as fh:
+            fh.seek(0, os.SEEK_END)
+            if fh.tell():
+                fh.seek(-1, os.SEEK_END)
+                if fh.read(1) != b"\n":
+                    raise ValueError(f"{path} ends with an incomplete line")
+            fh.write(self._line(removed).encode("utf-8"))
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_len: Dict[int, int] = {}
+        ids: Dict[str, List[int]] = {}
+        names: Dict[Tuple[str, ...], List[int]] = {}
+        removed: Set[int] = set()
+        data = None
+        with open(path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                data = json.loads(line)
+                removed.update(data.get("removed", ()))
+                doc_len.update((slot, n) for slot, n in data["doc_len"])
+                for term, slots in data["postings"].items():
+                    postings.setdefault(term, {}).update((slot, tf) for slot, tf in slots)
+                for token, slots in data["ids"].items():
+                    ids.setdefault(token, []).extend(slots)
+                for name, slots in data["names"]:
+                    names.setdefault(tuple(name.split()), []).extend(slots)
+        if data is None:
+            raise ValueError(f"{path} is empty")
+
+        if removed:
+            # Slots are never reused, so a removed slot is dropped from every earlier line
+            doc_len = {slot: n for slot, n in doc_len.items() if slot not in removed}
+            for term in list(postings):
+                slots = {slot: tf for slot, tf in postings[term].items() if slot not in removed}
+                if slots:
+                    postings[term] = slots
+                else:
+                    del postings[term]
+            for table in (ids, names):
+                for key in list(table):
+                    slots = [slot for slot in table[key] if slot not in removed]
+                    if slots:
+                        table[key] = slots
+                    else:
+                        del table[key]
+        return cls(postings, doc_len, ids, names, rows=data["rows"], version=data.get("version"))
+
+    # ----------------- Queries -----------------
+    def exact_lookup(self, query: str) -> Tuple[List[int], bool]:
+        """
+        Slots whose identifiers or patient name appear in `query`, and whether the query
+        is nothing but a lookup (every other word is a filler such as "show", "record", "ID").
+        """
+        slots: List[int] = []
+        covered: Set[str] = set()
+
+        for token in identifier_tokens(query):
+            if token in self.ids:
+                slots.extend(self.ids[token])
+                covered.add(token)
+
+        words = word_tokens(query)
+        matched_words: Set[int] = set()
+        for i, word in enumerate(words):
+            for name in self._names_by_first.get(word, ()):
+                if tuple(words[i:i + len(name)]) == name:
+                    slots.extend(self.names[name])
+                    matched_words.update(range(i, i + len(name)))
+
+        # Any word left besides fillers means the query asks for more than the record
+        rest = [w for i, w in enumerate(words) if i not in matched_words and w not in LOOKUP_WORDS]
+        unmatched_ids = [t for t in identifier_tokens(query) if t not in covered]
+        is_lookup = bool(slots) and not rest and not unmatched_ids
+        return list(dict.fromkeys(slots)), is_lookup
+
+    def bm25(self, query: str) -> Dict[int, float]:
+        """BM25 score per slot for the query's name words and identifiers."""
+        terms = [t for t in word_tokens(query) if t not in LOOKUP_WORDS] + identifier_tokens(query)
+        n_docs = len(self.doc_len)
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            slots = self.postings.get(term)
+            if not slots:
+                continue
+            idf = math.log(1 + (n_docs - len(slots) + 0.5) / (len(slots) + 0.5))
+            for slot, tf in slots.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[slot] / self._avg_len)
+                scores[slot] = scores.get(slot, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+
+def fuse_rankings(
+    vector_slots: Iterable[int],
+    bm25_scores: Dict[int, float],
+    exact_slots: Iterable[int],
+    lexical_candidates: int = LEXICAL_CANDIDATES,
+) -> List[Tuple[int, float]]:
+    """
+    Reciprocal rank fusion of the vector ranking (closest first) and the BM25 ranking;
+    exact name / identifier matches get EXACT_MATCH_BOOST so they come first.
+    Returns (slot, score) pairs, best first.
+    """
+    scores: Dict[int, float] = {}
+    for rank, slot in enumerate(vector_slots, 1):
+        scores[slot] = scores.get(slot, 0.0) + 1.0 / (RRF_K + rank)
+    lexical = sorted(bm25_scores.items(), key=lambda kv: -kv[1])[:lexical_candidates]
+    for rank, (slot, _) in enumerate(lexical, 1):
+        scores[slot] = scores.get(slot, 0.0) + 1.0 / (RRF_K + rank)
+    for slot in exact_slots:
+        scores[slot] = scores.get(slot, 0.0) + EXACT_MATCH_BOOST
+    return sorted(scores.items(), key=lambda kv: -kv[1])
+
+
+def load_lexical_index(path: str, metadata_list: Sequence[Optional[Dict[str, Any]]], version: Optional[str]) -> LexicalIndex:
+    """
+    The lexical index saved with vectorstore `version`, or one built from `metadata_list`
+    when the file is missing or belongs to another build.
+    """
+    if version is not None and os.path.exists(path):
+        try:
+            lexical = LexicalIndex.load(path)
+            if lexical.version == version and lexical.rows == len(metadata_list):
+                return lexical
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: failed to load {path}: {e}")
+    print("Lexical index missing or out of date; building it from the summary metadata.")
+    return LexicalIndex.build(metadata_list, version)
@@ -1,78 +1,291 @@
 # rag_agent/services/llm_agent.py
+import asyncio
 import json
-from typing import List, Dict, Any, Optional
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 
-from config.settings import GOOGLE_API_KEY
-import google.generativeai as genai
+from config.settings import (
+    GOOGLE_API_KEY,
+    RAG_CPU_WORKERS,
+    GEMINI_TIMEOUT_SECONDS,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_MAX_DISTANCE,
+    CONTEXT_MIN_RECORDS,
+)
+from config.resources import resources
+from config.metrics import operation, stage, record, count, in_context
 
-from .rag_utils import load_summary_index, search_summary_index
+from document_ai.faiss_encode.query_cache import query_embedding_cache
+from .rag_utils import hybrid_search_summary_index, get_embedder, embed_model_key
+from .index_store import summary_store, SummaryIndexSnapshot
+from .answer_cache import answer_cache, context_key
+from .context_planner import plan_context
+from .metadata_filter import SummaryFilter
 
-# Configure Gemini
-genai.configure(api_key=GOOGLE_API_KEY)
+def _load_gemini():
+    # Imported here: the Gemini client library takes most of a second to import
+    import google.generativeai as genai
+    genai.configure(api_key=GOOGLE_API_KEY)
+    return genai
+
+
+# Configure Gemini (on first use)
+resources.register("gemini", _load_gemini)
 GEMINI_MODEL = "gemini-2.5-flash"  # desired model
 
+# Dedicated pool for CPU-bound work (embedding, FAISS search) on the async request path
+cpu_executor = ThreadPoolExecutor(max_workers=RAG_CPU_WORKERS, thread_name_prefix="rag-cpu")
+
+
+def build_answer_prompt(question: str, context_text: str) -> str:
+    return (
+        "You are a medical assistant. Use the context below (structured patient summaries) to answer the question.\n\n"
+        f"Context:\n{context_text}\n\nQuestion: {question}\n\nAnswer concisely and in plain text."
+    )
+
+
 def generate_answer_with_gemini(question: str, context_text: str, model: str = GEMINI_MODEL) -> str:
     """
     Sends a prompt to Gemini and returns text result.
     If you don't want to use Gemini, you can skip calling this and just return metadata.
     """
-    prompt = (
-        "You are a medical assistant. Use the context below (structured patient summaries) to answer the question.\n\n"
-        f"Context:\n{context_text}\n\nQuestion: {question}\n\nAnswer concisely and in plain text."
-    )
+    prompt = build_answer_prompt(question, context_text)
     try:
-        resp = genai.GenerativeModel(model).generate_content(prompt)
+        resp = resources.get("gemini").GenerativeModel(model).generate_content(prompt)
         return resp.text.strip()
     except Exception as e:
         print(f"Gemini error: {e}")
         return f"Error generating answer: {e}"
 
 
-def answer_query(
+async def generate_answer_with_gemini_async(
     question: str,
-    top_k: Optional[int] = None,  # None = fetch all summaries
-    use_gemini: bool = False,
-) -> Dict[str, Any]:
+    context_text: str,
+    model: str = GEMINI_MODEL,
+    timeout: float = GEMINI_TIMEOUT_SECONDS,
+) -> str:
+    """Async variant of generate_answer_with_gemini with a per-request timeout. Cancellable."""
+    prompt = build_answer_prompt(question, context_text)
+    try:
+        resp = await asyncio.wait_for(
+            resources.get("gemini").GenerativeModel(model).generate_content_async(prompt, request_options={"timeout": timeout}),
+            timeout=timeout,
+        )
+        return resp.text.strip()
+    except asyncio.TimeoutError:
+        print(f"Gemini error: timed out after {timeout}s")
+        return f"Error generating answer: timed out after {timeout}s"
+    except Exception as e:
+        print(f"Gemini error: {e}")
+        return f"Error generating answer: {e}"
+
+
+async def stream_answer_with_gemini(
+    question: str,
+    context_text: str,
+    model: str = GEMINI_MODEL,
+    timeout: float = GEMINI_TIMEOUT_SECONDS,
+) -> AsyncIterator[str]:
+    """Yield answer text chunks as Gemini produces them; the whole stream is bounded by `timeout`."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    prompt = build_answer_prompt(question, context_text)
+
+    response = await asyncio.wait_for(
+        resources.get("gemini").GenerativeModel(model).generate_content_async(
+            prompt, stream=True, request_options={"timeout": timeout}
+        ),
+        timeout=timeout,
+    )
+    chunks = response.__aiter__()
+    while True:
+        try:
+            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline - loop.time(), 0.001))
+        except StopAsyncIteration:
+            return
+        try:
+            text = chunk.text
+        except ValueError:
+            continue  # chunk without text parts (e.g. the final finish-reason chunk)
+        if text:
+            yield text
+
+
+def retrieve_context(
+    question: str,
+    top_k: Optional[int] = None,
+    where: Optional[SummaryFilter] = None,
+) -> Tuple[Dict[str, Any], str, SummaryIndexSnapshot]:
     """
-    1) Load summary index
-    2) Retrieve top_k summary records (all if top_k=None)
-    3) Optionally call Gemini to synthesize an answer
-    4) Return only summaries that contributed to the answer and exclude NA/empty fields
+    Retrieval half of answer_query (CPU-bound: embedding + FAISS search).
+    top_k=None retrieves every summary within CONTEXT_MAX_DISTANCE of the question.
+    Questions naming a patient or an ID are matched in the lexical index (exact lookups
+    skip the embedding entirely) and fused with the vector ranking.
+    `where` restricts retrieval to matching records (patient, processed_at range, has_diagnosis)
+    inside the FAISS search, using the snapshot's column index.
+    Returns (result dict with retrieved records, context text for the LLM, index snapshot used).
     """
-    index, texts, metadata_list = load_summary_index()
-
-    # Determine number of results to fetch
-    search_top_k = top_k if top_k is not None else len(metadata_list)
+    with stage("index_load"):
+        snapshot = summary_store.get()
 
-    retrieved = search_summary_index(
+    # top_k=None: every summary relevant to the question, rather than the whole index
+    retrieved = hybrid_search_summary_index(
         question,
-        top_k=search_top_k,
-        index=index,
-        metadata_list=metadata_list
+        lexical=snapshot.lexical,
+        index=snapshot.index,
+        metadata_list=snapshot.metadata_list,
+        top_k=top_k,
+        max_distance=CONTEXT_MAX_DISTANCE,
+        min_results=CONTEXT_MIN_RECORDS,
+        where=where,
+        filter_index=snapshot.filters,
     )
 
-    filtered_retrieved = []
-    context_items = []
+    # Merge duplicates per patient and pack the most relevant fields into the token budget
+    with stage("context_planning"):
+        filtered_retrieved, context_text = plan_context(retrieved, token_budget=CONTEXT_TOKEN_BUDGET)
+    count("records_retrieved", len(filtered_retrieved))
 
-    for r in retrieved:
-        summary = r["metadata"].get("summary", {})
+    result = {"retrieved": filtered_retrieved, "retrieved_count": len(filtered_retrieved)}
+    return result, context_text, snapshot
 
-        # Keep only fields that have valid data
-        valid_fields = {k: v for k, v in summary.items() if v and v.strip().upper() != "NA"}
-        if not valid_fields:
-            continue  # skip records with no valid data
 
-        filtered_retrieved.append(r)
+def lookup_cached_answer(question: str, context_text: str):
+    """Return (cached answer or None, question vector, context key) for the answer cache."""
+    with stage("answer_cache"):
+        # Already computed by the search, so this is a query cache hit
+        question_vector = query_embedding_cache.encode(get_embedder(), [question], model_name=embed_model_key())[0]
+        ctx_key = context_key(context_text)
+        answer = answer_cache.get(ctx_key, question_vector)
+    count("answer_cache_hits" if answer is not None else "answer_cache_misses")
+    return answer, question_vector, ctx_key
 
-        # Build context string for Gemini from valid fields
-        context_items.append("\n".join([f"{k}: {v}" for k, v in valid_fields.items()]))
 
-    context_text = "\n\n---\n\n".join(context_items) if context_items else ""
+def _store_answer(question_vector, ctx_key: str, answer: str):
+    if not answer.startswith("Error generating answer"):
+        answer_cache.put(ctx_key, question_vector, answer)
 
-    result = {"retrieved": filtered_retrieved, "retrieved_count": len(filtered_retrieved)}
+
+@operation("ask")
+def answer_query(
+    question: str,
+    top_k: Optional[int] = None,  # None = all summaries relevant to the question
+    use_gemini: bool = False,
+    where: Optional[SummaryFilter] = None,
+) -> Dict[str, Any]:
+    """
+    1) Get the shared summary index (loaded once, reloaded when the vectorstore changes)
+    2) Retrieve top_k summary records (all relevant ones if top_k=None) and pack them,
+       merged per patient, into the context token budget
+    3) Optionally call Gemini to synthesize an answer (reusing a cached answer to an
+       equivalent question over the same records when there is one)
+    4) Return only summaries that contributed to the answer and exclude NA/empty fields
+    `where` restricts step 2 to records matching the metadata predicates.
+    """
+    result, context_text, snapshot = retrieve_context(question, top_k, where)
 
     if use_gemini and context_text:
-        answer = generate_answer_with_gemini(question, context_text)
+        answer, question_vector, ctx_key = lookup_cached_answer(question, context_text)
+        result["answer_cached"] = answer is not None
+        if answer is None:
+            count("gemini_calls")
+            with stage("gemini"):
+                answer = generate_answer_with_gemini(question, context_text)
+            _store_answer(question_vector, ctx_key, answer)
         result["answer"] = answer
 
     return result
+
+
+async def answer_query_async(
+    question: str,
+    top_k: Optional[int] = None,
+    use_gemini: bool = False,
+    executor: Optional[Executor] = None,
+    timeout: float = GEMINI_TIMEOUT_SECONDS,
+    where: Optional[SummaryFilter] = None,
+) -> Dict[str, Any]:
+    """
+    Non-blocking answer_query for the API: retrieval runs on `executor` (cpu_executor by
+    default) and Gemini is called with the async client, bounded by `timeout`.
+    Cancelling the coroutine (e.g. when the client disconnects) cancels the Gemini call.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or cpu_executor
+
+    with operation("ask"):
+        result, context_text, snapshot = await loop.run_in_executor(
+            executor, in_context(retrieve_context), question, top_k, where
+        )
+
+        if use_gemini and context_text:
+            answer, question_vector, ctx_key = await loop.run_in_executor(
+                executor, in_context(lookup_cached_answer), question, context_text
+            )
+            result["answer_cached"] = answer is not None
+            if answer is None:
+                count("gemini_calls")
+                gemini_started = time.perf_counter()  # awaited, so timed without attaching the profiler
+                answer = await generate_answer_with_gemini_async(question, context_text, timeout=timeout)
+                record("gemini", time.perf_counter() - gemini_started)
+                _store_answer(question_vector, ctx_key, answer)
+            result["answer"] = answer
+
+    return result
+
+
+async def stream_answer_query(
+    question: str,
+    top_k: Optional[int] = None,
+    use_gemini: bool = False,
+    executor: Optional[Executor] = None,
+    timeout: float = GEMINI_TIMEOUT_SECONDS,
+    where: Optional[SummaryFilter] = None,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming answer_query. Yields (event, data) pairs:
+      ("records", result)  as soon as retrieval finishes,
+      ("token", text)      for each answer chunk from Gemini (one chunk for a cached answer),
+      ("error", message)   if Gemini fails or times out,
+      ("done", {...})      at the end.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or cpu_executor
+
+    with operation("ask"):
+        result, context_text, snapshot = await loop.run_in_executor(
+            executor, in_context(retrieve_context), question, top_k, where
+        )
+        yield "records", result
+
+        if not (use_gemini and context_text):
+            yield "done", {"answer_cached": False}
+            return
+
+        answer, question_vector, ctx_key = await loop.run_in_executor(
+            executor, in_context(lookup_cached_answer), question, context_text
+        )
+        if answer is not None:
+            yield "token", answer
+            yield "done", {"answer_cached": True}
+            return
+
+        parts = []
+        count("gemini_calls")
+        # Time to the last chunk, including any time the client takes to read the stream
+        gemini_started = time.perf_counter()
+        try:
+            async for text in stream_answer_with_gemini(question, context_text, timeout=timeout):
+                parts.append(text)
+                yield "token", text
+        except asyncio.TimeoutError:
+            print(f"Gemini error: timed out after {timeout}s")
+            yield "error", f"Error generating answer: timed out after {timeout}s"
+        except Exception as e:
+            print(f"Gemini error: {e}")
+            yield "error", f"Error generating answer: {e}"
+        else:
+            _store_answer(question_vector, ctx_key, "".join(parts).strip())
+        record("gemini_stream", time.perf_counter() - gemini_started)
+        yield "done", {"answer_cached": False}
@@ -0,0 +1,130 @@
+# rag_agent/services/metadata_filter.py
+"""
+Metadata predicates for summary search (one patient, a processed_at range, records with a
+real Diagnosis). A FilterIndex precomputes per-slot columns once per vectorstore snapshot;
+a SummaryFilter compiles against it to the sorted vector ids that match, which the search
+turns into a FAISS ID selector (or scores directly when the subset is small).
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence, Union
+
+import faiss
+import numpy as np
+
+from .context_planner import is_valid_value
+from .lexical_index import LexicalIndex
+from .vectorstore_format import ColumnarMetadata
+
+NO_TIMESTAMP = np.iinfo(np.int64).min
+
+DateLike = Union[str, datetime, None]
+
+
+def _timestamp_us(value: DateLike) -> Optional[int]:
+    """Microseconds since the epoch of an ISO date / datetime (None if missing or unparseable)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None)  # processed_at is stored as local time without offset
+    return int(np.datetime64(value, "us").astype(np.int64))
+
+
+@dataclass(frozen=True)
+class SummaryFilter:
+    """
+    Predicates on summary records, all optional and combined with AND:
+    patient          - records of this patient (name or ID, as matched by the lexical index)
+    processed_from   - processed_at >= this date / datetime
+    processed_before - processed_at < this date / datetime
+    has_diagnosis    - True: only records with a real Diagnosis (not empty / NA / Not specified),
+                       False: only records without one
+    """
+    patient: Optional[str] = None
+    processed_from: DateLike = None
+    processed_before: DateLike = None
+    has_diagnosis: Optional[bool] = None
+
+    def is_empty(self) -> bool:
+        return (
+            not self.patient
+            and self.processed_from is None
+            and self.processed_before is None
+            and self.has_diagnosis is None
+        )
+
+
+class FilterIndex:
+    """
+    Column index over the summary slots (slot = vector id): liveness, processed_at sorted
+    for range lookups, and the has-diagnosis flag. Patient predicates use the lexical index.
+    """
+
+    def __init__(self, metadata_list: Sequence[Optional[Dict[str, Any]]], lexical: Optional[LexicalIndex] = None):
+        self.rows = len(metadata_list)
+        self.lexical = lexical if lexical is not None else LexicalIndex.build(metadata_list)
+
+        if isinstance(metadata_list, ColumnarMetadata):
+            # Straight from the mapped columns, without building a record per row
+            live = metadata_list.present.astype(bool)
+            processed = self._string_column(metadata_list, "processed_at")
+            diagnosis = self._string_column(metadata_list, "summary.Diagnosis")
+        else:
+            live = np.array([m is not None for m in metadata_list], dtype=bool)
+            processed = [(m or {}).get("processed_at") for m in metadata_list]
+            diagnosis = [((m or {}).get("summary") or {}).get("Diagnosis") for m in metadata_list]
+
+        self.live = live
+        self.has_diagnosis = np.array([is_valid_value(d) for d in diagnosis], dtype=bool) & live
+
+        timestamps = np.array([_timestamp_us(p) if isinstance(p, str) else None for p in processed], dtype=object)
+        known = np.array([t is not None for t in timestamps], dtype=bool) & live
+        stamps = np.full(self.rows, NO_TIMESTAMP, dtype=np.int64)
+        stamps[known] = timestamps[known].astype(np.int64)
+        self._time_order = np.flatnonzero(known)[np.argsort(stamps[known], kind="stable")]
+        self._time_sorted = stamps[self._time_order]
+
+    @staticmethod
+    def _string_column(metadata_list: ColumnarMetadata, name: str):
+        if name not in metadata_list.column_names:
+            return [None] * len(metadata_list)
+        column = metadata_list.column(name)
+        return column if hasattr(column, "get") else [None] * len(metadata_list)
+
+    def select(self, where: SummaryFilter) -> np.ndarray:
+        """Sorted ids of the live slots matching every predicate in `where`."""
+        mask = self.live.copy()
+
+        if where.has_diagnosis is not None:
+            mask &= self.has_diagnosis if where.has_diagnosis else ~self.has_diagnosis
+
+        if where.processed_from is not None or where.processed_before is not None:
+            start, end = 0, len(self._time_sorted)
+            low, high = _timestamp_us(where.processed_from), _timestamp_us(where.processed_before)
+            if (where.processed_from is not None and low is None) or (where.processed_before is not None and high is None):
+                raise ValueError("processed_from / processed_before must be ISO dates or datetimes")
+            if low is not None:
+                start = int(np.searchsorted(self._time_sorted, low, side="left"))
+            if high is not None:
+                end = int(np.searchsorted(self._time_sorted, high, side="left"))
+            in_range = np.zeros(self.rows, dtype=bool)
+            in_range[self._time_order[start:end]] = True
+            mask &= in_range
+
+        if where.patient:
+            slots, _ = self.lexical.exact_lookup(where.patient)
+            of_patient = np.zeros(self.rows, dtype=bool)
+            of_patient[[s for s in slots if s < self.rows]] = True
+            mask &= of_patient
+
+        return np.flatnonzero(mask).astype(np.int64)
+
+
+def id_selector(ids: np.ndarray) -> faiss.IDSelector:
+    """FAISS selector accepting exactly `ids` (hash set, so each check is O(1))."""
+    return faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
@@ -0,0 +1,93 @@
+# rag_agent/services/migrate_vectorstore.py
+"""
+Convert a summary vectorstore from the old summary_texts.npy / summary_metadata.json
+files to the memory-mapped column files read by load_summary_index().
+
+    python -m rag_agent.services.migrate_vectorstore
+    python -m rag_agent.services.migrate_vectorstore --vstore-dir rag_agent/vectorstore --remove-legacy
+
+The FAISS index file is already in a mappable format and is left as it is.
+"""
+import argparse
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vectorstore_format import write_texts, write_metadata, open_texts, ColumnarMetadata
+from .rag_utils import (
+    VSTORE_DIR,
+    SUMMARY_TEXTS_FILE,
+    SUMMARY_METADATA_FILE,
+    SUMMARY_VERSION_FILE,
+    LEGACY_SUMMARY_TEXTS_FILE,
+    LEGACY_SUMMARY_METADATA_FILE,
+    _tmp_path,
+)
+
+
+def load_legacy_vectorstore(texts_file: str, metadata_file: str) -> Tuple[List[Optional[str]], List[Optional[Dict[str, Any]]]]:
+    """Read the old format. The .npy holds a pickled object array, so only load files you wrote."""
+    texts = []
+    if os.path.exists(texts_file):
+        texts = np.load(texts_file, allow_pickle=True).tolist()
+    metadata_list = []
+    if os.path.exists(metadata_file):
+        with open(metadata_file, "r", encoding="utf-8") as fh:
+            metadata_list = json.load(fh)
+    return texts, metadata_list
+
+
+def migrate_vectorstore(vstore_dir: str = VSTORE_DIR, remove_legacy: bool = False) -> int:
+    """Write the column files from the legacy files in `vstore_dir`, verify them and bump the version stamp."""
+    def path(default: str) -> str:
+        return os.path.join(vstore_dir, os.path.basename(default))
+
+    legacy_texts, legacy_metadata = path(LEGACY_SUMMARY_TEXTS_FILE), path(LEGACY_SUMMARY_METADATA_FILE)
+    if not os.path.exists(legacy_texts) and not os.path.exists(legacy_metadata):
+        print(f"No legacy vectorstore files in {vstore_dir}; nothing to migrate.")
+        return 0
+
+    texts, metadata_list = load_legacy_vectorstore(legacy_texts, legacy_metadata)
+    texts_file, metadata_file = path(SUMMARY_TEXTS_FILE), path(SUMMARY_METADATA_FILE)
+
+    write_texts(_tmp_path(texts_file), texts)
+    write_metadata(_tmp_path(metadata_file), metadata_list)
+
+    # Check the new files read back exactly before switching to them
+    if list(open_texts(_tmp_path(texts_file))) != texts:
+        raise RuntimeError("Migrated texts do not match the legacy file")
+    if list(ColumnarMetadata(_tmp_path(metadata_file))) != metadata_list:
+        raise RuntimeError("Migrated metadata does not match the legacy file")
+
+    os.replace(_tmp_path(texts_file), texts_file)
+    os.replace(_tmp_path(metadata_file), metadata_file)
+
+    # New stamp so running services reload from the new files
+    version_file = path(SUMMARY_VERSION_FILE)
+    with open(_tmp_path(version_file), "w", encoding="utf-8") as fh:
+        fh.write(f"{datetime.now().isoformat()}-{uuid.uuid4().hex[:8]}")
+    os.replace(_tmp_path(version_file), version_file)
+
+    print(f"Migrated {len(texts)} texts and {len(metadata_list)} metadata records to {texts_file} and {metadata_file}.")
+    if remove_legacy:
+        for legacy in (legacy_texts, legacy_metadata):
+            if os.path.exists(legacy):
+                os.remove(legacy)
+        print("Removed the legacy files.")
+    return len(metadata_list)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vstore-dir", default=VSTORE_DIR)
+    parser.add_argument("--remove-legacy", action="store_true", help="delete the .npy/.json files afterwards")
+    args = parser.parse_args()
+    migrate_vectorstore(args.vstore_dir, remove_legacy=args.remove_legacy)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,59 @@
 # rag_agent/services/rag_utils.py
 import os
 import json
-from typing import List, Tuple, Dict, Any
+import uuid
+import hashlib
+from datetime import datetime
+from typing import List, Tuple, Dict, Any, Sequence
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import faiss
 
+from document_ai.faiss_encode.query_cache import query_embedding_cache
+from document_ai.faiss_encode.embedding import get_embed_model, embed_model_key, EMBED_MODEL_NAME, EMBED_DIM
+from document_ai.faiss_encode.query_batcher import QueryBatcher
+from document_ai.faiss_encode.index_factory import (
+    create_index,
+    supports_remove,
+    apply_search_params,
+    is_compressed,
+    selector_params,
+)
+from document_ai.faiss_encode.rerank import (
+    MappedVectors,
+    RerankedIndex,
+    VectorFile,
+    VECTOR_DTYPE,
+    write_vector_file,
+    with_rerank,
+    unwrap,
+)
+from config.settings import FAISS_INDEX_SPEC
+from config.metrics import stage
+from .vectorstore_format import (
+    write_texts,
+    write_metadata,
+    append_texts,
+    append_metadata,
+    read_layout,
+    open_texts,
+    ColumnarMetadata,
+)
+from .lexical_index import LexicalIndex, fuse_rankings
+from .metadata_filter import SummaryFilter, FilterIndex, id_selector
+
+# Read the index with its vectors memory-mapped (shared between processes, no copy on load)
+FAISS_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+# Filtered searches over at most this many records score them directly instead of searching the index
+FILTER_EXACT_MAX_IDS = 1024
+
+# Incremental builds append to the vectorstore files; a build compacts them (renumbers the
+# live records and rewrites every file) once removed slots pass this fraction of all slots,
+# or once the files hold this many appended groups
+COMPACT_TOMBSTONE_FRACTION = 0.2
+COMPACT_MAX_SEGMENTS = 64
+
 # Paths (adjust if you want)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # intraintel/
 SUMMARIES_DIR = os.path.join(BASE_DIR, "summarize", "summaries")  # where Task2 .json files live
@@ -14,22 +61,39 @@ VSTORE_DIR = os.path.join(BASE_DIR, "rag_agent", "vectorstore")
 os.makedirs(VSTORE_DIR, exist_ok=True)
 
 SUMMARY_INDEX_FILE = os.path.join(VSTORE_DIR, "summary_index.index")
-SUMMARY_TEXTS_FILE = os.path.join(VSTORE_DIR, "summary_texts.npy")
-SUMMARY_METADATA_FILE = os.path.join(VSTORE_DIR, "summary_metadata.json")
+SUMMARY_TEXTS_FILE = os.path.join(VSTORE_DIR, "summary_texts.col")  # memory-mapped, see vectorstore_format
+SUMMARY_METADATA_FILE = os.path.join(VSTORE_DIR, "summary_metadata.col")
+SUMMARY_VECTORS_FILE = os.path.join(VSTORE_DIR, "summary_vectors.f32")  # full precision, row = vector id
+SUMMARY_LEXICAL_FILE = os.path.join(VSTORE_DIR, "summary_lexical.json")  # names / IDs / BM25, see lexical_index
+LEGACY_SUMMARY_TEXTS_FILE = os.path.join(VSTORE_DIR, "summary_texts.npy")  # converted by migrate_vectorstore
+LEGACY_SUMMARY_METADATA_FILE = os.path.join(VSTORE_DIR, "summary_metadata.json")
+SUMMARY_VERSION_FILE = os.path.join(VSTORE_DIR, "summary_version.txt")  # written last; readers reload on change
+SUMMARY_MANIFEST_FILE = os.path.join(VSTORE_DIR, "summary_manifest.json")  # file -> content hash + vector id
 
-# Embedding model (same family as Task1 to keep similarity behaviour consistent)
-EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
-EMBED_DIM = 384  # dimension for all-MiniLM-L6-v2
-
-# lazy model loader
-_embedder = None
+# Embedding model: the same instance as Task1 (document search), loaded lazily by the resource registry
 
 
 def get_embedder():
-    global _embedder
-    if _embedder is None:
-        _embedder = SentenceTransformer(EMBED_MODEL_NAME)
-    return _embedder
+    return get_embed_model()
+
+
+def list_summary_files(summaries_dir: str = SUMMARIES_DIR) -> List[str]:
+    """Sorted file names of the JSON summaries in the folder."""
+    return sorted(f for f in os.listdir(summaries_dir) if f.lower().endswith(".json"))
+
+
+def file_content_hash(path: str) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    """Embed queries through the shared query embedding cache."""
+    return query_embedding_cache.encode(get_embedder(), queries, model_name=embed_model_key())
+
+
+# Coalesces concurrent summary searches into batched encode + search calls
+query_batcher = QueryBatcher(encode_queries)
 
 
 def load_summaries_from_folder(summaries_dir: str = SUMMARIES_DIR) -> List[Dict[str, Any]]:
@@ -78,6 +142,206 @@ def summary_to_text(metadata: Dict[str, Any]) -> str:
     return text
 
 
+def _tmp_path(path: str) -> str:
+    """Temporary sibling path keeping the original extension (np.save appends .npy otherwise)."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.tmp{ext}"
+
+
+def save_summary_vectorstore(
+    index: faiss.Index,
+    texts: List[str],
+    metadata_list: List[Dict[str, Any]],
+    index_file: str = SUMMARY_INDEX_FILE,
+    texts_file: str = SUMMARY_TEXTS_FILE,
+    metadata_file: str = SUMMARY_METADATA_FILE,
+    version_file: str = SUMMARY_VERSION_FILE,
+    manifest: Dict[str, Dict[str, Any]] = None,
+    manifest_file: str = SUMMARY_MANIFEST_FILE,
+    vectors: np.ndarray = None,
+    vectors_file: str = SUMMARY_VECTORS_FILE,
+    lexical_file: str = SUMMARY_LEXICAL_FILE,
+) -> str:
+    """
+    Persist index, texts, metadata, the lexical index and (if given) the build manifest and
+    full-precision vectors (one row per vector id, used to re-rank compressed indexes), then
+    write a new version stamp. Each file is written to a temporary path and renamed into
+    place so that readers never see a half-written file. Returns the new version stamp.
+    """
+    version = f"{datetime.now().isoformat()}-{uuid.uuid4().hex[:8]}"
+
+    faiss.write_index(index, _tmp_path(index_file))
+    write_texts(_tmp_path(texts_file), texts)
+    write_metadata(_tmp_path(metadata_file), metadata_list)
+    # Stamped with the version so readers can tell it belongs to this build
+    LexicalIndex.build(metadata_list, version).save(_tmp_path(lexical_file))
+    if vectors is not None:
+        write_vector_file(_tmp_path(vectors_file), vectors)
+        os.replace(_tmp_path(vectors_file), vectors_file)
+    elif os.path.exists(vectors_file):
+        os.remove(vectors_file)  # stale: ids no longer match
+
+    os.replace(_tmp_path(index_file), index_file)
+    os.replace(_tmp_path(texts_file), texts_file)
+    os.replace(_tmp_path(metadata_file), metadata_file)
+    os.replace(_tmp_path(lexical_file), lexical_file)
+
+    if manifest is not None:
+        _save_manifest(manifest_file, manifest, len(metadata_list))
+    _write_version(version_file, version)
+    return version
+
+
+def append_summary_vectorstore(
+    index: faiss.Index,
+    texts: List[str],
+    metadata_list: List[Dict[str, Any]],
+    vectors: np.ndarray,
+    removed_ids: List[int],
+    rows: int,
+    manifest: Dict[str, Dict[str, Any]],
+    index_file: str = SUMMARY_INDEX_FILE,
+    texts_file: str = SUMMARY_TEXTS_FILE,
+    metadata_file: str = SUMMARY_METADATA_FILE,
+    version_file: str = SUMMARY_VERSION_FILE,
+    manifest_file: str = SUMMARY_MANIFEST_FILE,
+    vectors_file: str = SUMMARY_VECTORS_FILE,
+    lexical_file: str = SUMMARY_LEXICAL_FILE,
+) -> str:
+    """
+    Add summaries to a saved vectorstore of `rows` slots without rewriting it: the new
+    texts, metadata, full-precision vectors and lexical entries (slots rows, rows + 1, ...)
+    are appended to their files and the slots in `removed_ids` are marked removed. Only the
+    index, the manifest and the version stamp are written whole.
+    The metadata goes first and raises ValueError, before anything is written or `index`
+    is touched, if the records don't fit the existing columns; rewrite the store then.
+    Returns the new version stamp.
+    """
+    version = f"{datetime.now().isoformat()}-{uuid.uuid4().hex[:8]}"
+
+    append_metadata(metadata_file, metadata_list, removed_ids)
+    if len(metadata_list):
+        index.add_with_ids(vectors, np.arange(rows, rows + len(metadata_list), dtype=np.int64))
+    append_texts(texts_file, texts, removed_ids)
+    if os.path.exists(vectors_file) and len(metadata_list):
+        appended = VectorFile(vectors_file, index.d)
+        appended.append(vectors)
+        appended.close()
+    LexicalIndex.build(metadata_list, version, first_slot=rows).append(lexical_file, removed_ids)
+
+    faiss.write_index(index, _tmp_path(index_file))
+    os.replace(_tmp_path(index_file), index_file)
+    _save_manifest(manifest_file, manifest, rows + len(metadata_list))
+    _write_version(version_file, version)
+    return version
+
+
+def _write_version(version_file: str, version: str):
+    with open(_tmp_path(version_file), "w", encoding="utf-8") as fh:
+        fh.write(version)
+    os.replace(_tmp_path(version_file), version_file)
+
+
+def _save_manifest(manifest_file: str, manifest: Dict[str, Dict[str, Any]], rows: int):
+    with open(_tmp_path(manifest_file), "w", encoding="utf-8") as fh:
+        json.dump({"rows": rows, "files": manifest}, fh, ensure_ascii=False, indent=2)
+    os.replace(_tmp_path(manifest_file), manifest_file)
+
+
+def _load_manifest(manifest_file: str) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """(file -> entry, number of slots saved); (None, None) without a manifest."""
+    if not os.path.exists(manifest_file):
+        return None, None
+    with open(manifest_file, "r", encoding="utf-8") as fh:
+        data = json.load(fh)
+    if "files" in data and "rows" in data:
+        return data["files"], data["rows"]
+    return data, None  # written before the slot count was recorded
+
+
+def _scan_summaries(summaries_dir: str, known: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    File name -> {"hash", "size", "mtime_ns"} of every summary file. Files whose size and
+    mtime match their manifest entry keep the recorded hash instead of being read again.
+    """
+    current = {}
+    for f in list_summary_files(summaries_dir):
+        path = os.path.join(summaries_dir, f)
+        st = os.stat(path)
+        entry = known.get(f)
+        if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            digest = entry["hash"]
+        else:
+            digest = file_content_hash(path)
+        current[f] = {"hash": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return current
+
+
+def _load_full_vectors(index: faiss.Index, vectors_file: str, n_slots: int, embed_dim: int) -> np.ndarray:
+    """
+    Full-precision vectors for every slot (zeros for removed ones), from the vectors file or
+    else from an index that stores exact vectors. None when neither has them.
+    """
+    if os.path.exists(vectors_file):
+        vectors = np.fromfile(vectors_file, dtype=np.float32)
+        if len(vectors) == n_slots * embed_dim:
+            return vectors.reshape(n_slots, embed_dim)
+    if is_compressed(index):
+        print(f"Warning: {vectors_file} is missing or out of date; compressed summary index won't be re-ranked.")
+        return None
+    vectors = np.zeros((n_slots, embed_dim), dtype=np.float32)
+    for vid in faiss.vector_to_array(index.id_map):
+        vectors[vid] = index.reconstruct(int(vid))
+    return vectors
+
+
+def _compact_index(
+    index: faiss.Index,
+    live_ids: np.ndarray,
+    embed_dim: int,
+    index_spec: str,
+    full_vectors: np.ndarray = None,
+) -> faiss.Index:
+    """
+    `index` with the vectors of `live_ids` (sorted) renumbered 0, 1, ... in id order.
+    Indexes that can delete already hold only live vectors and just get a new id map;
+    HNSW graphs, which keep removed vectors until now, are rebuilt from `full_vectors`
+    (rows by old id) when given, else from the vectors stored in `index`.
+    """
+    if supports_remove(index):
+        stored = faiss.vector_to_array(index.id_map)
+        faiss.copy_array_to_vector(np.searchsorted(live_ids, stored).astype(np.int64), index.id_map)
+        index.construct_rev_map()
+        return index
+    if not len(live_ids):
+        vectors = np.zeros((0, embed_dim), "float32")
+    elif full_vectors is not None:
+        vectors = full_vectors[live_ids]
+    else:
+        vectors = np.vstack([index.reconstruct(int(i)) for i in live_ids])
+    rebuilt = create_index(vectors, embed_dim, index_spec, with_ids=True)
+    if len(live_ids):
+        rebuilt.add_with_ids(vectors, np.arange(len(live_ids), dtype=np.int64))
+    return rebuilt
+
+
+def _append_problem(metadata_list, texts_file: str, vectors_file: str, lexical_file: str, rows: int, embed_dim: int) -> str:
+    """Why the saved vectorstore can't be appended to (None if it can)."""
+    if not isinstance(metadata_list, ColumnarMetadata):
+        return "it is in the old .npy/.json format"
+    if not metadata_list.appendable or not read_layout(texts_file)["appendable"]:
+        return "its column files are in the first format"
+    if os.path.exists(vectors_file) and os.path.getsize(vectors_file) != rows * embed_dim * VECTOR_DTYPE.itemsize:
+        return f"{os.path.basename(vectors_file)} doesn't match the slots"
+    if not os.path.exists(lexical_file):
+        return f"{os.path.basename(lexical_file)} is missing"
+    with open(lexical_file, "rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        if fh.tell() == 0 or (fh.seek(-1, os.SEEK_END) and fh.read(1) != b"\n"):
+            return f"{os.path.basename(lexical_file)} is incomplete"
+    return None
+
+
 def build_summary_index(
     summaries_dir: str = SUMMARIES_DIR,
     index_file: str = SUMMARY_INDEX_FILE,
@@ -85,38 +349,169 @@ def build_summary_index(
     metadata_file: str = SUMMARY_METADATA_FILE,
     embed_model_name: str = EMBED_MODEL_NAME,
     embed_dim: int = EMBED_DIM,
-) -> Tuple[faiss.IndexFlatL2, List[str], List[Dict[str, Any]]]:
+    version_file: str = SUMMARY_VERSION_FILE,
+    manifest_file: str = SUMMARY_MANIFEST_FILE,
+    incremental: bool = True,
+    index_spec: str = FAISS_INDEX_SPEC,
+    vectors_file: str = SUMMARY_VECTORS_FILE,
+    lexical_file: str = SUMMARY_LEXICAL_FILE,
+) -> Tuple[faiss.Index, Sequence[str], Sequence[Dict[str, Any]]]:
     """
-    Build a FAISS index from the summary JSON files.
-    Saves index, texts (.npy) and metadata (.json) to VSTORE_DIR.
-    Returns (index, texts_list, metadata_list).
+    Build or update the FAISS index from the summary JSON files.
+
+    Vectors live in an IndexIDMap2 and the manifest records, per summary file, its content
+    hash, size, mtime and vector id (files whose size and mtime are unchanged aren't hashed
+    again). With `incremental=True` only added or changed files are embedded: their texts,
+    metadata, full-precision vectors and lexical entries are appended to the saved files
+    under new ids, and the slots of deleted or changed files are marked removed (their
+    vectors are removed by id; HNSW, which can't delete, keeps them until compaction and
+    searches skip them). Only the index and the manifest are rewritten, so an update costs
+    about the size of the change.
+    Once removed slots exceed COMPACT_TOMBSTONE_FRACTION of all slots, or the files hold
+    COMPACT_MAX_SEGMENTS appended groups, the build compacts the store instead: live records
+    are renumbered 0..n-1 and every file is rewritten, without embedding anything again.
+    Without a manifest, with `incremental=False`, or when the files don't match the manifest
+    (an interrupted build), everything is rebuilt from scratch.
+    A full build picks the index type from `index_spec` (see index_factory; "auto" chooses
+    by corpus size) and trains it on the embedded summaries. The full-precision vectors are
+    kept next to the index (`vectors_file`) so compressed index types ("sq_fp16", "pq", ...)
+    can re-rank their results exactly and be rebuilt losslessly.
+    Returns (index, texts, metadata_list) as saved.
     """
-    print("Loading summary JSON files...")
-    metadata_list = load_summaries_from_folder(summaries_dir)
-    if not metadata_list:
+    print("Scanning summary JSON files...")
+    manifest, rows = _load_manifest(manifest_file) if incremental and os.path.exists(index_file) else (None, None)
+    current = _scan_summaries(summaries_dir, manifest or {})
+    if not current:
         raise RuntimeError(f"No summaries found in {summaries_dir} — please run Task 2 first.")
 
-    print(f"Found {len(metadata_list)} summary files. Converting to text for embedding...")
-    texts = [summary_to_text(m) for m in metadata_list]
+    if manifest is not None:
+        index, texts, metadata_list = load_summary_index(index_file, texts_file, metadata_file, mmap=False, rerank=False)
+        if rows is None:
+            rows = len(metadata_list)  # manifest from before the slot count was recorded
+        if not isinstance(index, faiss.IndexIDMap2):
+            manifest = None
+        elif len(metadata_list) != rows or len(texts) != rows:
+            print("Warning: the summary vectorstore files don't match the manifest (interrupted build?).")
+            manifest = None
+    if manifest is None:
+        print("Building the summary index from scratch.")
+        index = None  # created once the vectors it is trained on are known
+        texts, metadata_list, manifest, rows = [], [], {}, 0
 
-    # embed all texts (batch)
-    embedder = get_embedder()
-    print("Computing embeddings (this may take a bit on first run)...")
-    vectors = embedder.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+    removed = [f for f, entry in manifest.items() if f not in current or current[f]["hash"] != entry["hash"]]
+    added = [f for f, entry in current.items() if f not in manifest or manifest[f]["hash"] != entry["hash"]]
+    touched = [f for f, entry in manifest.items() if f in current and entry != dict(current[f], id=entry["id"])]
+    for f in touched:
+        manifest[f].update(current[f])  # same content, new size / mtime
 
-    # build FAISS index
-    print("Building FAISS index...")
-    index = faiss.IndexFlatL2(embed_dim)
-    index.add(vectors)
+    if index is not None and not removed and not added:
+        if touched:
+            _save_manifest(manifest_file, manifest, rows)
+        print("Summary index is up to date.")
+        return index, texts, metadata_list
+
+    # vectors of deleted / overwritten files: removed by id; HNSW keeps them until compaction
+    stale_ids = [manifest.pop(f)["id"] for f in removed]
+    if stale_ids and supports_remove(index):
+        index.remove_ids(np.array(stale_ids, dtype=np.int64))
+    if stale_ids:
+        print(f"Removed {len(stale_ids)} stale vectors.")
+
+    # embed only new / changed files
+    new_files, new_metadata = [], []
+    for f in added:
+        fp = os.path.join(summaries_dir, f)
+        try:
+            with open(fp, "r", encoding="utf-8") as fh:
+                new_metadata.append(json.load(fh))
+            new_files.append(f)
+        except Exception as e:
+            print(f"Warning: failed to load {fp}: {e}")
+
+    new_texts = [summary_to_text(m) for m in new_metadata]
+    vectors = np.zeros((0, embed_dim), dtype=np.float32)
+    if new_texts:
+        embedder = get_embedder()
+        print(f"Computing embeddings for {len(new_texts)} added/changed summaries...")
+        vectors = np.asarray(embedder.encode(new_texts, convert_to_numpy=True, show_progress_bar=True), dtype=np.float32)
+
+    if index is not None:
+        tombstones = rows - len(manifest)
+        rewrite = _append_problem(metadata_list, texts_file, vectors_file, lexical_file, rows, embed_dim)
+        if rewrite is None and tombstones > COMPACT_TOMBSTONE_FRACTION * (rows + len(new_files)):
+            rewrite = f"{tombstones} of {rows} slots are removed"
+        if rewrite is None and metadata_list.segments >= COMPACT_MAX_SEGMENTS:
+            rewrite = f"its files hold {metadata_list.segments} appended groups"
+        if rewrite is None:
+            for f, vid in zip(new_files, range(rows, rows + len(new_files))):
+                manifest[f] = dict(current[f], id=vid)
+            try:
+                print(f"Appending to {index_file} ...")
+                append_summary_vectorstore(
+                    index, new_texts, new_metadata, vectors, stale_ids, rows, manifest,
+                    index_file=index_file,
+                    texts_file=texts_file,
+                    metadata_file=metadata_file,
+                    version_file=version_file,
+                    manifest_file=manifest_file,
+                    vectors_file=vectors_file,
+                    lexical_file=lexical_file,
+                )
+                print(f"Summary FAISS index updated ({index.ntotal} vectors, {len(new_files)} added/changed, "
+                      f"{len(removed)} removed; {rows + len(new_files) - len(manifest)} removed slots awaiting compaction).")
+                return index, open_texts(texts_file), ColumnarMetadata(metadata_file)
+            except ValueError as e:
+                rewrite = str(e)
+                for f in new_files:
+                    manifest.pop(f)
+
+        # compact: keep the live slots, renumbered in id order
+        print(f"Compacting the summary vectorstore ({rewrite}).")
+        live_ids = np.array(sorted(entry["id"] for entry in manifest.values()), dtype=np.int64)
+        full_vectors = _load_full_vectors(index, vectors_file, rows, embed_dim)
+        index = _compact_index(index, live_ids, embed_dim, index_spec, full_vectors)
+        texts = [texts[i] for i in live_ids]
+        metadata_list = [metadata_list[i] for i in live_ids]
+        if full_vectors is not None:
+            full_vectors = full_vectors[live_ids]
+        for entry in manifest.values():
+            entry["id"] = int(np.searchsorted(live_ids, entry["id"]))
+        rows = len(live_ids)
+    else:
+        full_vectors = np.zeros((0, embed_dim), dtype=np.float32)
+
+    if new_texts:
+        if index is None:
+            index = create_index(vectors, embed_dim, index_spec, with_ids=True)
+        # ids continue after the last slot so existing ids never move
+        ids = np.arange(rows, rows + len(new_texts), dtype=np.int64)
+        index.add_with_ids(vectors, ids)
+        texts = list(texts) + new_texts
+        metadata_list = list(metadata_list) + new_metadata
+        if full_vectors is not None:
+            full_vectors = np.vstack([full_vectors, vectors])
+        for f, vid in zip(new_files, ids):
+            manifest[f] = dict(current[f], id=int(vid))
+
+    if index is None:
+        raise RuntimeError(f"No loadable summaries found in {summaries_dir}.")
 
     # persist index and data
     print(f"Saving index to {index_file} ...")
-    faiss.write_index(index, index_file)
-    np.save(texts_file, np.array(texts, dtype=object))
-    with open(metadata_file, "w", encoding="utf-8") as fh:
-        json.dump(metadata_list, fh, ensure_ascii=False, indent=2)
+    save_summary_vectorstore(
+        index, texts, metadata_list,
+        index_file=index_file,
+        texts_file=texts_file,
+        metadata_file=metadata_file,
+        version_file=version_file,
+        manifest=manifest,
+        manifest_file=manifest_file,
+        vectors=full_vectors,
+        vectors_file=vectors_file,
+        lexical_file=lexical_file,
+    )
 
-    print("Summary FAISS index built and saved.")
+    print(f"Summary FAISS index saved ({index.ntotal} vectors, {len(new_files)} added/changed, {len(removed)} removed).")
     return index, texts, metadata_list
 
 
@@ -124,52 +519,260 @@ def load_summary_index(
     index_file: str = SUMMARY_INDEX_FILE,
     texts_file: str = SUMMARY_TEXTS_FILE,
     metadata_file: str = SUMMARY_METADATA_FILE,
-) -> Tuple[faiss.IndexFlatL2, List[str], List[Dict[str, Any]]]:
+    mmap: bool = True,
+    rerank: bool = True,
+    vectors_file: str = SUMMARY_VECTORS_FILE,
+) -> Tuple[faiss.Index, Sequence[str], Sequence[Dict[str, Any]]]:
     """
-    Load the summary index, texts and metadata from disk.
-    Returns (index, texts_list, metadata_list)
+    Open the summary index, texts and metadata.
+    With `mmap=True` the index vectors, texts and metadata columns are memory-mapped, so
+    loading takes about the same time at any size; texts and records are read on access.
+    Use `mmap=False, rerank=False` for an index that will be modified (build_summary_index).
+    With `rerank=True` a compressed index is wrapped to re-rank its results from the
+    full-precision vectors in `vectors_file` (also memory-mapped).
+    Vectorstores still in the old .npy/.json format are read as-is (run migrate_vectorstore).
+    Returns (index, texts, metadata_list); slots of removed summaries are None.
     """
     if not os.path.exists(index_file):
         raise FileNotFoundError(f"Summary index not found at {index_file}. Run build_summary_index().")
-    index = faiss.read_index(index_file)
+    index = faiss.read_index(index_file, FAISS_MMAP_FLAGS) if mmap else faiss.read_index(index_file)
+    index = apply_search_params(index)
+    if rerank and is_compressed(index) and os.path.exists(vectors_file):
+        index = with_rerank(index, MappedVectors(vectors_file, index.d))
+
+    if not os.path.exists(texts_file) and not os.path.exists(metadata_file):
+        legacy_texts = os.path.join(os.path.dirname(texts_file), os.path.basename(LEGACY_SUMMARY_TEXTS_FILE))
+        legacy_metadata = os.path.join(os.path.dirname(metadata_file), os.path.basename(LEGACY_SUMMARY_METADATA_FILE))
+        if os.path.exists(legacy_texts) or os.path.exists(legacy_metadata):
+            from .migrate_vectorstore import load_legacy_vectorstore
+            print("Warning: summary vectorstore is in the old .npy/.json format; "
+                  "run python -m rag_agent.services.migrate_vectorstore to convert it.")
+            texts, metadata_list = load_legacy_vectorstore(legacy_texts, legacy_metadata)
+            return index, texts, metadata_list
 
     texts = []
     if os.path.exists(texts_file):
-        texts = np.load(texts_file, allow_pickle=True).tolist()
+        texts = open_texts(texts_file)
     else:
-        print("Warning: texts.npy not found for summaries; continuing with empty texts list.")
+        print(f"Warning: {texts_file} not found; continuing with empty texts list.")
 
     metadata_list = []
     if os.path.exists(metadata_file):
-        with open(metadata_file, "r", encoding="utf-8") as fh:
-            metadata_list = json.load(fh)
+        metadata_list = ColumnarMetadata(metadata_file)
     else:
-        print("Warning: metadata.json not found for summaries; continuing with empty metadata list.")
+        print(f"Warning: {metadata_file} not found; continuing with empty metadata list.")
 
     return index, texts, metadata_list
 
 
+def _filter_ids(where: SummaryFilter, filter_index: FilterIndex, metadata_list) -> np.ndarray:
+    """Ids matching `where`, or None when there is nothing to filter on."""
+    if where is None or where.is_empty():
+        return None
+    with stage("filter"):
+        if filter_index is None:
+            filter_index = FilterIndex(metadata_list)
+        return filter_index.select(where)
+
+
+def _filtered_search(query_vec: np.ndarray, k: int, index: faiss.Index, ids: np.ndarray):
+    """
+    Nearest `k` of the vectors stored under `ids`. Small subsets are scored directly from
+    their stored vectors; larger ones go through the index with an ID selector, so only
+    the selected vectors are compared. Returns (distances, ids), closest first.
+    """
+    k = min(k, len(ids))
+    if k == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    if len(ids) <= FILTER_EXACT_MAX_IDS:
+        with stage("faiss_search"):
+            exact = _vector_distances(index, query_vec, ids.tolist())
+        if exact:
+            found = np.fromiter(exact.keys(), dtype=np.int64, count=len(exact))
+            dists = np.fromiter(exact.values(), dtype=np.float32, count=len(exact))
+            order = np.argsort(dists, kind="stable")[:k]
+            return dists[order], found[order]
+    params = selector_params(unwrap(index), id_selector(ids))
+    with stage("faiss_search"):
+        distances, indices = index.search(query_vec.reshape(1, -1), k, params=params)
+    return distances[0], indices[0]
+
+
 def search_summary_index(
     query_text: str,
     top_k: int = 5,
     index: faiss.Index = None,
     metadata_list: List[Dict] = None,
+    where: SummaryFilter = None,
+    filter_index: FilterIndex = None,
 ):
     """
-    Convenience search: embed query, run FAISS search and return list of (metadata, distance) for top_k.
+    Convenience search: embed query, run FAISS search and return list of (metadata, distance, id) for top_k.
     If index/metadata_list are not provided, load from disk.
+    `where` restricts the search to matching records before any vector is compared
+    (`filter_index` is the snapshot's precomputed column index; built on the fly if omitted).
+    Concurrent unfiltered calls are micro-batched by query_batcher.
     """
     if index is None or metadata_list is None:
         index, _, metadata_list = load_summary_index()
 
-    embedder = get_embedder()
-    q_vec = embedder.encode([query_text], convert_to_numpy=True)
-    distances, indices = index.search(q_vec, top_k)
+    ids = _filter_ids(where, filter_index, metadata_list)
+    if ids is None:
+        # HNSW keeps removed vectors until compaction: fetch enough to fill top_k with live ones
+        distances, indices = query_batcher.search(query_text, top_k + _removed_vectors(index, metadata_list), index)
+    else:
+        with stage("embed"):
+            query_vec = encode_queries([query_text])[0]
+        distances, indices = _filtered_search(query_vec, top_k, index, ids)
+
+    results = []
+    for idx, dist in zip(indices, distances):
+        # -1 pads missing results; None marks a slot whose summary was removed
+        if 0 <= idx < len(metadata_list) and metadata_list[idx] is not None:
+            results.append({"metadata": metadata_list[idx], "distance": float(dist), "id": int(idx)})
+    return results[:top_k]
+
+
+def _removed_vectors(index: faiss.Index, metadata_list) -> int:
+    """Vectors still in the index whose summaries were removed (only indexes that can't delete keep any)."""
+    if supports_remove(unwrap(index)):
+        return 0
+    if isinstance(metadata_list, ColumnarMetadata):
+        live = metadata_list.live_count
+    else:
+        live = sum(m is not None for m in metadata_list)
+    return max(0, index.ntotal - live)
+
+
+def range_search_summary_index(
+    query_text: str,
+    max_distance: float,
+    index: faiss.Index = None,
+    metadata_list: List[Dict] = None,
+    min_results: int = 0,
+    where: SummaryFilter = None,
+    filter_index: FilterIndex = None,
+):
+    """
+    All summaries within `max_distance` of the query, closest first.
+    If fewer than `min_results` fall inside the radius, the `min_results` nearest are returned instead.
+    Indexes without range_search support fall back to a full-depth search filtered by distance.
+    `where` / `filter_index` restrict the search as in search_summary_index.
+    """
+    if index is None or metadata_list is None:
+        index, _, metadata_list = load_summary_index()
+    if index.ntotal == 0:
+        return []
+
+    with stage("embed"):
+        query_vec = encode_queries([query_text])
+    ids = _filter_ids(where, filter_index, metadata_list)
+    if ids is not None and len(ids) <= FILTER_EXACT_MAX_IDS:
+        distances, indices = _filtered_search(query_vec[0], len(ids), index, ids)
+        inside = distances < max_distance
+        distances, indices = distances[inside], indices[inside]
+    else:
+        params = None if ids is None else selector_params(unwrap(index), id_selector(ids))
+        with stage("faiss_search"):
+            try:
+                lims, distances, indices = index.range_search(query_vec, max_distance, params=params)
+                distances, indices = distances[lims[0]:lims[1]], indices[lims[0]:lims[1]]
+            except RuntimeError:
+                depth = index.ntotal if ids is None else len(ids)
+                distances, indices = index.search(query_vec, depth, params=params)
+                distances, indices = distances[0], indices[0]
+                inside = distances < max_distance
+                distances, indices = distances[inside], indices[inside]
+
+    results = []
+    for i in np.argsort(distances, kind="stable"):
+        idx = indices[i]
+        if 0 <= idx < len(metadata_list) and metadata_list[idx] is not None:
+            results.append({"metadata": metadata_list[idx], "distance": float(distances[i]), "id": int(idx)})
+
+    if len(results) < min_results:
+        return search_summary_index(query_text, min_results, index, metadata_list, where, filter_index)
+    return results
+
+
+def _vector_distances(index, query_vec: np.ndarray, ids: List[int]) -> Dict[int, float]:
+    """Exact distances from the query to the vectors stored under `ids` (empty if the index can't return them)."""
+    if not ids:
+        return {}
+    try:
+        if isinstance(index, RerankedIndex):
+            vectors = index.vectors.get(np.array(ids, dtype=np.int64))
+        else:
+            vectors = np.vstack([index.reconstruct(int(i)) for i in ids])
+    except RuntimeError:
+        return {}
+    return dict(zip(ids, ((vectors - query_vec) ** 2).sum(axis=1).tolist()))
+
+
+def hybrid_search_summary_index(
+    query_text: str,
+    lexical: LexicalIndex,
+    index: faiss.Index,
+    metadata_list: Sequence[Dict[str, Any]],
+    top_k: int = None,
+    max_distance: float = None,
+    min_results: int = 0,
+    where: SummaryFilter = None,
+    filter_index: FilterIndex = None,
+):
+    """
+    Lexical + vector search, restricted to the records matching `where` if given. A query that only names patients or identifiers ("Jyoti Shah",
+    "354_23_00442") is answered from the lexical index without embedding it (distance 0.0).
+    Other queries run the vector search (top_k, or everything within `max_distance` when
+    top_k is None) and fuse its ranking with BM25; exact name / ID matches come first.
+    Results are (metadata, distance, id, score) ordered by score.
+    """
+    if where is not None and not where.is_empty() and filter_index is None:
+        filter_index = FilterIndex(metadata_list, lexical)
+    ids = _filter_ids(where, filter_index, metadata_list)
+    allowed = None if ids is None else set(ids.tolist())
+
+    with stage("lexical"):
+        exact, is_lookup = lexical.exact_lookup(query_text)
+    if allowed is not None:
+        exact = [i for i in exact if i in allowed]
+    if is_lookup:
+        exact = [i for i in exact if i < len(metadata_list) and metadata_list[i] is not None]
+        if top_k is not None:
+            exact = exact[:top_k]
+        return [{"metadata": metadata_list[i], "distance": 0.0, "id": i, "score": 1.0} for i in exact]
+
+    if top_k is None:
+        vector_hits = range_search_summary_index(
+            query_text, max_distance, index, metadata_list, min_results, where, filter_index
+        )
+    else:
+        vector_hits = search_summary_index(query_text, top_k, index, metadata_list, where, filter_index)
+
+    with stage("lexical"):
+        bm25 = lexical.bm25(query_text)
+        if allowed is not None:
+            bm25 = {i: score for i, score in bm25.items() if i in allowed}
+    with stage("fusion"):
+        fused = fuse_rankings([r["id"] for r in vector_hits], bm25, exact)
+        if top_k is not None:
+            fused = fused[:top_k]
+
+        distances = {r["id"]: r["distance"] for r in vector_hits}
+        missing = [i for i, _ in fused if i not in distances and i < len(metadata_list)]
+        if missing:
+            distances.update(_vector_distances(index, encode_queries([query_text])[0], missing))
+    fallback = max(distances.values(), default=0.0)
 
     results = []
-    for idx, dist in zip(indices[0], distances[0]):
-        if idx < len(metadata_list):
-            results.append({"metadata": metadata_list[idx], "distance": float(dist)})
+    for i, score in fused:
+        if i < len(metadata_list) and metadata_list[i] is not None:
+            results.append({
+                "metadata": metadata_list[i],
+                "distance": float(distances.get(i, fallback)),
+                "id": i,
+                "score": round(score, 6),
+            })
     return results
 
 
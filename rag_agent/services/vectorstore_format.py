@@ -0,0 +1,548 @@
+# rag_agent/services/vectorstore_format.py
+"""
+Memory-mapped columnar files for the summary vectorstore.
+
+A column file is a small JSON header followed by 8-byte aligned column blocks:
+
+    b"RAGCOL2\\n" | uint64 trailer position | uint64 header length | JSON header | padding | blocks
+
+The header lists each column's kind and the (start, length) of its blocks, relative
+to the first block:
+- "str" / "json": an offsets block (one uint64 per row, NULL_OFFSET when the row has
+  no value) into a data block of length-prefixed (uint32) UTF-8 values; "json" values
+  are JSON text, used for anything that isn't a plain string or integer.
+- "int64": one int64 per row, NULL_INT when the row has no value.
+- "bool": one uint8 per row.
+
+Files are appended to rather than rewritten: append_columns() writes the new rows as
+another group of blocks, then a trailer (uint64 length | JSON) describing every group
+and the block of removed row ids, and only then points the trailer position at it.
+Bytes already written are never changed, so a reader that mapped the file earlier keeps
+its view, and an interrupted append leaves the previous trailer in force.
+Files in the first format (b"RAGCOL1\\n", no trailer position) are still read.
+
+Readers mmap the file once and wrap the blocks in numpy views, so opening takes the
+same time whatever the number of rows, and every process mapping the file shares its pages.
+Files with several groups or removed rows are merged into one array per column on open.
+"""
+import json
+import mmap
+import os
+import struct
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"RAGCOL2\n"
+LEGACY_MAGIC = b"RAGCOL1\n"  # written whole, no trailer
+NULL_OFFSET = np.iinfo(np.uint64).max
+NULL_INT = np.iinfo(np.int64).min
+LENGTH_PREFIX = struct.Struct("<I")
+HEADER_LENGTH = struct.Struct("<Q")
+TRAILER_POSITION = struct.Struct("<Q")
+
+# Column holding 1 for rows that exist and 0 for removed slots
+PRESENT_COLUMN = "__present"
+
+_MISSING = object()
+
+
+def _align8(n: int) -> int:
+    return n + (-n % 8)
+
+
+# ----------------- Layout -----------------
+def _parse_layout(buf, trailer: int) -> Dict[str, Any]:
+    """
+    Groups, removed-ids block and end of the committed data of a mapped column file,
+    using the trailer at `trailer` (0: the header is the only description).
+    """
+    magic = bytes(buf[:len(MAGIC)])
+    if magic not in (MAGIC, LEGACY_MAGIC):
+        raise ValueError("not a vectorstore column file")
+    pos = len(MAGIC) + (TRAILER_POSITION.size if magic == MAGIC else 0)
+    (header_len,) = HEADER_LENGTH.unpack_from(buf, pos)
+    pos += HEADER_LENGTH.size
+    header = json.loads(bytes(buf[pos:pos + header_len]).decode("utf-8"))
+    base = _align8(pos + header_len)
+
+    layout = {
+        "appendable": magic == MAGIC,
+        "base": base,
+        "groups": [{"rows": header["rows"], "columns": header["columns"]}],
+        "removed": None,
+        "end": base + header["end"] if "end" in header else len(buf),
+    }
+    if trailer:
+        (length,) = HEADER_LENGTH.unpack_from(buf, trailer)
+        start = trailer + HEADER_LENGTH.size
+        described = json.loads(bytes(buf[start:start + length]).decode("utf-8"))
+        layout["groups"] = described["groups"]
+        layout["removed"] = described["removed"]
+        layout["end"] = start + length
+    return layout
+
+
+def _trailer_position(head: bytes) -> int:
+    if head[:len(MAGIC)] != MAGIC:
+        return 0
+    (position,) = TRAILER_POSITION.unpack_from(head, len(MAGIC))
+    return position
+
+
+def _merged_specs(groups: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Column name -> kind and attributes, over all groups (first group having the column wins)."""
+    specs: Dict[str, Dict[str, Any]] = {}
+    for group in groups:
+        for name, spec in group["columns"].items():
+            if name not in specs:
+                specs[name] = {k: v for k, v in spec.items() if k not in ("offsets", "data")}
+    return specs
+
+
+# ----------------- Writing -----------------
+def _string_blocks(values: List[Optional[str]]) -> Tuple[bytes, bytes]:
+    offsets = np.full(len(values), NULL_OFFSET, dtype="<u8")
+    chunks, pos = [], 0
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        encoded = value.encode("utf-8")
+        offsets[i] = pos
+        chunks.append(LENGTH_PREFIX.pack(len(encoded)))
+        chunks.append(encoded)
+        pos += LENGTH_PREFIX.size + len(encoded)
+    return offsets.tobytes(), b"".join(chunks)
+
+
+class _Blocks:
+    """Aligned blocks laid out from relative position `pos` on."""
+
+    def __init__(self, pos: int = 0):
+        self.pos = pos
+        self.chunks: List[bytes] = []
+
+    def add(self, data: bytes) -> List[int]:
+        start = _align8(self.pos)
+        self.chunks.append(b"\0" * (start - self.pos) + data)
+        self.pos = start + len(data)
+        return [start, len(data)]
+
+
+def _encode_columns(columns: Dict[str, Dict[str, Any]], blocks: _Blocks) -> Dict[str, Dict[str, Any]]:
+    entries = {}
+    for name, spec in columns.items():
+        kind, values = spec["kind"], spec["values"]
+        entry = {k: v for k, v in spec.items() if k != "values"}
+        if kind in ("str", "json"):
+            offsets, data = _string_blocks(values)
+            entry["offsets"] = blocks.add(offsets)
+            entry["data"] = blocks.add(data)
+        elif kind == "int64":
+            entry["data"] = blocks.add(np.array([NULL_INT if v is None else v for v in values], dtype="<i8").tobytes())
+        elif kind == "bool":
+            entry["data"] = blocks.add(np.array(values, dtype=np.uint8).tobytes())
+        else:
+            raise ValueError(f"Unknown column kind '{kind}'")
+        entries[name] = entry
+    return entries
+
+
+def write_columns(path: str, columns: Dict[str, Dict[str, Any]], rows: int):
+    """
+    Write columns to `path`. Each column is {"kind": ..., "values": [...]} with one value
+    per row (None = no value); any other keys are stored in the header as column attributes.
+    """
+    blocks = _Blocks()
+    entries = _encode_columns(columns, blocks)
+    header = {"rows": rows, "columns": entries, "end": blocks.pos}
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    prefix = MAGIC + TRAILER_POSITION.pack(0) + HEADER_LENGTH.pack(len(header_bytes)) + header_bytes
+    with open(path, "wb") as fh:
+        fh.write(prefix + b"\0" * (_align8(len(prefix)) - len(prefix)))
+        for block in blocks.chunks:
+            fh.write(block)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def read_layout(path: str) -> Dict[str, Any]:
+    """
+    Layout of a column file without mapping its columns: "appendable", "rows",
+    "groups" (rows and column blocks per appended group), "specs" (merged column
+    kinds / attributes) and "removed" (array of removed row ids).
+    """
+    with open(path, "rb") as fh:
+        buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        layout = _parse_layout(buf, _trailer_position(buf[:len(MAGIC) + TRAILER_POSITION.size]))
+        removed = np.zeros(0, dtype="<i8")
+        if layout["removed"] is not None:
+            start, length = layout["removed"]
+            removed = np.frombuffer(buf, dtype="<i8", count=length // 8, offset=layout["base"] + start).copy()
+    finally:
+        buf.close()
+    layout["removed"] = removed
+    layout["rows"] = sum(g["rows"] for g in layout["groups"])
+    layout["specs"] = _merged_specs(layout["groups"])
+    return layout
+
+
+def append_columns(path: str, columns: Dict[str, Dict[str, Any]], rows: int, removed: Iterable[int] = ()):
+    """
+    Append `rows` rows (columns as in write_columns; the kind of a column that already
+    exists must not change) and mark the row ids in `removed` as removed.
+    Raises ValueError for files that can't be appended to (first format).
+    """
+    layout = read_layout(path)
+    if not layout["appendable"]:
+        raise ValueError(f"{path} is in the first column file format and can't be appended to")
+    for name, spec in columns.items():
+        known = layout["specs"].get(name)
+        if known is not None and known["kind"] != spec["kind"]:
+            raise ValueError(f"column '{name}' is {known['kind']}, can't append {spec['kind']} values")
+
+    total = layout["rows"] + rows
+    all_removed = np.union1d(layout["removed"], np.fromiter(removed, dtype=np.int64)).astype("<i8")
+    if len(all_removed) and (all_removed[0] < 0 or all_removed[-1] >= total):
+        raise ValueError(f"removed row ids must be within 0..{total - 1}")
+
+    base, end = layout["base"], layout["end"]
+    blocks = _Blocks(end - base)
+    groups = list(layout["groups"])
+    if rows:
+        groups.append({"rows": rows, "columns": _encode_columns(columns, blocks)})
+    described = {
+        "groups": groups,
+        "removed": blocks.add(all_removed.tobytes()) if len(all_removed) else None,
+    }
+    trailer = _align8(base + blocks.pos)
+    trailer_bytes = json.dumps(described, separators=(",", ":")).encode("utf-8")
+
+    with open(path, "r+b") as fh:
+        # Anything past the committed end is left over from an interrupted append
+        fh.truncate(end)
+        fh.seek(end)
+        for block in blocks.chunks:
+            fh.write(block)
+        fh.write(b"\0" * (trailer - base - blocks.pos))
+        fh.write(HEADER_LENGTH.pack(len(trailer_bytes)) + trailer_bytes)
+        fh.flush()
+        os.fsync(fh.fileno())
+        # Switch readers to the new trailer only once everything it describes is on disk
+        fh.seek(len(MAGIC))
+        fh.write(TRAILER_POSITION.pack(trailer))
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def write_texts(path: str, texts: Iterable[Optional[str]]):
+    """Texts (None for removed slots) as a single string column."""
+    texts = list(texts)
+    write_columns(path, {"text": {"kind": "str", "values": texts}}, len(texts))
+
+
+def append_texts(path: str, texts: Iterable[Optional[str]], removed: Iterable[int] = ()):
+    """Append texts to a texts file and mark the slots in `removed` as removed."""
+    texts = list(texts)
+    append_columns(path, {"text": {"kind": "str", "values": texts}}, len(texts), removed)
+
+
+def _column_kind(values: List[Any]) -> str:
+    """Narrowest kind that stores `values` (the rows that have the key) exactly."""
+    if any(v is None or isinstance(v, bool) for v in values):
+        return "json"  # explicit nulls and True/False must read back as written
+    if values and all(isinstance(v, int) for v in values):
+        return "int64"
+    if all(isinstance(v, str) for v in values):
+        return "str"
+    return "json"
+
+
+def _fits(kind: str, values: List[Any]) -> bool:
+    """Whether `values` can be stored in an existing column of `kind` and read back as written."""
+    if kind == "json":
+        return True
+    if kind == "int64":
+        return all(isinstance(v, int) and not isinstance(v, bool) for v in values)
+    return all(isinstance(v, str) for v in values)
+
+
+def _is_field_dict(value: Any) -> bool:
+    return isinstance(value, dict) and all(isinstance(x, str) for x in value.values())
+
+
+def _metadata_columns(
+    records: List[Optional[Dict[str, Any]]],
+    existing: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Columns for `records`. Keys that already have columns in `existing` (specs of the file
+    being appended to) keep their layout and kind; ValueError if the new values don't fit.
+    """
+    existing = existing or {}
+    field_columns: Dict[str, Dict[str, str]] = {}
+    plain_columns: Dict[str, Tuple[str, str]] = {}
+    for name, spec in existing.items():
+        if name == PRESENT_COLUMN:
+            continue
+        if "field" in spec:
+            field_columns.setdefault(spec["key"], {})[spec["field"]] = name
+        else:
+            plain_columns[spec["key"]] = (name, spec["kind"])
+
+    keys: List[str] = []
+    for record in records:
+        for key in record or {}:
+            if key not in keys:
+                keys.append(key)
+
+    columns = {PRESENT_COLUMN: {"kind": "bool", "values": [record is not None for record in records]}}
+    for key in keys:
+        raw = [(record or {}).get(key, _MISSING) for record in records]
+        present = [v for v in raw if v is not _MISSING]
+
+        split = key in field_columns or (
+            key not in plain_columns and present and all(_is_field_dict(v) for v in present)
+        )
+        if split:
+            if not all(_is_field_dict(v) for v in present):
+                raise ValueError(f"values of '{key}' no longer fit its per-field columns")
+            names = dict(field_columns.get(key, {}))
+            for value in present:
+                for field in value:
+                    names.setdefault(field, f"{key}.{field}")
+            for field, name in names.items():
+                values = [None if v is _MISSING else v.get(field) for v in raw]
+                columns[name] = {"kind": "str", "key": key, "field": field, "values": values}
+            continue
+
+        name, kind = plain_columns.get(key, (key, None))
+        if kind is None:
+            kind = _column_kind(present)
+        elif not _fits(kind, present):
+            raise ValueError(f"values of '{key}' no longer fit its {kind} column")
+        if kind == "json":
+            values = [None if v is _MISSING else json.dumps(v, ensure_ascii=False) for v in raw]
+        else:
+            values = [None if v is _MISSING else v for v in raw]
+        columns[name] = {"kind": kind, "key": key, "values": values}
+    return columns
+
+
+def write_metadata(path: str, metadata_list: Iterable[Optional[Dict[str, Any]]]):
+    """
+    Summary records (None for removed slots), one column per top-level key. A key whose
+    values are always dicts of strings (the "summary" fields) gets one column per field.
+    Keys missing from a row are stored as "no value", so every row reads back as written.
+    """
+    records = list(metadata_list)
+    write_columns(path, _metadata_columns(records), len(records))
+
+
+def append_metadata(path: str, metadata_list: Iterable[Optional[Dict[str, Any]]], removed: Iterable[int] = ()):
+    """
+    Append records to a metadata file and mark the slots in `removed` as removed.
+    Raises ValueError when the file can't be appended to or a record doesn't fit the
+    existing columns (e.g. a string where the column holds integers): rewrite it then.
+    """
+    records = list(metadata_list)
+    columns = _metadata_columns(records, read_layout(path)["specs"])
+    append_columns(path, columns, len(records), removed)
+
+
+# ----------------- Reading -----------------
+class ColumnFile:
+    """A column file mapped into memory; columns are numpy views over the mapping."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fh:
+            # Read the trailer position before sizing the map: whatever it points at is already on disk
+            trailer = _trailer_position(fh.read(len(MAGIC) + TRAILER_POSITION.size))
+            size = os.fstat(fh.fileno()).st_size
+            if size < len(LEGACY_MAGIC) + HEADER_LENGTH.size:
+                raise ValueError(f"{path} is not a vectorstore column file")
+            self._mm = mmap.mmap(fh.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            layout = _parse_layout(self._mm, trailer)
+        except ValueError:
+            raise ValueError(f"{path} is not a vectorstore column file")
+
+        self._base = layout["base"]
+        self.appendable: bool = layout["appendable"]
+        self._groups: List[Dict[str, Any]] = layout["groups"]
+        self.rows: int = sum(g["rows"] for g in self._groups)
+        self.columns: Dict[str, Dict[str, Any]] = _merged_specs(self._groups)
+        self.removed = np.zeros(0, dtype=np.int64)
+        if layout["removed"] is not None:
+            self.removed = self._view(layout["removed"], "<i8")
+
+    @property
+    def segments(self) -> int:
+        """Number of groups of rows written (1 after a full write, +1 per append)."""
+        return len(self._groups)
+
+    def _view(self, block: List[int], dtype) -> np.ndarray:
+        start, length = block
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._mm, dtype=dtype, count=length // dtype.itemsize, offset=self._base + start)
+
+    def column(self, name: str):
+        """An int64 / uint8 array for numeric columns, a StringColumn for str / json columns."""
+        kind = self.columns[name]["kind"]
+        if len(self._groups) == 1 and not len(self.removed):
+            spec = self._groups[0]["columns"][name]
+            if kind == "int64":
+                return self._view(spec["data"], "<i8")
+            if kind == "bool":
+                return self._view(spec["data"], np.uint8)
+            return StringColumn(
+                self._mm,
+                self._view(spec["offsets"], "<u8"),
+                self._base + spec["data"][0],
+                parse_json=kind == "json",
+            )
+        return self._merged_column(name, kind)
+
+    def _merged_column(self, name: str, kind: str):
+        """One array over all groups; rows of groups without the column and removed rows have no value."""
+        parts = []
+        for group in self._groups:
+            spec = group["columns"].get(name)
+            if kind == "int64":
+                parts.append(self._view(spec["data"], "<i8") if spec else np.full(group["rows"], NULL_INT, dtype="<i8"))
+            elif kind == "bool":
+                parts.append(self._view(spec["data"], np.uint8) if spec else np.zeros(group["rows"], dtype=np.uint8))
+            elif spec is None:
+                parts.append(np.full(group["rows"], NULL_OFFSET, dtype="<u8"))
+            else:
+                # Offsets made absolute, so one StringColumn reads every group
+                offsets = self._view(spec["offsets"], "<u8").copy()
+                has_value = offsets != NULL_OFFSET
+                offsets[has_value] += np.uint64(self._base + spec["data"][0])
+                parts.append(offsets)
+        merged = np.concatenate(parts) if parts else np.zeros(0, dtype="<u8")
+        if kind == "int64":
+            merged[self.removed] = NULL_INT
+            return merged
+        if kind == "bool":
+            merged[self.removed] = 0
+            return merged
+        merged[self.removed] = NULL_OFFSET
+        return StringColumn(self._mm, merged, 0, parse_json=kind == "json")
+
+
+class StringColumn(Sequence):
+    """Length-prefixed UTF-8 values read lazily from a mapped file; None for rows without a value."""
+
+    def __init__(self, buffer, offsets: np.ndarray, data_start: int, parse_json: bool = False):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._data_start = data_start
+        self._parse_json = parse_json
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def has_value(self, idx: int) -> bool:
+        return self._offsets[idx] != NULL_OFFSET
+
+    def get(self, idx: int):
+        offset = self._offsets[idx]
+        if offset == NULL_OFFSET:
+            return None
+        pos = self._data_start + int(offset)
+        (length,) = LENGTH_PREFIX.unpack_from(self._buffer, pos)
+        pos += LENGTH_PREFIX.size
+        value = self._buffer[pos:pos + length].decode("utf-8")
+        return json.loads(value) if self._parse_json else value
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.get(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self.get(key)
+
+
+def open_texts(path: str) -> StringColumn:
+    return ColumnFile(path).column("text")
+
+
+class ColumnarMetadata(Sequence):
+    """
+    Summary records read from a metadata column file. Indexing builds the record dict
+    for one row on demand (None for removed slots); column() returns a whole column,
+    e.g. for filtering, without building any records.
+    """
+
+    def __init__(self, path: str):
+        self._file = ColumnFile(path)
+        self._present = self._file.column(PRESENT_COLUMN)
+        self._specs = {n: s for n, s in self._file.columns.items() if n != PRESENT_COLUMN}
+        self._columns = {n: self._file.column(n) for n in self._specs}
+        self._live = None
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self._specs)
+
+    @property
+    def present(self) -> np.ndarray:
+        """1 for rows holding a record, 0 for removed slots."""
+        return self._present
+
+    @property
+    def live_count(self) -> int:
+        """Number of rows holding a record."""
+        if self._live is None:
+            self._live = int(np.count_nonzero(self._present))
+        return self._live
+
+    @property
+    def segments(self) -> int:
+        return self._file.segments
+
+    @property
+    def appendable(self) -> bool:
+        return self._file.appendable
+
+    def column(self, name: str):
+        return self._columns[name]
+
+    def __len__(self) -> int:
+        return self._file.rows
+
+    def get(self, idx: int) -> Optional[Dict[str, Any]]:
+        if not self._present[idx]:
+            return None
+        record: Dict[str, Any] = {}
+        for name, spec in self._specs.items():
+            col = self._columns[name]
+            if spec["kind"] == "int64":
+                if col[idx] == NULL_INT:
+                    continue
+                value = int(col[idx])
+            else:
+                if not col.has_value(idx):
+                    continue
+                value = col.get(idx)
+            if "field" in spec:
+                record.setdefault(spec["key"], {})[spec["field"]] = value
+            else:
+                record[spec["key"]] = value
+        return record
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.get(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self.get(key)
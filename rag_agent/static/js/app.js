@@ -0,0 +1,88 @@
+// Progressive rendering for the ask form: records as soon as they are retrieved,
+// then the Gemini answer token by token over Server-Sent Events (/ask-stream).
+// Without JavaScript (or EventSource) the form falls back to a normal POST to /ask-ui.
+(function () {
+    const form = document.getElementById("ask-form");
+    if (!form || !window.EventSource) {
+        return;
+    }
+
+    const panel = document.getElementById("stream-results");
+    const questionEl = document.getElementById("stream-question");
+    const answerBox = document.getElementById("stream-answer");
+    const answerText = document.getElementById("stream-answer-text");
+    const countEl = document.getElementById("stream-count");
+    const recordsEl = document.getElementById("stream-records");
+    const submitBtn = form.querySelector("button[type=submit]");
+
+    let source = null;
+
+    function recordItem(record) {
+        const md = (record.metadata && record.metadata.summary) || {};
+        const li = document.createElement("li");
+        li.className = "list-group-item";
+        [["Patient", "Patient"], ["Diagnosis", "Diagnosis"], ["Treatment", "Treatment"], ["Follow-up", "Follow-up"]]
+            .forEach(function ([label, key], i) {
+                const strong = document.createElement("strong");
+                strong.textContent = label + ":";
+                li.appendChild(strong);
+                li.appendChild(document.createTextNode(" " + (md[key] || "N/A") + (i < 3 ? " | " : " ")));
+            });
+        const badge = document.createElement("span");
+        badge.className = "badge bg-secondary float-end";
+        badge.textContent = "distance=" + Number(record.distance).toFixed(4);
+        li.appendChild(badge);
+        return li;
+    }
+
+    function finish() {
+        if (source) {
+            source.close();
+            source = null;
+        }
+        submitBtn.disabled = false;
+    }
+
+    form.addEventListener("submit", function (event) {
+        event.preventDefault();
+        finish();
+
+        const question = form.elements["question"].value;
+        const useGemini = form.elements["use_gemini"].checked;
+        const params = new URLSearchParams({ question: question, use_gemini: useGemini });
+
+        questionEl.textContent = question;
+        answerText.textContent = "";
+        answerBox.classList.add("d-none");
+        countEl.textContent = "…";
+        recordsEl.replaceChildren();
+        panel.classList.remove("d-none");
+        submitBtn.disabled = true;
+
+        source = new EventSource(form.dataset.streamUrl + "?" + params.toString());
+
+        source.addEventListener("records", function (e) {
+            const result = JSON.parse(e.data);
+            countEl.textContent = result.retrieved_count;
+            result.retrieved.forEach(function (r) {
+                recordsEl.appendChild(recordItem(r));
+            });
+        });
+
+        source.addEventListener("token", function (e) {
+            answerBox.classList.remove("d-none");
+            answerText.textContent += JSON.parse(e.data);
+        });
+
+        source.addEventListener("error", function (e) {
+            // Server-sent "error" events carry a message; connection errors don't
+            if (e.data) {
+                answerBox.classList.remove("d-none");
+                answerText.textContent = JSON.parse(e.data);
+            }
+            finish();
+        });
+
+        source.addEventListener("done", finish);
+    });
+})();
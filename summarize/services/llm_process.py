@@ -1,19 +1,25 @@
 import os
 import faiss
-import numpy as np
 import json
 import google.generativeai as genai
-from config.settings import GOOGLE_API_KEY
+from config.settings import GOOGLE_API_KEY, FAISS_DIR
 from datetime import datetime
 import re 
+from document_ai.faiss_encode.faiss_utils import text_store
+from summarize.services.rate_limit import TokenBucket, call_with_retry, run_bounded
+from summarize.services.summary_cache import SummaryCache, summary_cache_key
 
 # ----------------- Configure Gemini -----------------
 genai.configure(api_key=GOOGLE_API_KEY)
 GEMINI_MODEL = "gemini-2.5-flash"  # or gemini-1.5-pro if needed
 
+# Concurrency and rate limiting for batch summarization
+SUMMARY_CONCURRENCY = 8
+SUMMARY_REQUESTS_PER_SECOND = 4.0
+SUMMARY_MAX_RETRIES = 5
+
 # ----------------- Load FAISS and Texts -----------------
-FAISS_INDEX_FILE = os.path.join("document_ai", "faiss", "document_embeddings.index")
-TEXTS_FILE = os.path.join("document_ai", "faiss", "texts.npy")
+FAISS_INDEX_FILE = os.path.join(FAISS_DIR, "document_embeddings.index")
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SUMMARIES_DIR = os.path.join(BASE_DIR, "..", "summaries")
@@ -21,11 +27,8 @@ SUMMARIES_DIR = os.path.join(BASE_DIR, "..", "summaries")
 # Create summaries directory if it doesn't exist
 os.makedirs(SUMMARIES_DIR, exist_ok=True)
 
-# Load stored texts
-if os.path.exists(TEXTS_FILE):
-    stored_texts = np.load(TEXTS_FILE, allow_pickle=True).tolist()
-else:
-    stored_texts = []
+# Stored texts: the ingestion text store itself, so notes added later are visible here too
+stored_texts = text_store
 
 # Load FAISS index (already built in Task 1)
 if os.path.exists(FAISS_INDEX_FILE):
@@ -41,13 +44,14 @@ def retrieve_notes(top_k: int = None):
     """
     Retrieve notes from stored_texts.
     If top_k is None, retrieve all notes.
+    Returns a lazy sequence: each note is read from disk only when accessed.
     """
-    if not stored_texts:
+    if len(stored_texts) == 0:
         print("⚠️ No stored_texts found.")
         return []
 
     if top_k is None or top_k > len(stored_texts):
-        return stored_texts
+        return stored_texts[:]
     else:
         return stored_texts[:top_k]
 
@@ -151,36 +155,52 @@ def save_patient_summary(summary: dict, record_id: int, original_text: str) -> s
 
 
 # ----------------- Gemini Summarization -----------------
-def summarize_note_with_gemini(note_text: str):
+def request_summary_text(note_text: str, model=None) -> str:
+    """Send the summarization prompt to Gemini and return the raw response text."""
+    prompt = create_enhanced_prompt(note_text)
+    if model is None:
+        model = genai.GenerativeModel(GEMINI_MODEL)
+    response = model.generate_content(prompt)
+    return response.text.strip()
+
+
+def parse_summary_response(raw_text: str) -> dict:
+    """Turn Gemini's response into the summary dict. Raises json.JSONDecodeError if it isn't JSON."""
+    # Remove any markdown formatting
+    raw_text = re.sub(r'```json\s*', '', raw_text)
+    raw_text = re.sub(r'```\s*', '', raw_text)
+
+    # Extract JSON part if Gemini adds extra formatting
+    match = re.search(r"\{.*\}", raw_text, re.DOTALL)
+    if match:
+        raw_text = match.group(0)
+
+    summary = json.loads(raw_text)
+
+    # Validate that all required fields are present
+    required_fields = ["Patient", "Diagnosis", "Treatment", "Follow-up"]
+    for field in required_fields:
+        if field not in summary:
+            summary[field] = "Not specified"
+
+    return summary
+
+
+def summarize_note_with_gemini(note_text: str, model=None, limiter: TokenBucket = None, max_retries: int = 0):
     """
     Send note text to Gemini for structured summarization.
     Expected output: JSON with fields Patient, Diagnosis, Treatment, Follow-up.
+    `model` may be any object with generate_content() (e.g. a fake in tests); 429/5xx
+    errors are retried up to `max_retries` times, pacing calls through `limiter`.
     """
+    raw_text = ""
     try:
-        # Use the enhanced prompt
-        prompt = create_enhanced_prompt(note_text)
-        
-        response = genai.GenerativeModel(GEMINI_MODEL).generate_content(prompt)
-        raw_text = response.text.strip()
-        
-        # Remove any markdown formatting
-        raw_text = re.sub(r'```json\s*', '', raw_text)
-        raw_text = re.sub(r'```\s*', '', raw_text)
-        
-        # Extract JSON part if Gemini adds extra formatting
-        match = re.search(r"\{.*\}", raw_text, re.DOTALL)
-        if match:
-            raw_text = match.group(0)
-
-        summary = json.loads(raw_text)
-        
-        # Validate that all required fields are present
-        required_fields = ["Patient", "Diagnosis", "Treatment", "Follow-up"]
-        for field in required_fields:
-            if field not in summary:
-                summary[field] = "Not specified"
-        
-        return summary
+        raw_text = call_with_retry(
+            lambda: request_summary_text(note_text, model),
+            limiter=limiter,
+            max_retries=max_retries,
+        )
+        return parse_summary_response(raw_text)
 
     except json.JSONDecodeError as e:
         print(f"❌ JSON parsing error: {e}")
@@ -205,38 +225,89 @@ def summarize_note_with_gemini(note_text: str):
         }
 
 
-def batch_summarize_and_save(top_k: int = 3):
-    """Retrieve top_k notes, summarize each note, and save to separate files."""
+def batch_summarize_and_save(
+    top_k: int = 3,
+    max_concurrency: int = SUMMARY_CONCURRENCY,
+    requests_per_second: float = SUMMARY_REQUESTS_PER_SECOND,
+    max_retries: int = SUMMARY_MAX_RETRIES,
+    model=None,
+    cache: SummaryCache = None,
+    use_cache: bool = True,
+):
+    """
+    Retrieve top_k notes, summarize each note, and save to separate files.
+    Up to `max_concurrency` notes are summarized at once, paced by an adaptive token bucket
+    (`requests_per_second`). Files are written as summaries complete; record ids always
+    follow the note's position, so they are the same whatever order notes finish in.
+    Notes whose text, prompt template and model are unchanged since a previous run are
+    served from the summary cache instead of being sent to Gemini.
+    """
     notes = retrieve_notes(top_k)
-    summaries = []
-    saved_files = []
-    
-    print(f"Processing {len(notes)} clinical notes...")
-    
-    for i, note in enumerate(notes):
-        print(f"\nProcessing record {i+1}/{len(notes)}...")
-        
-        # Skip very short notes
-        if len(str(note).strip()) < 50:
-            print(f"⚠️ Skipping record {i+1}: Note too short")
+    results = {}
+    saved_files = {}
+    cached_records = []
+    if use_cache and cache is None:
+        cache = SummaryCache()
+    prompt_template = create_enhanced_prompt("")
+    limiter = TokenBucket(requests_per_second) if requests_per_second else None
+    if model is None:
+        model = genai.GenerativeModel(GEMINI_MODEL)
+
+    print(f"Processing {len(notes)} clinical notes ({max_concurrency} at a time)...")
+
+    def eligible_notes():
+        for i, note in enumerate(notes):
+            # Skip very short notes
+            if len(str(note).strip()) < 50:
+                print(f"⚠️ Skipping record {i+1}: Note too short")
+                continue
+            yield i + 1, str(note)
+
+    def summarize(note: str):
+        key = summary_cache_key(note, prompt_template, GEMINI_MODEL)
+        if cache is not None:
+            entry = cache.get(key)
+            if entry is not None:
+                return entry["summary"], note, key, entry
+        summary = summarize_note_with_gemini(note, model=model, limiter=limiter, max_retries=max_retries)
+        return summary, note, key, None
+
+    for done_count, (record_id, (summary, note, key, cached)) in enumerate(
+        run_bounded(eligible_notes(), summarize, max_concurrency), 1
+    ):
+        print(f"\nCompleted record {record_id} ({done_count} done{', cached' if cached else ''})...")
+        results[record_id] = summary
+
+        if cached and cached.get("filepath") and os.path.exists(cached["filepath"]):
+            # Unchanged note whose summary file is still on disk: nothing to write
+            cached_records.append(record_id)
+            saved_files[record_id] = cached["filepath"]
             continue
-        
-        # Generate summary
-        summary = summarize_note_with_gemini(str(note))
-        summaries.append(summary)
-        
+        if cached:
+            cached_records.append(record_id)
+
         # Save to individual file
-        filepath = save_patient_summary(summary, i+1, str(note))
+        filepath = save_patient_summary(summary, record_id, note)
         if filepath:
-            saved_files.append(filepath)
-        
+            saved_files[record_id] = filepath
+
+        # Remember successful summaries (fallback structures are retried next run)
+        if cache is not None and not cached and "error" not in summary:
+            cache.put(key, summary, filepath)
+
         print(f"Summary preview: {summary.get('Patient', 'N/A')} - {summary.get('Diagnosis', 'N/A')}")
-    
+
+    summaries = [results[r] for r in sorted(results)]
+    saved_files = [saved_files[r] for r in sorted(saved_files)]
+
     # Create a master index file
     master_index = {
         "total_records": len(summaries),
         "processed_at": datetime.now().isoformat(),
         "files": saved_files,
+        "cache_hits": len(cached_records),
+        "cache_misses": len(summaries) - len(cached_records),
+        "cached_records": sorted(cached_records),
         "summary_preview": summaries
     }
     
@@ -246,6 +317,7 @@ def batch_summarize_and_save(top_k: int = 3):
     
     print(f"\n🎉 Processing complete!")
     print(f"📁 {len(saved_files)} individual patient files saved")
+    print(f"♻️ {len(cached_records)} summaries served from cache, {len(summaries) - len(cached_records)} sent to Gemini")
     print(f"📋 Master index saved: {master_file}")
     
     return summaries, saved_files
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+from google.api_core import exceptions as api_exceptions
+
+# HTTP status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ResourceExhausted,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+)
+THROTTLE_EXCEPTIONS = (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted)
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """True for 429 / 5xx style errors from the Gemini API."""
+    if isinstance(exc, RETRYABLE_EXCEPTIONS):
+        return True
+    return getattr(exc, "code", None) in RETRYABLE_STATUS_CODES
+
+
+def is_throttle_error(exc: Exception) -> bool:
+    return isinstance(exc, THROTTLE_EXCEPTIONS) or getattr(exc, "code", None) == 429
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting requests per second.
+    The rate adapts: it is halved whenever the API throttles us and grows back
+    additively on every success, never exceeding the configured rate.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, min_rate: float = 0.1):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until `tokens` are available, then take them."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_for = (tokens - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+    def on_throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def call_with_retry(
+    fn: Callable[[], Any],
+    limiter: Optional[TokenBucket] = None,
+    max_retries: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+):
+    """
+    Call `fn`, waiting on `limiter` before each attempt.
+    Retryable errors are retried up to `max_retries` times with exponential backoff
+    and full jitter; anything else (or the last failure) is raised.
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_retryable_error(e) or attempt >= max_retries:
+                raise
+            if limiter is not None and is_throttle_error(e):
+                limiter.on_throttled()
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            print(f"⚠️ Retryable API error ({e}); retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if limiter is not None:
+            limiter.on_success()
+        return result
+
+
+def run_bounded(
+    items: Iterable[Tuple[Any, Any]],
+    worker: Callable[[Any], Any],
+    max_concurrency: int,
+) -> Iterator[Tuple[Any, Any]]:
+    """
+    Run worker(item) for each (key, item) with at most `max_concurrency` calls in flight.
+    Yields (key, result) in completion order; items are pulled lazily from the iterable.
+    """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        pending = {}
+
+        def submit_next() -> bool:
+            entry = next(items, None)
+            if entry is None:
+                return False
+            key, item = entry
+            pending[executor.submit(worker, item)] = key
+            return True
+
+        while len(pending) < max_concurrency and submit_next():
+            pass
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                submit_next()
+                yield key, future.result()
@@ -0,0 +1,65 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "..", "cache")
+SUMMARY_CACHE_FILE = os.path.join(CACHE_DIR, "summary_cache.jsonl")
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def summary_cache_key(note_text: str, prompt_template: str, model: str) -> str:
+    """Cache key covering everything that determines a summary: note text, prompt template and model."""
+    return _sha256("\0".join([model, _sha256(prompt_template), _sha256(note_text)]))
+
+
+class SummaryCache:
+    """
+    Persistent map from summary_cache_key() to the summary Gemini produced for it.
+    Stored as an append-only JSON-lines file; the last entry for a key wins.
+    """
+
+    def __init__(self, path: str = SUMMARY_CACHE_FILE):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line from an interrupted run
+                    continue
+                self._entries[entry["key"]] = entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry ({"summary", "filepath", ...}) or None."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key: str, summary: dict, filepath: Optional[str] = None):
+        entry = {
+            "key": key,
+            "summary": summary,
+            "filepath": filepath,
+            "cached_at": datetime.now().isoformat(),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(entry, ensure_ascii=False) + "\n")